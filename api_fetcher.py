@@ -1,15 +1,21 @@
 import requests
 import os
 import logging
+import json_stream
+from http_client import client
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BASE_URL = os.getenv("COST_API_BASE_URL")
 USE_MOCK_DATA = os.getenv("USE_MOCK_DATA", "False").lower() == "true"
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def fetch_public_projects():
-    """Fetches all public projects from the CoST API."""
+def fetch_public_projects(raise_errors=False):
+    """
+    Fetches all public projects from the CoST API.
+    Errors are logged and give an empty list, unless raise_errors is True.
+    """
     if USE_MOCK_DATA:
         print("Using Mock Data for public projects")
         # Return a simplified mock structure matching the new format
@@ -24,13 +30,63 @@ def fetch_public_projects():
 
     url = f"{BASE_URL}/getPublicProjects"
     try:
-        response = requests.get(url, timeout=30) # Increased timeout for bulk data
-        response.raise_for_status()
-        data = response.json()
+        data = client.get_json(url, timeout=30) # Increased timeout for bulk data
         return data.get('projects', [])
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching public projects: {e}")
+        if raise_errors:
+            raise
         return []
+    except ValueError as e:
+        logging.error(f"Malformed public projects payload: {e}")
+        if raise_errors:
+            raise
+        return []
+
+def stream_public_projects(raise_errors=False):
+    """
+    Yields public projects one at a time while the getPublicProjects response is downloaded.
+    Only one project is decoded in memory at a time, regardless of the size of the portfolio.
+    Errors are logged and end the stream, unless raise_errors is True.
+    """
+    if USE_MOCK_DATA:
+        yield from fetch_public_projects()
+        return
+
+    url = f"{BASE_URL}/getPublicProjects"
+    try:
+        # When streaming the timeout applies to each read, not to the whole download
+        chunks = client.iter_content(url, timeout=30, chunk_size=STREAM_CHUNK_SIZE)
+        yield from json_stream.iter_array_items(chunks, 'projects')
+        # The parser stops at the end of the array; read the rest so the client can cache the body
+        for _ in chunks:
+            pass
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error streaming public projects: {e}")
+        if raise_errors:
+            raise
+    except ValueError as e:
+        logging.error(f"Malformed public projects payload: {e}")
+        if raise_errors:
+            raise
+
+def fetch_projects_concurrently(raise_errors=False):
+    """
+    Yields public projects from the paged listing (and optional per-project detail)
+    endpoints, fetched concurrently by async_fetcher, in the order they arrive.
+    Errors are logged and end the stream, unless raise_errors is True.
+    """
+    if USE_MOCK_DATA:
+        yield from fetch_public_projects()
+        return
+
+    from async_fetcher import AsyncProjectFetcher
+    try:
+        yield from AsyncProjectFetcher().iter_projects()
+    except Exception as e:
+        logging.error(f"Error fetching projects concurrently: {e}")
+        if raise_errors:
+            raise
 
 def fetch_locations():
     """Fetches all locations from the API."""
@@ -42,9 +98,10 @@ def fetch_locations():
     
     try:
         url = f"{BASE_URL}/getLocations"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return client.get_json(url, timeout=10)
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching locations: {e}")
         return []
+    except ValueError as e:
+        logging.error(f"Malformed locations payload: {e}")
+        return []
@@ -1,23 +1,326 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, make_response, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from functools import wraps
 from flasgger import Swagger
 from flask_cors import CORS
 import data_persistence
+import db_manager
+import query_stats
+import response_bodies
+import response_compression
+import hmac
 import logging
 import os
 
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify through response_bodies.dumps (orjson when installed); debug keeps pretty output."""
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(response_bodies.dumps(obj), mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 # Enable CORS for all domains on all routes
 CORS(app, resources={r"/*": {"origins": "*"}})
 swagger = Swagger(app)
 
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    """Returns this thread's reused database connection to a clean state after each request."""
+    db_manager.release_connections()
+
+# gzip/brotli for JSON responses, negotiated from Accept-Encoding
+COMPRESSION = os.getenv("COMPRESSION", "True").lower() == "true"
+
+def response_encoding():
+    """Content coding negotiated for this request (None for identity)."""
+    if 'response_encoding' not in g:
+        g.response_encoding = response_compression.negotiate(request.accept_encodings) if COMPRESSION else None
+    return g.response_encoding
+
+def _compression_cache_key(encoding):
+    # Accept is part of the key because it selects between JSON and NDJSON; the database id
+    # because another database can reach the same generation number
+    return g.data_db_id, request.full_path, request.headers.get('Accept', ''), encoding
+
+def conditional_get(view=None, validate=None, ndjson=False):
+    """
+    Answers GETs of synced data from the data generation: responses carry an ETag
+    (g7.<database id>) and Last-Modified for the current generation, and a matching
+    If-None-Match (or a recent enough If-Modified-Since) gets a 304 without the view
+    running or the database being queried. Compressed bodies already produced for this
+    generation are sent again from the compression cache, also without the view.
+
+    validate(*args, **kwargs), if given, runs before any of that: a ValueError it raises
+    becomes a 400 and a response it returns is sent as is, so malformed requests are never
+    answered 304. It only checks the arguments and must not query the database; checks
+    against the data (e.g. a 404) belong in the view. Views that can answer NDJSON
+    (ndjson=True) tag it with its own ETag (g7.<database id>-ndjson).
+    """
+    if view is None:
+        return lambda view: conditional_get(view, validate, ndjson)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if validate is not None:
+            try:
+                error = validate(*args, **kwargs)
+            except ValueError as e:
+                error = jsonify({'error': str(e)}), 400
+            if error is not None:
+                return error
+
+        state = db_manager.get_data_state()
+        generation, updated_at = state['generation'], state['updated_at']
+        g.data_state = state
+        g.data_generation = generation
+        g.data_db_id = state['db_id']
+        etag = f"g{generation}.{state['db_id']}"
+        if ndjson and _wants_ndjson():
+            etag += '-ndjson'
+        last_modified = updated_at.replace(microsecond=0).astimezone() if updated_at else None
+        encoding = response_encoding()
+
+        # Each coding has its own ETag (g7.<database id>-gzip); any of them validates the generation
+        matched = None
+        if request.if_none_match:
+            variants = [etag] + [f"{etag}-{e}" for e in response_compression.supported_encodings()]
+            matched = next((tag for tag in variants if request.if_none_match.contains(tag)), None)
+            not_modified = matched is not None
+        else:
+            not_modified = (last_modified is not None and request.if_modified_since is not None
+                            and last_modified <= request.if_modified_since)
+        cached = response_compression.compression_cache.get(generation, _compression_cache_key(encoding)) \
+            if encoding and not not_modified else None
+
+        if not_modified:
+            response = make_response('', 304)
+            response.vary.add('Accept-Encoding')
+        elif cached:
+            response = Response(cached[0], mimetype=cached[1])
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = make_response(view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(matched or etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Clients may keep the body but must revalidate before reusing it
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+@app.after_request
+def compress_response(response):
+    """
+    Compresses JSON responses with the negotiated coding: bodies of at least
+    COMPRESS_MIN_BYTES at once (cached per data generation for conditional GETs),
+    streamed bodies chunk by chunk. Responses sent pre-compressed only get their headers.
+    """
+    if response.status_code != 200 or response.mimetype not in response_compression.COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = response.headers.get('Content-Encoding')
+    if encoding is None:
+        encoding = response_encoding()
+        if encoding is None or response.direct_passthrough:
+            return response
+        if response.is_streamed:
+            response.response = response_compression.compress_chunks(response.response, encoding)
+        else:
+            body = response.get_data()
+            if len(body) < response_compression.COMPRESS_MIN_BYTES:
+                return response
+            body = response_compression.compress(body, encoding)
+            response.set_data(body)
+            if 'data_generation' in g:
+                response_compression.compression_cache.put(g.data_generation, _compression_cache_key(encoding),
+                                                           body, response.mimetype)
+        response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not etag.endswith(f"-{encoding}"):
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+# Collection endpoints stream their rows instead of building the whole body in memory
+STREAM_COLLECTIONS = os.getenv("STREAM_COLLECTIONS", "True").lower() == "true"
+# Rows serialized per chunk written to the client
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "200"))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _wants_ndjson():
+    """
+    True when the client asks for NDJSON, with ?format= or else its Accept header.
+    When Accept decides it the response gets Vary: Accept.
+    """
+    if 'format' in request.args:
+        return request.args['format'] == 'ndjson'
+    g.vary_accept = True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+@app.after_request
+def vary_on_accept(response):
+    if g.get('vary_accept'):
+        response.vary.add('Accept')
+    return response
+
+def send_list_body(name):
+    """
+    Sends the pre-encoded full list body of the data generation the request's ETag
+    was built from, or None if there is none.
+    """
+    if _wants_ndjson():
+        return None
+    state = g.get('data_state')
+    path = response_bodies.get_list_body_path(name, state=state)
+    if path is None:
+        return None
+    encoding = response_encoding()
+    if encoding and os.path.getsize(path) >= response_compression.COMPRESS_MIN_BYTES:
+        compressed_path = response_bodies.get_list_body_path(name, encoding, state=state)
+        if compressed_path:
+            path = compressed_path
+        else:
+            encoding = None
+    else:
+        encoding = None
+    response = send_file(path, mimetype='application/json', etag=False, conditional=False)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def stream_rows(rows):
+    """
+    Sends an iterable of rows as a JSON array (or NDJSON when the client asks for it),
+    serializing STREAM_BATCH_ROWS rows per chunk as they come off the cursor, so memory
+    stays flat and the first bytes leave before the query finishes.
+    """
+    ndjson = _wants_ndjson()
+    if not (STREAM_COLLECTIONS or ndjson):
+        return jsonify(list(rows))
+
+    def generate():
+        batch = []
+        first = True
+        if not ndjson:
+            yield b'['
+        for row in rows:
+            batch.append(response_bodies.dumps(row))
+            if len(batch) >= STREAM_BATCH_ROWS:
+                yield chunk(batch, first)
+                batch = []
+                first = False
+        if batch:
+            yield chunk(batch, first)
+        if not ndjson:
+            yield b']'
+
+    def chunk(batch, first):
+        if ndjson:
+            return b'\n'.join(batch) + b'\n'
+        return (b'' if first else b',') + b','.join(batch)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE if ndjson else 'application/json')
+
+# Page sizes for /api/projects when a limit or cursor is given
+PROJECTS_PAGE_SIZE = int(os.getenv("PROJECTS_PAGE_SIZE", "50"))
+PROJECTS_MAX_PAGE_SIZE = int(os.getenv("PROJECTS_MAX_PAGE_SIZE", "500"))
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} deve ser um número inteiro.")
+
+def _list_arg(name):
+    """Reads a comma-separated query parameter as a list (empty if absent)."""
+    return [item.strip() for item in request.args.get(name, '').split(',') if item.strip()]
+
+def _project_list_args():
+    """Reads the /api/projects query: (query arguments, cursor, page size or None for the plain list)."""
+    cursor = request.args.get('cursor')
+    limit = _int_arg('limit')
+    if limit is not None or cursor:
+        limit = min(max(limit or PROJECTS_PAGE_SIZE, 1), PROJECTS_MAX_PAGE_SIZE)
+    query = {
+        'filters': {name: request.args[name] for name in data_persistence.PROJECT_FILTERS if request.args.get(name)},
+        'min_score': _int_arg('min_score'),
+        'max_score': _int_arg('max_score'),
+        'sort': request.args.get('sort', 'project_id'),
+        'order': request.args.get('order', 'asc').lower()
+    }
+    return query, cursor, limit
+
+def _validate_project_list():
+    query, cursor, _ = _project_list_args()
+    data_persistence.validate_project_query(cursor=cursor, **query)
+
 @app.route('/api/projects', methods=['GET'])
+@conditional_get(validate=_validate_project_list, ndjson=True)
 def get_projects():
     """
-    Get all projects
+    Get projects, optionally filtered, sorted and paginated
     ---
+    parameters:
+      - name: status
+        in: query
+        type: string
+        required: false
+      - name: alert_color
+        in: query
+        type: string
+        enum: [RED, YELLOW, GREEN]
+        required: false
+      - name: region
+        in: query
+        type: string
+        required: false
+      - name: min_score
+        in: query
+        type: integer
+        required: false
+      - name: max_score
+        in: query
+        type: integer
+        required: false
+        description: Score bounds (min_score/max_score) exclude projects without a score
+      - name: sort
+        in: query
+        type: string
+        enum: [project_id, score, last_sync]
+        required: false
+      - name: order
+        in: query
+        type: string
+        enum: [asc, desc]
+        required: false
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size; with limit or cursor the response is a page object
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: next_cursor of the previous page
+      - name: format
+        in: query
+        type: string
+        enum: [json, ndjson]
+        required: false
+        description: ndjson streams one project per line (same as Accept application/x-ndjson)
     responses:
       200:
-        description: A list of projects
+        description: A list of projects, or a page {projects, next_cursor} when limit or cursor is given
         schema:
           type: array
           items:
@@ -31,11 +334,134 @@ def get_projects():
                 type: string
               last_sync:
                 type: string
+      400:
+        description: Invalid filter, sort or cursor
+    """
+    try:
+        query, cursor, limit = _project_list_args()
+        # Clients that ask for no page keep getting the plain list, streamed
+        if limit is None:
+            unfiltered = not query['filters'] and query['min_score'] is None and query['max_score'] is None \
+                and (query['sort'], query['order']) == ('project_id', 'asc')
+            return (unfiltered and send_list_body('projects')) or stream_rows(data_persistence.iter_projects(**query))
+        projects, next_cursor = data_persistence.get_projects_page(limit=limit, cursor=cursor, **query)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'projects': projects, 'next_cursor': next_cursor, 'limit': limit})
+
+def _search_limit():
+    return min(max(_int_arg('limit') or data_persistence.SEARCH_PAGE_SIZE, 1), PROJECTS_MAX_PAGE_SIZE)
+
+def _validate_search():
+    _search_limit()
+    data_persistence.parse_search(request.args.get('q', ''), request.args.get('cursor'))
+
+@app.route('/api/projects/search', methods=['GET'])
+@conditional_get(validate=_validate_search)
+def search_projects():
+    """
+    Search projects by title, description, location or procuring entity
+    ---
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Words to search for (all must match; partial words match as prefixes, accents and one-letter words are ignored)
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size (20 by default)
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: next_cursor of the previous page
+    responses:
+      200:
+        description: "{projects, next_cursor, limit}, best matches first"
+      400:
+        description: Empty query or invalid cursor
+    """
+    try:
+        limit = _search_limit()
+        projects, next_cursor = data_persistence.search_projects(
+            request.args.get('q', ''), limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'projects': projects, 'next_cursor': next_cursor, 'limit': limit})
+
+# Most project ids accepted by the batch endpoints
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "100"))
+
+def _batch_args():
+    """Reads the batch query: (unique project ids, view). Raises ValueError for invalid ones."""
+    project_ids = list(dict.fromkeys(_list_arg('ids')))
+    view = request.args.get('view', 'summary')
+    if not project_ids:
+        raise ValueError('ids é obrigatório.')
+    if len(project_ids) > BATCH_MAX_IDS:
+        raise ValueError(f"No máximo {BATCH_MAX_IDS} projetos por pedido.")
+    if view not in ('summary', 'details'):
+        raise ValueError(f"Vista inválida: {view}.")
+    return project_ids, view
+
+def _validate_batch():
+    _batch_args()
+
+@app.route('/api/projects/batch', methods=['GET'])
+@conditional_get(validate=_validate_batch)
+def get_projects_batch():
+    """
+    Get summaries or details of several projects in one request
+    ---
+    parameters:
+      - name: ids
+        in: query
+        type: string
+        required: true
+        description: Comma-separated project ids (at most BATCH_MAX_IDS, 100 by default)
+      - name: view
+        in: query
+        type: string
+        enum: [summary, details]
+        required: false
+        description: summary (default) returns the list fields, details the full project data
+    responses:
+      200:
+        description: "{projects: [...], missing: [ids not found]}, projects in the order asked"
+      400:
+        description: Missing or too many ids, or unknown view
     """
-    projects = data_persistence.get_all_projects()
-    return jsonify(projects)
+    try:
+        project_ids, view = _batch_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if view == 'summary':
+        projects = data_persistence.get_project_summaries(project_ids)
+        found = {project['project_id'] for project in projects}
+        return jsonify({'projects': projects, 'missing': [pid for pid in project_ids if pid not in found]})
+
+    # Pre-encoded bodies are spliced in as they are; only projects without one are decoded
+    bodies = response_bodies.get_project_bodies(project_ids)
+    details = data_persistence.get_projects_details([pid for pid in project_ids if pid not in bodies])
+    parts = []
+    missing = []
+    for project_id in project_ids:
+        if project_id in bodies:
+            parts.append(bodies[project_id])
+        elif project_id in details:
+            parts.append(response_bodies.dumps(details[project_id]))
+        else:
+            missing.append(project_id)
+    body = b'{"projects":[' + b','.join(parts) + b'],"missing":' + response_bodies.dumps(missing) + b'}'
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/projects/<project_id>', methods=['GET'])
+@conditional_get
 def get_project_details(project_id):
     """
     Get project details
@@ -46,18 +472,45 @@ def get_project_details(project_id):
         type: string
         required: true
         description: The ID of the project
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated top-level keys or dotted paths, e.g. title,transparency_score,implementationPeriod.endDate
+      - name: sections
+        in: query
+        type: string
+        required: false
+        description: Comma-separated top-level sections, e.g. implementation,documents
     responses:
       200:
-        description: Project details
+        description: Project details (only the requested parts when fields or sections is given)
       404:
         description: Project not found
     """
-    project = data_persistence.get_raw_project_data(project_id)
-    if project:
+    fields = _list_arg('fields')
+    sections = _list_arg('sections')
+    if fields or sections:
+        project = data_persistence.get_project_projection(project_id, fields=fields, sections=sections,
+                                                          from_snapshot=True)
+    else:
+        # Written by the scoring step, so the payload is not decoded and re-encoded per request
+        bodies = response_bodies.get_project_body(project_id)
+        if bodies is not None:
+            body, body_gzip = bodies
+            if body_gzip and response_encoding() == 'gzip' \
+                    and len(body) >= response_compression.COMPRESS_MIN_BYTES:
+                response = Response(body_gzip, mimetype='application/json')
+                response.headers['Content-Encoding'] = 'gzip'
+                return response
+            return Response(body, mimetype='application/json')
+        project = data_persistence.get_raw_project_data(project_id, from_snapshot=True)
+    if project is not None:
         return jsonify(project)
     return jsonify({'error': 'Project not found'}), 404
 
 @app.route('/api/projects/<project_id>/documents', methods=['GET'])
+@conditional_get(ndjson=True)
 def get_project_documents(project_id):
     """
     Get project documents
@@ -72,10 +525,22 @@ def get_project_documents(project_id):
       200:
         description: List of project documents
     """
-    documents = data_persistence.get_project_documents(project_id)
-    return jsonify(documents)
+    return stream_rows(data_persistence.iter_project_documents(project_id))
+
+@app.route('/api/projects/aggregates', methods=['GET'])
+@conditional_get
+def get_project_aggregates():
+    """
+    Get transparency statistics for dashboards
+    ---
+    responses:
+      200:
+        description: "{total, by_region, by_status, by_alert_color}: counts, average score, alert colors, score distribution and most often missing critical documents"
+    """
+    return jsonify(data_persistence.get_project_aggregates())
 
 @app.route('/api/locations', methods=['GET'])
+@conditional_get(ndjson=True)
 def get_locations():
     """
     Get all locations
@@ -97,8 +562,7 @@ def get_locations():
               country:
                 type: string
     """
-    locations = data_persistence.get_all_locations()
-    return jsonify(locations)
+    return send_list_body('locations') or stream_rows(data_persistence.iter_locations())
 
 @app.route('/api/users/register', methods=['POST'])
 def register_user():
@@ -256,6 +720,70 @@ def delete_subscription():
     else:
         return jsonify({'error': message}), 400
 
+@app.route('/api/subscriptions/batch', methods=['POST'])
+def batch_subscriptions():
+    """
+    Subscribe to and unsubscribe from several projects in one transaction
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          required:
+            - user_id
+          properties:
+            user_id:
+              type: integer
+              description: User ID
+            subscribe:
+              type: array
+              items:
+                type: string
+              description: Project IDs to subscribe to
+            unsubscribe:
+              type: array
+              items:
+                type: string
+              description: Project IDs to unsubscribe from
+            notification_channel:
+              type: string
+              description: Notification channel for the new subscriptions (sms or wpp)
+              enum: [sms, wpp]
+              default: sms
+    responses:
+      200:
+        description: Per-project results (each with success and message); failed items do not undo the others
+      400:
+        description: Validation error
+    """
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'Dados não fornecidos'}), 400
+
+    user_id = data.get('user_id')
+    subscribe = data.get('subscribe') or []
+    unsubscribe = data.get('unsubscribe') or []
+    notification_channel = data.get('notification_channel', 'sms')
+
+    if not user_id:
+        return jsonify({'error': 'user_id é obrigatório'}), 400
+    if not isinstance(subscribe, list) or not isinstance(unsubscribe, list) \
+            or not all(isinstance(pid, str) and pid for pid in subscribe + unsubscribe):
+        return jsonify({'error': 'subscribe e unsubscribe devem ser listas de project_id'}), 400
+    if len(subscribe) + len(unsubscribe) > BATCH_MAX_IDS:
+        return jsonify({'error': f"No máximo {BATCH_MAX_IDS} projetos por pedido."}), 400
+
+    success, message, results = data_persistence.update_subscriptions(
+        user_id, subscribe=subscribe, unsubscribe=unsubscribe, notification_channel=notification_channel)
+
+    if success:
+        return jsonify({'message': message, 'user_id': user_id, 'results': results}), 200
+    else:
+        return jsonify({'error': message}), 400
+
 @app.route('/api/subscriptions/user/<int:user_id>', methods=['GET'])
 def get_user_subscriptions(user_id):
     """
@@ -270,8 +798,7 @@ def get_user_subscriptions(user_id):
       200:
         description: List of subscriptions
     """
-    subscriptions = data_persistence.get_user_subscriptions(user_id)
-    return jsonify(subscriptions)
+    return stream_rows(data_persistence.iter_user_subscriptions(user_id))
 
 @app.route('/api/messages/send-bulk', methods=['POST'])
 def send_bulk_messages():
@@ -322,6 +849,46 @@ def send_bulk_messages():
     
     return jsonify(results), 200
 
+# Bearer token required by /api/debug/query-stats (it exposes SQL and query plans); unset keeps it off
+QUERY_STATS_TOKEN = os.getenv("QUERY_STATS_TOKEN")
+
+@app.route('/api/debug/query-stats', methods=['GET'])
+def get_query_stats():
+    """
+    Get database query statistics for this API process
+    ---
+    parameters:
+      - name: Authorization
+        in: header
+        type: string
+        required: true
+        description: "Bearer <QUERY_STATS_TOKEN>"
+      - name: reset
+        in: query
+        type: boolean
+        required: false
+        description: Clear the statistics after returning them
+    responses:
+      200:
+        description: Per-statement latency histograms, row counts and recent slow queries
+      403:
+        description: Missing or wrong token
+      404:
+        description: Query statistics are disabled (DB_QUERY_STATS or QUERY_STATS_TOKEN unset)
+    """
+    if not query_stats.DB_QUERY_STATS or not QUERY_STATS_TOKEN:
+        return jsonify({'error': 'Estatísticas de consultas desativadas (DB_QUERY_STATS, QUERY_STATS_TOKEN)'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                               f'Bearer {QUERY_STATS_TOKEN}'.encode('utf-8')):
+        return jsonify({'error': 'Token de acesso inválido'}), 403
+
+    dump = query_stats.query_stats.dump()
+    if request.args.get('reset', '').lower() == 'true':
+        query_stats.query_stats.reset()
+    response = jsonify(dump)
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200
+
 @app.route('/webhook/sms', methods=['POST'])
 def webhook_sms():
     """
@@ -395,4 +962,5 @@ def webhook_whatsapp():
     return str(resp), 200, {'Content-Type': 'application/xml'}
 
 if __name__ == '__main__':
+    db_manager.initialize_db()
     app.run(debug=True, host='0.0.0.0', port=5001)
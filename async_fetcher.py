@@ -0,0 +1,229 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit
+import aiohttp
+from aiohttp_retry import RetryClient, ExponentialRetry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_URL = os.getenv("COST_API_BASE_URL")
+# Paged listing: GET {BASE_URL}{LIST_PATH}?{PAGE_PARAM}=n&{PAGE_SIZE_PARAM}=size
+ASYNC_LIST_PATH = os.getenv("COST_API_LIST_PATH", "/getPublicProjects")
+ASYNC_PAGE_PARAM = os.getenv("COST_API_PAGE_PARAM", "page")
+ASYNC_PAGE_SIZE_PARAM = os.getenv("COST_API_PAGE_SIZE_PARAM", "pageSize")
+ASYNC_PAGE_SIZE = int(os.getenv("COST_API_PAGE_SIZE", "100"))
+# Hard stop for paging, whatever the API reports or keeps returning
+ASYNC_MAX_PAGES = int(os.getenv("ASYNC_MAX_PAGES", "1000"))
+# Per-project details: GET {BASE_URL}{DETAIL_PATH} with {id} replaced
+ASYNC_DETAIL_PATH = os.getenv("COST_API_DETAIL_PATH", "/getProject/{id}")
+ASYNC_FETCH_DETAILS = os.getenv("ASYNC_FETCH_DETAILS", "False").lower() == "true"
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "8"))
+ASYNC_RATE_PER_HOST = float(os.getenv("ASYNC_RATE_PER_HOST", "10"))
+ASYNC_RETRY_ATTEMPTS = int(os.getenv("ASYNC_RETRY_ATTEMPTS", "4"))
+ASYNC_REQUEST_TIMEOUT = float(os.getenv("ASYNC_REQUEST_TIMEOUT", "30"))
+# Projects buffered between the event loop and the sync before the fetcher waits
+ASYNC_QUEUE_SIZE = int(os.getenv("ASYNC_QUEUE_SIZE", "500"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_DONE = object()
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+class HostRateLimiter:
+    """Spaces request starts to at most rate_per_host per second for each host."""
+
+    def __init__(self, rate_per_host):
+        self.interval = 1.0 / rate_per_host if rate_per_host > 0 else 0.0
+        self.next_slot = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Reserve the next slot synchronously, so concurrent callers never share one
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class AsyncProjectFetcher:
+    """
+    Fetches paged project listings (and optionally per-project details) concurrently.
+
+    Requests go through aiohttp-retry with exponential backoff, at most max_concurrency
+    are in flight, and request starts are rate limited per host. iter_projects() runs the
+    event loop on a background thread and yields projects to synchronous code as soon as
+    they arrive, through a bounded queue so a slow consumer applies backpressure.
+    """
+
+    def __init__(self, base_url=BASE_URL, page_size=ASYNC_PAGE_SIZE, fetch_details=ASYNC_FETCH_DETAILS,
+                 max_concurrency=ASYNC_MAX_CONCURRENCY, rate_per_host=ASYNC_RATE_PER_HOST,
+                 retry_attempts=ASYNC_RETRY_ATTEMPTS, request_timeout=ASYNC_REQUEST_TIMEOUT,
+                 max_pages=ASYNC_MAX_PAGES):
+        self.base_url = base_url
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.fetch_details = fetch_details
+        self.max_concurrency = max_concurrency
+        self.rate_per_host = rate_per_host
+        self.retry_attempts = retry_attempts
+        self.request_timeout = request_timeout
+
+    def iter_projects(self):
+        """Yields projects as they arrive; re-raises any fetch error in the caller's thread."""
+        items = queue.Queue(maxsize=ASYNC_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def emit(item):
+            # Called from the event loop thread via run_in_executor
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            raise asyncio.CancelledError()
+
+        def runner():
+            try:
+                asyncio.run(self._produce(emit))
+                emit(_DONE)
+            except BaseException as e:
+                if not stop.is_set():
+                    items.put(_Failure(e))
+
+        thread = threading.Thread(target=runner, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
+            thread.join(timeout=5)
+
+    async def _produce(self, emit):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = HostRateLimiter(self.rate_per_host)
+        self.seen_ids = set()
+        loop = asyncio.get_running_loop()
+
+        async def send(project):
+            await loop.run_in_executor(None, emit, project)
+
+        retry_options = ExponentialRetry(
+            attempts=self.retry_attempts,
+            statuses=RETRY_STATUSES,
+            exceptions={aiohttp.ClientError, asyncio.TimeoutError}
+        )
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            client = RetryClient(client_session=session, retry_options=retry_options, raise_for_status=True)
+
+            first = await self._get_page(client, 1)
+            if self._ignores_paging(first):
+                # More projects than asked for: the API sent everything in one response
+                await self._handle_page(client, first, send)
+                return
+
+            total_pages = self._total_pages(first)
+            pages = [self._handle_page(client, first, send)]
+            if total_pages is not None:
+                if total_pages > self.max_pages:
+                    logging.warning(f"API reports {total_pages} pages; fetching only the first {self.max_pages}.")
+                    total_pages = self.max_pages
+                pages += [self._fetch_and_handle(client, n, send) for n in range(2, total_pages + 1)]
+                await asyncio.gather(*pages)
+            else:
+                await asyncio.gather(*pages)
+                if self._is_full(first):
+                    await self._probe_pages(client, send)
+
+    async def _probe_pages(self, client, send):
+        """
+        Fetches pages in windows of max_concurrency until a short or empty page shows up,
+        a page brings no project not seen before (the API is repeating itself) or
+        max_pages is reached.
+        """
+        next_page = 2
+        while next_page <= self.max_pages:
+            window = list(range(next_page, min(next_page + self.max_concurrency, self.max_pages + 1)))
+            payloads = await asyncio.gather(*[self._get_page(client, n) for n in window])
+            new_counts = await asyncio.gather(*[self._handle_page(client, payload, send) for payload in payloads])
+            if not all(self._is_full(payload) for payload in payloads):
+                return
+            if not all(new_counts):
+                logging.warning(f"Pages {window[0]}-{window[-1]} repeat projects already fetched; stopping.")
+                return
+            next_page += len(window)
+        logging.warning(f"Stopped paging at ASYNC_MAX_PAGES ({self.max_pages}).")
+
+    async def _fetch_and_handle(self, client, page, send):
+        await self._handle_page(client, await self._get_page(client, page), send)
+
+    async def _handle_page(self, client, payload, send):
+        """Sends the projects of a page not sent before (by id). Returns how many it sent."""
+        projects = []
+        for project in payload.get('projects', []):
+            project_id = project.get('id') if isinstance(project, dict) else None
+            if project_id is not None:
+                if project_id in self.seen_ids:
+                    continue
+                self.seen_ids.add(project_id)
+            projects.append(project)
+
+        if not self.fetch_details:
+            for project in projects:
+                await send(project)
+            return len(projects)
+
+        tasks = [asyncio.ensure_future(self._get_details(client, project)) for project in projects]
+        for task in asyncio.as_completed(tasks):
+            await send(await task)
+        return len(projects)
+
+    async def _get_page(self, client, page):
+        params = {ASYNC_PAGE_PARAM: page, ASYNC_PAGE_SIZE_PARAM: self.page_size}
+        return await self._get_json(client, f"{self.base_url}{ASYNC_LIST_PATH}", params)
+
+    async def _get_details(self, client, project):
+        """Returns the detailed record of a listed project, falling back to the listing entry."""
+        project_id = project.get('id')
+        if not project_id:
+            return project
+        payload = await self._get_json(client, f"{self.base_url}{ASYNC_DETAIL_PATH.format(id=project_id)}")
+        details = payload.get('project', payload) if isinstance(payload, dict) else None
+        return details if isinstance(details, dict) else project
+
+    async def _get_json(self, client, url, params=None):
+        async with self.semaphore:
+            await self.rate_limiter.wait(urlsplit(url).netloc)
+            async with client.get(url, params=params) as response:
+                return await response.json(content_type=None)
+
+    def _total_pages(self, payload):
+        """Reads the page count from the first page when the API reports it."""
+        if 'totalPages' in payload:
+            return int(payload['totalPages'])
+        if 'total' in payload:
+            return max(1, -(-int(payload['total']) // self.page_size))
+        return None
+
+    def _is_full(self, payload):
+        """A page of exactly page_size projects may have more after it."""
+        return len(payload.get('projects', [])) == self.page_size
+
+    def _ignores_paging(self, payload):
+        return len(payload.get('projects', [])) > self.page_size
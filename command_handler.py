@@ -9,6 +9,7 @@ class CommandHandler:
         self.commands = {
             'REGISTRAR': self.handle_registrar,
             'LISTAR': self.handle_listar,
+            'PROCURAR': self.handle_procurar,
             'SUBSCREVER': self.handle_subscrever,
             'CANCELAR': self.handle_cancelar,
             'AJUDA': self.handle_ajuda,
@@ -88,23 +89,24 @@ class CommandHandler:
             if not user:
                 return "Você precisa se registrar primeiro. Use: REGISTRAR [Nome] [Região]"
             
-            # Get projects
-            projects = data_persistence.get_all_projects()
+            # Get projects (only the 5 shown are read)
+            projects = data_persistence.get_all_projects(limit=5)
             
             if not projects:
                 return "Nenhum projeto disponível no momento."
+            total = data_persistence.count_projects()
             
             # Format response (limit to 5 projects)
             response = "PROJETOS DISPONÍVEIS:\n\n"
-            for i, project in enumerate(projects[:5], 1):
+            for i, project in enumerate(projects, 1):
                 score = project.get('transparency_score', 'N/A')
                 alert = project.get('alert_color', 'N/A')
                 response += f"{i}. {project['project_name']}\n"
                 response += f"   ID: {project['project_id']}\n"
                 response += f"   Score: {score} ({alert})\n\n"
             
-            if len(projects) > 5:
-                response += f"... e mais {len(projects) - 5} projetos.\n\n"
+            if total > 5:
+                response += f"... e mais {total - 5} projetos.\n\n"
             
             response += "Para subscrever: SUBSCREVER [ID]"
             return response
@@ -113,6 +115,42 @@ class CommandHandler:
             logging.error(f"Error in handle_listar: {e}")
             return "Erro ao listar projetos."
     
+    def handle_procurar(self, phone_number, args, channel):
+        """Handle PROCURAR [termo]"""
+        try:
+            # Check if user exists
+            user = data_persistence.get_user_by_phone(phone_number)
+            if not user:
+                return "Você precisa se registrar primeiro. Use: REGISTRAR [Nome] [Região]"
+            
+            term = args.strip()
+            if not data_persistence.build_search_query(term):
+                return "Formato incorreto. Use: PROCURAR [termo]\nExemplo: PROCURAR estrada nampula"
+            
+            # Best 5 matches (one more is read to know if there are others)
+            projects, next_cursor = data_persistence.search_projects(term, limit=5)
+            
+            if not projects:
+                return f"Nenhum projeto encontrado para '{term}'."
+            
+            response = f"RESULTADOS PARA '{term}':\n\n"
+            for i, project in enumerate(projects, 1):
+                score = project.get('transparency_score', 'N/A')
+                alert = project.get('alert_color', 'N/A')
+                response += f"{i}. {project['project_name']}\n"
+                response += f"   ID: {project['project_id']}\n"
+                response += f"   Score: {score} ({alert})\n\n"
+            
+            if next_cursor:
+                response += "Há mais resultados; refine a pesquisa com mais palavras.\n\n"
+            
+            response += "Para subscrever: SUBSCREVER [ID]"
+            return response
+        
+        except Exception as e:
+            logging.error(f"Error in handle_procurar: {e}")
+            return "Erro ao procurar projetos."
+    
     def handle_subscrever(self, phone_number, args, channel):
         """Handle SUBSCREVER [ID_Projeto] [sms|wpp]"""
         try:
@@ -184,6 +222,10 @@ REGISTRAR [Nome] [Região]
 LISTAR
   Ver projetos disponíveis
 
+PROCURAR [termo]
+  Procurar projetos
+  Ex: PROCURAR estrada nampula
+
 SUBSCREVER [ID] [sms|wpp]
   Subscrever a projeto
   Ex: SUBSCREVER abc123 wpp
@@ -28,3 +28,6 @@ CRITICAL_DOCS_MAP = {
         "simple_msg": "Obra terminada sem garantia de qualidade. Exija o relatório final."
     }
 }
+
+# One bit per critical document, in CRITICAL_DOCS_MAP order
+CRITICAL_DOC_BITS = {doc_key: 1 << i for i, doc_key in enumerate(CRITICAL_DOCS_MAP)}
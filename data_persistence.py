@@ -1,7 +1,31 @@
+import re
 import json
+import time
+import base64
+import hashlib
 import sqlite3
-from datetime import datetime
-from db_manager import get_db_connection
+import raw_codec
+from datetime import datetime, timezone
+from constants import CRITICAL_DOCS_MAP, CRITICAL_DOC_BITS
+from db_manager import (get_db_connection, get_read_connection, get_aggregate_keys, apply_aggregate_changes,
+                        AGGREGATE_KEY_SQL)
+
+def encode_project_data(data):
+    """Encodes project data canonically (sorted keys, compact) so equal content yields equal text."""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+def compute_content_hash(data_raw):
+    """Returns the SHA-256 hex digest of an encoded project payload."""
+    return hashlib.sha256(data_raw.encode('utf-8')).hexdigest()
+
+def prepare_project(project_id, data):
+    """
+    Encodes a project once for storage and change detection.
+    The hash is always taken over the canonical JSON, whatever the storage format.
+    Returns a (project_id, data, data_raw, content_hash) tuple, data_raw being the stored value.
+    """
+    data_raw = encode_project_data(data)
+    return project_id, data, raw_codec.encode(data, data_raw), compute_content_hash(data_raw)
 
 def insert_or_update_project(project_id, data):
     """Inserts or updates a project in the database."""
@@ -11,26 +35,31 @@ def insert_or_update_project(project_id, data):
     # Use 'title' as per OC4IDS standard, fallback to 'name' for compatibility
     project_name = data.get('title') or data.get('name', 'Unknown')
     status = data.get('status', 'Unknown')
-    data_raw = json.dumps(data)
+    _, _, data_raw, content_hash = prepare_project(project_id, data)
     last_sync = datetime.now()
 
     # Check if project exists
-    cursor.execute('SELECT project_id FROM projects WHERE project_id = ?', (project_id,))
+    cursor.execute('SELECT project_id, content_hash FROM projects WHERE project_id = ?', (project_id,))
     exists = cursor.fetchone()
     
     if exists:
-        # Update existing project, preserving transparency scores
-        cursor.execute('''
+        # Update existing project, preserving transparency scores.
+        # Changed content is flagged for rescoring.
+        is_processed_sql = 'is_processed' if exists['content_hash'] == content_hash else '0'
+        cursor.execute(f'''
             UPDATE projects 
-            SET project_name = ?, status = ?, data_raw = ?, last_sync = ?
+            SET project_name = ?, status = ?, data_raw = ?, last_sync = ?, content_hash = ?,
+                is_processed = {is_processed_sql}
             WHERE project_id = ?
-        ''', (project_name, status, data_raw, last_sync, project_id))
+        ''', (project_name, status, data_raw, last_sync, content_hash, project_id))
     else:
         # Insert new project
         cursor.execute('''
-            INSERT INTO projects (project_id, project_name, status, data_raw, last_sync)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (project_id, project_name, status, data_raw, last_sync))
+            INSERT INTO projects (project_id, project_name, status, data_raw, last_sync, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (project_id, project_name, status, data_raw, last_sync, content_hash))
+    # The pre-encoded body is stale until the project is rescored
+    cursor.execute('DELETE FROM project_bodies WHERE project_id = ?', (project_id,))
     
     conn.commit()
     conn.close()
@@ -56,9 +85,117 @@ def insert_document_status(project_id, documents):
     conn.commit()
     conn.close()
 
-def get_raw_project_data(project_id):
-    """Retrieves the raw JSON data for a project."""
-    conn = get_db_connection()
+def bulk_upsert_projects(conn, projects):
+    """
+    Inserts or updates many projects on an open connection with a single executemany.
+    projects is a list of tuples as returned by prepare_project.
+    Does not commit; the caller owns the transaction.
+    Returns the number of rows written.
+    """
+    last_sync = datetime.now()
+    rows = []
+    for project_id, data, data_raw, content_hash in projects:
+        project_name = data.get('title') or data.get('name', 'Unknown')
+        status = data.get('status', 'Unknown')
+        rows.append((project_id, project_name, status, data_raw, last_sync, content_hash))
+
+    # Same semantics as insert_or_update_project: scores are preserved on update,
+    # and changed content is flagged for rescoring
+    conn.executemany('''
+        INSERT INTO projects (project_id, project_name, status, data_raw, last_sync, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(project_id) DO UPDATE SET
+            project_name = excluded.project_name,
+            status = excluded.status,
+            data_raw = excluded.data_raw,
+            last_sync = excluded.last_sync,
+            is_processed = CASE WHEN projects.content_hash IS excluded.content_hash
+                                THEN projects.is_processed ELSE 0 END,
+            content_hash = excluded.content_hash
+    ''', rows)
+    # The pre-encoded bodies are stale until the projects are rescored
+    conn.executemany('DELETE FROM project_bodies WHERE project_id = ?', [(row[0],) for row in rows])
+    return len(rows)
+
+def touch_projects(conn, project_ids):
+    """
+    Sets last_sync to now for projects synced without changes, in projects and project_summary,
+    with one executemany each. Does not commit; the caller owns the transaction.
+    Returns the number of projects touched.
+    """
+    last_sync = datetime.now()
+    rows = [(last_sync, project_id) for project_id in project_ids]
+    conn.executemany('UPDATE projects SET last_sync = ? WHERE project_id = ?', rows)
+    conn.executemany('UPDATE project_summary SET last_sync = ? WHERE project_id = ?', rows)
+    return len(rows)
+
+def get_project_hashes(conn, project_ids):
+    """
+    Retrieves the stored content hash for many projects with a single query.
+    Returns a dict of project_id -> content_hash (None for rows synced before hashing existed).
+    """
+    project_ids = list(project_ids)
+    if not project_ids:
+        return {}
+
+    placeholders = ','.join('?' * len(project_ids))
+    cursor = conn.execute(
+        f'SELECT project_id, content_hash FROM projects WHERE project_id IN ({placeholders})',
+        project_ids
+    )
+    return {row['project_id']: row['content_hash'] for row in cursor.fetchall()}
+
+def bulk_replace_documents(conn, documents_by_project):
+    """
+    Replaces the document rows of many projects on an open connection.
+    documents_by_project is a list of (project_id, documents) tuples.
+    Does not commit; the caller owns the transaction.
+    Returns the number of document rows written.
+    """
+    conn.executemany('DELETE FROM project_documents WHERE project_id = ?',
+                     [(project_id,) for project_id, _ in documents_by_project])
+
+    rows = []
+    for project_id, documents in documents_by_project:
+        for doc in documents:
+            rows.append((
+                project_id,
+                doc.get('type'),
+                1 if doc.get('url') else 0,
+                doc.get('weight', 0.0)
+            ))
+
+    conn.executemany('''
+        INSERT INTO project_documents (project_id, doc_type, is_published, critical_weight)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+def get_raw_projects_data(conn, project_ids, sections=None):
+    """
+    Retrieves the raw JSON data for many projects with a single query.
+    If sections is given, only those top-level keys are decoded.
+    Returns a dict of project_id -> data for the projects that exist.
+    """
+    project_ids = list(project_ids)
+    if not project_ids:
+        return {}
+
+    placeholders = ','.join('?' * len(project_ids))
+    cursor = conn.execute(
+        f'SELECT project_id, data_raw FROM projects WHERE project_id IN ({placeholders})',
+        project_ids
+    )
+    if sections is None:
+        return {row['project_id']: raw_codec.decode(row['data_raw']) for row in cursor.fetchall()}
+    return {row['project_id']: raw_codec.decode_sections(row['data_raw'], sections) for row in cursor.fetchall()}
+
+def get_raw_project_data(project_id, from_snapshot=False):
+    """
+    Retrieves the raw JSON data for a project.
+    API callers pass from_snapshot=True to read the published read snapshot (if enabled).
+    """
+    conn = get_read_connection() if from_snapshot else get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('SELECT data_raw, transparency_score, alert_color FROM projects WHERE project_id = ?', (project_id,))
@@ -66,34 +203,697 @@ def get_raw_project_data(project_id):
     conn.close()
     
     if row:
-        data = json.loads(row['data_raw'])
+        data = raw_codec.decode(row['data_raw'])
         data['transparency_score'] = row['transparency_score']
         data['alert_color'] = row['alert_color']
         return data
     return None
 
-def get_all_projects():
-    """Retrieves all projects from the database."""
-    conn = get_db_connection()
+def get_project_sections(project_id, sections, from_snapshot=False):
+    """
+    Retrieves only some top-level sections of a project's raw data.
+    With compressed storage, the other sections are never inflated or decoded.
+    Returns None if the project does not exist.
+    """
+    conn = get_read_connection() if from_snapshot else get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT project_id, project_name, status, last_sync, transparency_score, alert_color FROM projects')
-    rows = cursor.fetchall()
+    cursor.execute('SELECT data_raw FROM projects WHERE project_id = ?', (project_id,))
+    row = cursor.fetchone()
     conn.close()
     
-    return [dict(row) for row in rows]
+    if row:
+        return raw_codec.decode_sections(row['data_raw'], sections)
+    return None
 
-def get_project_documents(project_id):
-    """Retrieves documents for a specific project."""
+# Score columns returned with project details next to the payload's own keys
+PROJECT_DETAIL_COLUMNS = ('transparency_score', 'alert_color')
+
+def get_project_projection(project_id, fields=None, sections=None, from_snapshot=False):
+    """
+    Retrieves part of a project's details: whole top-level sections (e.g. 'implementation')
+    and/or fields, which are top-level keys or dotted paths into them (e.g.
+    'implementationPeriod.endDate'), including the score columns.
+    Only the sections the request touches are decoded (and, with compressed storage,
+    inflated); data_raw is not read at all when only score columns are asked for.
+    Missing keys are left out. Returns None if the project does not exist.
+    """
+    fields = list(fields or [])
+    sections = list(sections or [])
+    columns = [name for name in PROJECT_DETAIL_COLUMNS if name in fields or name in sections]
+    payload_keys = list(dict.fromkeys(
+        [key for key in sections if key not in columns] +
+        [path.split('.')[0] for path in fields if path not in columns]
+    ))
+
+    select = ', '.join(['project_id'] + columns + (['data_raw'] if payload_keys else []))
+    conn = get_read_connection() if from_snapshot else get_db_connection()
+    row = conn.execute(f'SELECT {select} FROM projects WHERE project_id = ?', (project_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+
+    data = raw_codec.decode_sections(row['data_raw'], payload_keys) if payload_keys else {}
+    result = {name: row[name] for name in columns}
+    for key in sections:
+        if key in data:
+            result[key] = data[key]
+    for path in fields:
+        if path in columns:
+            continue
+        keys = path.split('.')
+        value = data
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = result
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+                if not isinstance(target, dict):
+                    break
+            else:
+                target[keys[-1]] = value
+    return result
+
+def get_project_summaries(project_ids):
+    """
+    Retrieves the summaries of many projects with a single query, in the order asked.
+    Unknown ids are left out.
+    """
+    project_ids = list(dict.fromkeys(project_ids))
+    if not project_ids:
+        return []
+
+    placeholders = ','.join('?' * len(project_ids))
+    conn = get_read_connection()
+    rows = conn.execute(
+        f'SELECT {SUMMARY_COLUMNS} FROM project_summary WHERE project_id IN ({placeholders})',
+        project_ids
+    ).fetchall()
+    conn.close()
+
+    by_id = {row['project_id']: dict(row) for row in rows}
+    return [by_id[project_id] for project_id in project_ids if project_id in by_id]
+
+def get_projects_details(project_ids):
+    """
+    Retrieves the details (raw data plus score columns) of many projects with a single query,
+    from the read snapshot if enabled. Returns a dict of project_id -> data for the projects that exist.
+    """
+    project_ids = list(dict.fromkeys(project_ids))
+    if not project_ids:
+        return {}
+
+    placeholders = ','.join('?' * len(project_ids))
+    conn = get_read_connection()
+    rows = conn.execute(
+        f'SELECT project_id, data_raw, transparency_score, alert_color FROM projects WHERE project_id IN ({placeholders})',
+        project_ids
+    ).fetchall()
+    conn.close()
+
+    details = {}
+    for row in rows:
+        data = raw_codec.decode(row['data_raw'])
+        data['transparency_score'] = row['transparency_score']
+        data['alert_color'] = row['alert_color']
+        details[row['project_id']] = data
+    return details
+
+def migrate_raw_storage(target_format, chunk_size=200):
+    """
+    Converts every projects.data_raw value to the target storage format in place,
+    one transaction per chunk. Returns a report with the size change and the average
+    decode latency per project before and after.
+    Raises ValueError unless RAW_STORAGE_FORMAT is already the target format, since every
+    later sync writes the rows it touches in that format.
+    """
+    if target_format != raw_codec.RAW_STORAGE_FORMAT:
+        raise ValueError(f"RAW_STORAGE_FORMAT is '{raw_codec.RAW_STORAGE_FORMAT}': set it to '{target_format}' "
+                         f"for the sync too before migrating, or synced rows will go back to the old format.")
+    conn = get_db_connection()
+    report = {'rows': 0, 'bytes_before': 0, 'bytes_after': 0,
+              'decode_s_before': 0.0, 'decode_s_after': 0.0, 'section_s_after': 0.0}
+    last_id = ''
+    try:
+        while True:
+            rows = conn.execute('''
+                SELECT project_id, data_raw FROM projects
+                WHERE project_id > ? ORDER BY project_id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                old_value = row['data_raw']
+                if old_value is None:
+                    continue
+                start = time.perf_counter()
+                data = raw_codec.decode(old_value)
+                report['decode_s_before'] += time.perf_counter() - start
+
+                new_value = raw_codec.encode(data, fmt=target_format)
+                start = time.perf_counter()
+                raw_codec.decode(new_value)
+                report['decode_s_after'] += time.perf_counter() - start
+                start = time.perf_counter()
+                raw_codec.decode_sections(new_value, ['implementationPeriod'])
+                report['section_s_after'] += time.perf_counter() - start
+
+                report['rows'] += 1
+                report['bytes_before'] += len(old_value.encode('utf-8') if isinstance(old_value, str) else old_value)
+                report['bytes_after'] += len(new_value.encode('utf-8') if isinstance(new_value, str) else new_value)
+                updates.append((new_value, row['project_id']))
+
+            with conn:
+                conn.executemany('UPDATE projects SET data_raw = ? WHERE project_id = ?', updates)
+            last_id = rows[-1]['project_id']
+    finally:
+        conn.close()
+
+    rows = report['rows'] or 1
+    report['saving_pct'] = 100.0 * (1 - report['bytes_after'] / report['bytes_before']) if report['bytes_before'] else 0.0
+    report['decode_ms_before'] = 1000 * report.pop('decode_s_before') / rows
+    report['decode_ms_after'] = 1000 * report.pop('decode_s_after') / rows
+    report['section_ms_after'] = 1000 * report.pop('section_s_after') / rows
+    return report
+
+# Top-level payload keys the project_summary columns are derived from
+SUMMARY_SECTIONS = ['title', 'name', 'status', 'locations', 'implementationPeriod', 'endDate']
+SUMMARY_COLUMNS = ('project_id, project_name, status, last_sync, transparency_score, alert_color, '
+                   'region, deadline, document_count, critical_document_count')
+
+def summarize_project(data):
+    """Returns (project_name, status, region, deadline) of a project payload for project_summary."""
+    project_name = data.get('title') or data.get('name', 'Unknown')
+    status = data.get('status', 'Unknown')
+
+    region = None
+    locations = data.get('locations')
+    if isinstance(locations, list):
+        for location in locations:
+            if isinstance(location, dict) and (location.get('region') or '').strip():
+                region = location['region'].strip()
+                break
+
+    # Same deadline the deadline monitor watches, falling back to the top-level end date
+    impl_period = data.get('implementationPeriod')
+    deadline = impl_period.get('endDate') if isinstance(impl_period, dict) else None
+    return project_name, status, region, _normalize_date(deadline or data.get('endDate'))
+
+def _normalize_date(value):
+    """Returns an ISO date string; the API sends either ISO strings or {'_seconds': ...} timestamps."""
+    if isinstance(value, str):
+        return value or None
+    if isinstance(value, dict) and isinstance(value.get('_seconds'), (int, float)):
+        return datetime.fromtimestamp(value['_seconds'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return None
+
+def count_documents(documents):
+    """Returns (document_count, critical_document_count) for a project's document list."""
+    critical_types = {doc.get('type') for doc in documents} & set(CRITICAL_DOCS_MAP)
+    return len(documents), len(critical_types)
+
+def critical_doc_mask(documents):
+    """Returns the bitmask (CRITICAL_DOC_BITS) of the critical documents in a project's document list."""
+    mask = 0
+    for doc in documents:
+        mask |= CRITICAL_DOC_BITS.get(doc.get('type'), 0)
+    return mask
+
+def bulk_upsert_project_summaries(conn, projects):
+    """
+    Writes the project_summary rows of many synced projects on an open connection.
+    projects is a list of (project_id, data, documents) tuples. Scores are kept on update;
+    the scoring step maintains them. Region, status and document changes are carried
+    into project_aggregates.
+    Does not commit; the caller owns the transaction.
+    """
+    last_sync = datetime.now()
+    rows = [(project_id, *summarize_project(data), last_sync, *count_documents(documents), critical_doc_mask(documents))
+            for project_id, data, documents in projects]
+    before = get_aggregate_keys(conn, [row[0] for row in rows])
+    conn.executemany('''
+        INSERT INTO project_summary (project_id, project_name, status, region, deadline, last_sync,
+                                     document_count, critical_document_count, critical_doc_mask)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(project_id) DO UPDATE SET
+            project_name = excluded.project_name,
+            status = excluded.status,
+            region = excluded.region,
+            deadline = excluded.deadline,
+            last_sync = excluded.last_sync,
+            document_count = excluded.document_count,
+            critical_document_count = excluded.critical_document_count,
+            critical_doc_mask = excluded.critical_doc_mask
+    ''', rows)
+    apply_aggregate_changes(conn, before, get_aggregate_keys(conn, [row[0] for row in rows]))
+    return len(rows)
+
+def upsert_project_summary(project_id, data, documents):
+    """Writes the project_summary row of a single synced project."""
     conn = get_db_connection()
+    bulk_upsert_project_summaries(conn, [(project_id, data, documents)])
+    conn.commit()
+    conn.close()
+
+def rebuild_project_summaries(cursor):
+    """
+    Rebuilds project_summary from the projects and project_documents tables.
+    Only the summary sections of each payload are decoded.
+    """
+    critical_types = list(CRITICAL_DOCS_MAP)
+    placeholders = ','.join('?' * len(critical_types))
+    cursor.execute(f'''
+        SELECT project_id, COUNT(*) AS document_count,
+               COUNT(DISTINCT CASE WHEN doc_type IN ({placeholders}) THEN doc_type END) AS critical_document_count
+        FROM project_documents GROUP BY project_id
+    ''', critical_types)
+    counts = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    cursor.execute('DELETE FROM project_summary')
+    rows = []
+    for row in cursor.execute('''
+        SELECT project_id, data_raw, last_sync, transparency_score, alert_color FROM projects
+    ''').fetchall():
+        data = raw_codec.decode_sections(row[1], SUMMARY_SECTIONS) or {}
+        project_name, status, region, deadline = summarize_project(data)
+        rows.append((row[0], project_name, status, row[2], row[3], row[4], region, deadline,
+                     *counts.get(row[0], (0, 0))))
+    cursor.executemany(f'''
+        INSERT INTO project_summary ({SUMMARY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+def get_all_projects(limit=None):
+    """Retrieves the summary of all projects (or the first limit of them) from project_summary."""
+    conn = get_read_connection()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM project_documents WHERE project_id = ?', (project_id,))
+    cursor.execute(f'SELECT {SUMMARY_COLUMNS} FROM project_summary ORDER BY project_id LIMIT ?',
+                   (-1 if limit is None else limit,))
     rows = cursor.fetchall()
     conn.close()
     
     return [dict(row) for row in rows]
 
+# Sort keys for project lists; unscored projects sort as -1 so the keyset never compares NULLs.
+# The expressions match the project_summary indexes exactly, so SQLite can use them.
+PROJECT_SORTS = {
+    'project_id': None,
+    'score': 'COALESCE(transparency_score, -1)',
+    'last_sync': "COALESCE(last_sync, '')"
+}
+# Values a cursor may carry for each sort key (the COALESCEs above rule out NULL)
+PROJECT_SORT_TYPES = {'score': (int, float), 'last_sync': (str,)}
+PROJECT_FILTERS = ('status', 'alert_color', 'region')
+# Rows fetched from SQLite per step when a collection is streamed
+STREAM_FETCH_SIZE = 500
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or len(values) < 3:
+        raise ValueError("Cursor inválido.")
+    return values
+
+def _project_list_query(filters, min_score, max_score, sort, order, cursor=None):
+    """Builds the project_summary list query; returns (sql without LIMIT, params, sort expression)."""
+    if sort not in PROJECT_SORTS:
+        raise ValueError(f"Ordenação inválida: {sort}.")
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"Ordem inválida: {order}.")
+
+    conditions = []
+    params = []
+    for column, value in (filters or {}).items():
+        if column not in PROJECT_FILTERS:
+            raise ValueError(f"Filtro inválido: {column}.")
+        conditions.append(f'{column} = ?')
+        params.append(value)
+    sort_expr = PROJECT_SORTS[sort]
+    keys = [sort_expr, 'project_id'] if sort_expr else ['project_id']
+    if cursor:
+        cursor_sort, cursor_order, *values = _decode_cursor(cursor)
+        if (cursor_sort, cursor_order) != (sort, order) or len(values) != len(keys):
+            raise ValueError("O cursor não corresponde à ordenação pedida.")
+        if not isinstance(values[-1], str) or any(isinstance(value, bool) or not isinstance(value, PROJECT_SORT_TYPES[sort])
+                                                  for value in values[:-1]):
+            raise ValueError("Cursor inválido.")
+        comparison = '>' if order == 'asc' else '<'
+        if sort_expr:
+            # Spelled out rather than as a row value, which SQLite cannot seek on an expression index
+            conditions.append(f"{sort_expr} {comparison}= ? AND ({sort_expr} {comparison} ? OR project_id {comparison} ?)")
+            params.extend([values[0], values[0], values[1]])
+        else:
+            conditions.append(f"project_id {comparison} ?")
+            params.append(values[0])
+
+    if min_score is not None or max_score is not None:
+        # Unscored projects are -1 in the score expression; a score range never includes them
+        conditions.append(f"{PROJECT_SORTS['score']} >= ?")
+        params.append(max(min_score or 0, 0))
+    if max_score is not None:
+        conditions.append(f"{PROJECT_SORTS['score']} <= ?")
+        params.append(max_score)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order_by = ', '.join(f'{key} {order.upper()}' for key in keys)
+    select_keys = f', {sort_expr} AS sort_key' if sort_expr else ''
+    sql = f'''
+        SELECT {SUMMARY_COLUMNS}{select_keys} FROM project_summary
+        {where}
+        ORDER BY {order_by}
+    '''
+    return sql, params, sort_expr
+
+def get_projects_page(filters=None, min_score=None, max_score=None, sort='project_id', order='asc',
+                      limit=None, cursor=None):
+    """
+    Retrieves project summaries with filters, sorting and keyset (cursor) pagination.
+    filters maps status/alert_color/region to exact values. The cursor is the opaque
+    next_cursor of the previous page: the next page starts right after that row, so
+    every page costs the same as the first.
+    Returns (projects, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for unknown sorts or cursors from a different sort.
+    """
+    sql, params, sort_expr = _project_list_query(filters, min_score, max_score, sort, order, cursor)
+
+    conn = get_read_connection()
+    rows = conn.execute(sql + ' LIMIT ?', params + [-1 if limit is None else limit + 1]).fetchall()
+    conn.close()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = [last['sort_key'], last['project_id']] if sort_expr else [last['project_id']]
+        next_cursor = _encode_cursor([sort, order, *values])
+
+    projects = []
+    for row in rows:
+        project = dict(row)
+        project.pop('sort_key', None)
+        projects.append(project)
+    return projects, next_cursor
+
+def validate_project_query(filters=None, min_score=None, max_score=None, sort='project_id', order='asc',
+                           cursor=None):
+    """Raises ValueError as get_projects_page would for these arguments, without querying."""
+    _project_list_query(filters, min_score, max_score, sort, order, cursor)
+
+def _iter_rows(connect, sql, params=()):
+    """
+    Yields the rows of a query as dicts, fetching STREAM_FETCH_SIZE at a time, so a whole
+    collection is never held in memory. The connection is opened on the first row and
+    released when the iteration ends or the generator is closed.
+    """
+    conn = connect()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
+
+def iter_projects(filters=None, min_score=None, max_score=None, sort='project_id', order='asc'):
+    """
+    Yields every matching project summary, in order, straight from the cursor.
+    Validates the arguments before returning (raises ValueError like get_projects_page).
+    """
+    sql, params, _ = _project_list_query(filters, min_score, max_score, sort, order)
+
+    def rows():
+        for project in _iter_rows(get_read_connection, sql, params):
+            project.pop('sort_key', None)
+            yield project
+    return rows()
+
+def count_projects():
+    """Returns the number of projects."""
+    conn = get_read_connection()
+    count = conn.execute('SELECT COUNT(*) FROM project_summary').fetchone()[0]
+    conn.close()
+    return count
+
+# Breakdowns returned by get_project_aggregates, each a project_aggregates key column
+AGGREGATE_DIMENSIONS = ('region', 'status', 'alert_color')
+ALERT_COLORS = ('RED', 'YELLOW', 'GREEN')
+
+def rebuild_project_aggregates(cursor):
+    """
+    Recomputes the critical document masks of project_summary from project_documents and
+    rebuilds project_aggregates from them. Returns the number of aggregate rows.
+    """
+    masks = get_document_type_masks(cursor, CRITICAL_DOC_BITS)
+    cursor.executemany('UPDATE project_summary SET critical_doc_mask = ? WHERE project_id = ?',
+                       [(mask, project_id) for project_id, mask in masks])
+    cursor.execute('DELETE FROM project_aggregates')
+    cursor.execute(f'''
+        INSERT INTO project_aggregates (region, status, alert_color, transparency_score, critical_doc_mask, project_count)
+        SELECT {AGGREGATE_KEY_SQL}, COUNT(*) FROM project_summary GROUP BY 1, 2, 3, 4, 5
+    ''')
+    return cursor.execute('SELECT COUNT(*) FROM project_aggregates').fetchone()[0]
+
+def _new_aggregate():
+    return {'project_count': 0, 'scored_count': 0, 'score_sum': 0,
+            'alert_colors': dict.fromkeys(ALERT_COLORS, 0), 'scores': {},
+            'missing': dict.fromkeys(CRITICAL_DOCS_MAP, 0)}
+
+def _add_aggregate_row(aggregate, row):
+    count = row['project_count']
+    aggregate['project_count'] += count
+    if row['transparency_score'] >= 0:
+        aggregate['scored_count'] += count
+        aggregate['score_sum'] += row['transparency_score'] * count
+        aggregate['scores'][row['transparency_score']] = aggregate['scores'].get(row['transparency_score'], 0) + count
+    if row['alert_color']:
+        aggregate['alert_colors'][row['alert_color']] = aggregate['alert_colors'].get(row['alert_color'], 0) + count
+    for doc_key, bit in CRITICAL_DOC_BITS.items():
+        if not row['critical_doc_mask'] & bit:
+            aggregate['missing'][doc_key] += count
+
+def _finish_aggregate(aggregate):
+    """Turns running sums into the response shape: averages, score distribution and missing documents."""
+    scored = aggregate['scored_count']
+    # Stable sort: ties keep CRITICAL_DOCS_MAP order
+    missing = sorted(aggregate['missing'].items(), key=lambda item: -item[1])
+    return {
+        'project_count': aggregate['project_count'],
+        'scored_count': scored,
+        'average_score': round(aggregate['score_sum'] / scored, 2) if scored else None,
+        'alert_colors': aggregate['alert_colors'],
+        'score_distribution': {str(score): count for score, count in sorted(aggregate['scores'].items())},
+        'missing_documents': [
+            {'doc_type': doc_key, 'name': CRITICAL_DOCS_MAP[doc_key]['name'], 'missing_count': count}
+            for doc_key, count in missing if count
+        ]
+    }
+
+def get_project_aggregates():
+    """
+    Returns transparency statistics for all projects and broken down by region, status and
+    alert color: project and scored counts, average score, RED/YELLOW/GREEN counts, score
+    distribution and the critical documents most often missing.
+    Reads only project_aggregates, so the cost depends on the number of groups, not of projects.
+    """
+    conn = get_read_connection()
+    rows = conn.execute('SELECT * FROM project_aggregates').fetchall()
+    conn.close()
+
+    total = _new_aggregate()
+    breakdowns = {dimension: {} for dimension in AGGREGATE_DIMENSIONS}
+    for row in rows:
+        _add_aggregate_row(total, row)
+        for dimension in AGGREGATE_DIMENSIONS:
+            # '' in the key stands for projects without a value
+            value = row[dimension] or None
+            _add_aggregate_row(breakdowns[dimension].setdefault(value, _new_aggregate()), row)
+
+    result = {'total': _finish_aggregate(total)}
+    for dimension, groups in breakdowns.items():
+        result[f'by_{dimension}'] = [
+            {dimension: value, **_finish_aggregate(aggregate)}
+            for value, aggregate in sorted(groups.items(), key=lambda item: (item[0] is None, item[0] or ''))
+        ]
+    return result
+
+# Party roles (OC4IDS codes and the Portuguese labels the API uses) indexed as procuring entity
+PROCURING_ENTITY_ROLES = {'procuringentity', 'entidade contratante', 'executor'}
+SEARCH_SECTIONS = ['title', 'name', 'description', 'locations', 'parties', 'publicAuthority']
+SEARCH_PAGE_SIZE = 20
+_SEARCH_TERM = re.compile(r'\w+', re.UNICODE)
+# Shorter words match (as prefixes) almost every project, so they are ignored
+SEARCH_MIN_TERM_LENGTH = 2
+
+def _text_values(items, keys):
+    values = []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict):
+            values.extend(item[key].strip() for key in keys if isinstance(item.get(key), str) and item[key].strip())
+    return values
+
+def search_fields(data):
+    """Returns the (title, description, location, procuring_entity) text indexed for a project payload."""
+    title = data.get('title') or data.get('name') or ''
+    description = data.get('description') if isinstance(data.get('description'), str) else ''
+    location = ' '.join(_text_values(data.get('locations'), ('region', 'locality', 'address', 'description')))
+
+    entities = []
+    for party in data.get('parties') if isinstance(data.get('parties'), list) else []:
+        if not isinstance(party, dict):
+            continue
+        roles = party.get('roles') if isinstance(party.get('roles'), list) else [party.get('role')]
+        if any(isinstance(role, str) and role.strip().lower() in PROCURING_ENTITY_ROLES for role in roles):
+            entities.extend(_text_values([party], ('name',)))
+    entities.extend(_text_values([data.get('publicAuthority')], ('name',)))
+    return title, description, location, ' '.join(dict.fromkeys(entities))
+
+def bulk_upsert_project_search(conn, projects):
+    """
+    Replaces the search index entries of many projects on an open connection.
+    projects is a list of (project_id, data) tuples.
+    Does not commit; the caller owns the transaction.
+    Returns the number of entries written.
+    """
+    conn.executemany('INSERT OR IGNORE INTO project_search_keys (project_id) VALUES (?)',
+                     [(project_id,) for project_id, _ in projects])
+    rows = []
+    for project_id, data in projects:
+        rows.append((project_id, *search_fields(data)))
+    # The FTS table is keyed by the search_id of project_search_keys, which VACUUM keeps stable
+    conn.executemany('''
+        DELETE FROM project_search
+        WHERE rowid = (SELECT search_id FROM project_search_keys WHERE project_id = ?)
+    ''', [(row[0],) for row in rows])
+    conn.executemany('''
+        INSERT INTO project_search (rowid, title, description, location, procuring_entity)
+        VALUES ((SELECT search_id FROM project_search_keys WHERE project_id = ?), ?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+def upsert_project_search(project_id, data):
+    """Updates the search index entry of a single project."""
+    conn = get_db_connection()
+    bulk_upsert_project_search(conn, [(project_id, data)])
+    conn.commit()
+    conn.close()
+
+def rebuild_project_search(cursor):
+    """Indexes every project for search (used by the migration that adds the index)."""
+    cursor.execute('SELECT project_id, data_raw FROM projects')
+    projects = [(row['project_id'], raw_codec.decode_sections(row['data_raw'], SEARCH_SECTIONS))
+                for row in cursor.fetchall()]
+    return bulk_upsert_project_search(cursor, projects)
+
+def build_search_query(text):
+    """
+    Turns free text into an FTS5 query: every word must match, as a prefix (so partial
+    words typed by SMS users still match). Words shorter than SEARCH_MIN_TERM_LENGTH are
+    dropped. Returns None when no word is left.
+    """
+    terms = [term for term in _SEARCH_TERM.findall(text or '') if len(term) >= SEARCH_MIN_TERM_LENGTH]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def parse_search(text, cursor=None):
+    """
+    Returns (FTS5 query, offset) for a search text and optional cursor.
+    Raises ValueError for empty queries or invalid cursors.
+    """
+    query = build_search_query(text)
+    if query is None:
+        raise ValueError("Termo de pesquisa vazio.")
+    offset = 0
+    if cursor:
+        kind, cursor_query, offset = _decode_cursor(cursor)[:3]
+        if kind != 'search' or not isinstance(offset, int) or offset < 0:
+            raise ValueError("Cursor inválido.")
+        if cursor_query != query:
+            raise ValueError("O cursor não corresponde à pesquisa pedida.")
+    return query, offset
+
+def search_projects(text, limit=SEARCH_PAGE_SIZE, cursor=None):
+    """
+    Full-text search over project title, description, location and procuring entity,
+    best matches first (bm25, title weighted highest). FTS5 ranks every match and applies the
+    page's LIMIT/OFFSET itself, so each page holds the next best matches of the whole set.
+    Returns (projects, next_cursor) like get_projects_page; each project is its summary row.
+    Raises ValueError for empty queries or invalid cursors.
+    """
+    query, offset = parse_search(text, cursor)
+    conn = get_read_connection()
+    rows = conn.execute(f'''
+        SELECT {', '.join('s.' + column.strip() for column in SUMMARY_COLUMNS.split(','))}
+        FROM (
+            SELECT rowid, rank FROM project_search
+            WHERE project_search MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        ) AS matches
+        JOIN project_search_keys k ON k.search_id = matches.rowid
+        JOIN project_summary s ON s.project_id = k.project_id
+        ORDER BY matches.rank
+    ''', (query, limit + 1, offset)).fetchall()
+    conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(['search', query, offset + limit])
+    return [dict(row) for row in rows], next_cursor
+
+def get_project_documents(project_id):
+    """Retrieves documents for a specific project."""
+    return list(iter_project_documents(project_id))
+
+def iter_project_documents(project_id):
+    """Yields the documents of a project straight from the cursor."""
+    return _iter_rows(get_read_connection, 'SELECT * FROM project_documents WHERE project_id = ?', (project_id,))
+
+def document_type_masks_query(doc_bits, unprocessed_only=False):
+    """Builds the grouped document type mask query of get_document_type_masks; returns (sql, params)."""
+    case_sql = ' '.join('WHEN ? THEN ?' for _ in doc_bits)
+    type_placeholders = ','.join('?' * len(doc_bits))
+    params = [value for item in doc_bits.items() for value in item] + list(doc_bits)
+
+    # SUM(DISTINCT bit) over distinct single-bit values is a bitwise OR
+    sql = f'''
+        SELECT p.project_id, COALESCE(m.mask, 0) AS mask
+        FROM projects p
+        LEFT JOIN (
+            SELECT project_id, SUM(DISTINCT CASE doc_type {case_sql} ELSE 0 END) AS mask
+            FROM project_documents
+            WHERE doc_type IN ({type_placeholders})
+            GROUP BY project_id
+        ) m ON m.project_id = p.project_id
+        {'WHERE p.is_processed = 0' if unprocessed_only else ''}
+    '''
+    return sql, params
+
+def get_document_type_masks(conn, doc_bits, unprocessed_only=False):
+    """
+    Computes, with one grouped query over project_documents, a bitmask per project of the
+    document types it has. doc_bits maps doc_type -> bit; other types are ignored.
+    Projects without documents get mask 0.
+    Returns a list of (project_id, mask) tuples.
+    """
+    cursor = conn.execute(*document_type_masks_query(doc_bits, unprocessed_only))
+    return [(row['project_id'], row['mask']) for row in cursor.fetchall()]
+
 def insert_or_update_location(location):
     """Inserts or updates a location in the database."""
     conn = get_db_connection()
@@ -109,16 +909,12 @@ def insert_or_update_location(location):
 
 def get_all_locations():
     """Retrieves all locations from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM locations')
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
+    return list(iter_locations())
+
+def iter_locations():
+    """Yields all locations straight from the cursor."""
+    return _iter_rows(get_read_connection, 'SELECT * FROM locations')
 
-import re
 
 def validate_phone_number(phone):
     """
@@ -247,23 +1043,93 @@ def unsubscribe_from_project(user_id, project_id):
     except Exception as e:
         return False, f"Erro ao cancelar subscrição: {str(e)}"
 
+def update_subscriptions(user_id, subscribe=(), unsubscribe=(), notification_channel='sms'):
+    """
+    Subscribes a user to some projects and unsubscribes them from others in one transaction,
+    with one query per step rather than per project.
+    Returns: (success: bool, message: str, results: list of dicts with project_id, action,
+    success, message and, for new subscriptions, subscription_id)
+    """
+    if notification_channel not in ['sms', 'wpp']:
+        return False, "Canal de notificação inválido. Use 'sms' ou 'wpp'.", []
+
+    subscribe = list(dict.fromkeys(subscribe))
+    unsubscribe = list(dict.fromkeys(unsubscribe))
+    project_ids = list(dict.fromkeys(subscribe + unsubscribe))
+    if not project_ids:
+        return True, "Nenhuma alteração pedida.", []
+
+    conn = get_db_connection()
+    try:
+        # Taking the write lock first keeps the checks below valid until the commit
+        conn.execute('BEGIN IMMEDIATE')
+        placeholders = ','.join('?' * len(project_ids))
+        known = {row['project_id'] for row in conn.execute(
+            f'SELECT project_id FROM projects WHERE project_id IN ({placeholders})', project_ids)}
+        subscribed = {row['project_id'] for row in conn.execute(
+            f'SELECT project_id FROM subscriptions WHERE user_id = ? AND project_id IN ({placeholders})',
+            [user_id] + project_ids)}
+
+        results = []
+        to_insert = []
+        for project_id in subscribe:
+            if project_id not in known:
+                results.append((project_id, 'subscribe', False, "Projeto não encontrado."))
+            elif project_id in subscribed:
+                results.append((project_id, 'subscribe', False, "Já está subscrito a este projeto."))
+            else:
+                to_insert.append(project_id)
+                results.append((project_id, 'subscribe', True, "Subscrição realizada com sucesso."))
+        to_delete = []
+        for project_id in unsubscribe:
+            if project_id in subscribed:
+                to_delete.append(project_id)
+                results.append((project_id, 'unsubscribe', True, "Subscrição cancelada com sucesso."))
+            else:
+                results.append((project_id, 'unsubscribe', False, "Subscrição não encontrada."))
+
+        conn.executemany('''
+            INSERT INTO subscriptions (user_id, project_id, notification_channel)
+            VALUES (?, ?, ?)
+        ''', [(user_id, project_id, notification_channel) for project_id in to_insert])
+        conn.executemany('DELETE FROM subscriptions WHERE user_id = ? AND project_id = ?',
+                         [(user_id, project_id) for project_id in to_delete])
+
+        subscription_ids = {}
+        if to_insert:
+            placeholders = ','.join('?' * len(to_insert))
+            subscription_ids = {row['project_id']: row['subscription_id'] for row in conn.execute(
+                f'SELECT project_id, subscription_id FROM subscriptions WHERE user_id = ? AND project_id IN ({placeholders})',
+                [user_id] + to_insert)}
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return False, f"Erro ao atualizar subscrições: {str(e)}", []
+    finally:
+        conn.close()
+
+    items = []
+    for project_id, action, success, message in results:
+        item = {'project_id': project_id, 'action': action, 'success': success, 'message': message}
+        if action == 'subscribe' and success:
+            item['subscription_id'] = subscription_ids.get(project_id)
+        items.append(item)
+    succeeded = sum(1 for item in items if item['success'])
+    return True, f"{succeeded} de {len(items)} alterações realizadas.", items
+
 def get_user_subscriptions(user_id):
     """Retrieves all subscriptions for a user with project details."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+    return list(iter_user_subscriptions(user_id))
+
+def iter_user_subscriptions(user_id):
+    """Yields a user's subscriptions with project details straight from the cursor."""
+    return _iter_rows(get_db_connection, '''
         SELECT s.subscription_id, s.user_id, s.project_id, s.subscribed_at, s.notification_enabled,
                s.notification_channel, p.project_name, p.status, p.transparency_score, p.alert_color
         FROM subscriptions s
         JOIN projects p ON s.project_id = p.project_id
         WHERE s.user_id = ?
     ''', (user_id,))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
 
 def is_subscribed(user_id, project_id):
     """Checks if a user is subscribed to a project."""
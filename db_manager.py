@@ -1,21 +1,382 @@
 import sqlite3
 import os
+import json
+import threading
+from datetime import datetime
+import query_stats
 
 DB_NAME = "adaptt.db"
 
+# Storage backend: 'sqlite' (the DB_NAME file) or 'memory' (an in-process database with
+# the same schema and queries, so benchmarks and tests can run without disk I/O)
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite")
+
+# Connection settings
+DB_REUSE_CONNECTIONS = os.getenv("DB_REUSE_CONNECTIONS", "True").lower() == "true"
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "20000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Read snapshots: the sync publishes a read-only copy of the database when it finishes,
+# and API reads of synced data are served from the latest published copy
+DB_READ_SNAPSHOTS = os.getenv("DB_READ_SNAPSHOTS", "False").lower() == "true"
+DB_SNAPSHOT_DIR = os.getenv("DB_SNAPSHOT_DIR", "snapshots")
+DB_SNAPSHOT_KEEP = int(os.getenv("DB_SNAPSHOT_KEEP", "2"))
+
+_local = threading.local()
+
+class ManagedConnection(sqlite3.Connection):
+    """
+    SQLite connection that a thread keeps open and reuses.
+
+    Callers keep their get_db_connection() ... conn.close() pattern: close() only releases
+    the connection back to its thread, rolling back anything left uncommitted (as a real
+    close would) once the outermost user releases it. close_connections() really closes it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reusable = False
+        self.users = 0
+
+    def close(self):
+        if not self.reusable:
+            super().close()
+            return
+        self.users = max(0, self.users - 1)
+        if self.users == 0 and self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+class InstrumentedConnection(ManagedConnection):
+    """ManagedConnection whose statements are timed and counted by query_stats."""
+
+    def cursor(self, factory=query_stats.InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def _connection_factory():
+    return InstrumentedConnection if query_stats.DB_QUERY_STATS else ManagedConnection
+
+def _open_connection(path, reusable=False, uri=False):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, factory=_connection_factory(), uri=uri)
+    conn.row_factory = sqlite3.Row
+    conn.reusable = reusable
+    conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = {-DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class SQLiteBackend:
+    """
+    Storage in the SQLite database file at DB_NAME. A copy of the data generation is kept in
+    a small file next to it, and read snapshots, list response bodies and the HTTP cache are
+    files too.
+    """
+
+    name = 'sqlite'
+    # Whether snapshots, response body files and the HTTP cache are written to disk
+    keeps_files = True
+
+    def __init__(self, db_name):
+        self.path = db_name
+
+    def connect(self, reusable=False):
+        return _open_connection(self.path, reusable=reusable)
+
+    def _data_generation_path(self):
+        return f"{os.path.splitext(self.path)[0]}.generation.json"
+
+    def _file_identity(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return [stat.st_dev, stat.st_ino]
+
+    def read_data_state(self):
+        """
+        Returns the copy of the data_state row, or None if there is none or it was written
+        for another database file (e.g. one replaced or recreated at the same path).
+        """
+        try:
+            with open(self._data_generation_path()) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.pop('db_file', None) != self._file_identity():
+            return None
+        try:
+            state['updated_at'] = datetime.fromisoformat(state['updated_at']) if state['updated_at'] else None
+        except (KeyError, TypeError, ValueError):
+            return None
+        return state if {'db_id', 'generation'} <= state.keys() else None
+
+    def write_data_state(self, state):
+        path = self._data_generation_path()
+        # API processes rewrite a stale copy too, so each writer needs its own temporary file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({**state, 'updated_at': state['updated_at'].isoformat() if state['updated_at'] else None,
+                       'db_file': self._file_identity()}, f)
+        os.replace(tmp_path, path)
+
+class MemoryBackend(SQLiteBackend):
+    """
+    Storage in a process-local in-memory database (SQLite's memdb VFS), with the same schema
+    and queries as the file backend. Nothing touches the disk and the data is gone when the
+    process exits: the data generation is kept in memory, and no snapshots, response body
+    files or HTTP cache entries are written. Connections from every thread share the
+    database, but an open write transaction locks out readers until it commits.
+    """
+
+    name = 'memory'
+    keeps_files = False
+
+    def __init__(self, db_name):
+        super().__init__(f"file:/{os.path.splitext(os.path.basename(db_name))[0]}?vfs=memdb")
+        # The database only lives while at least one connection to it is open
+        self.keeper = sqlite3.connect(self.path, uri=True, check_same_thread=False)
+        self.data_state = None
+
+    def connect(self, reusable=False):
+        return _open_connection(self.path, reusable=reusable, uri=True)
+
+    def read_data_state(self):
+        return dict(self.data_state) if self.data_state else None
+
+    def write_data_state(self, state):
+        self.data_state = dict(state)
+
+BACKENDS = {backend.name: backend for backend in (SQLiteBackend, MemoryBackend)}
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend():
+    """Returns the storage backend selected by DB_BACKEND for the current DB_NAME."""
+    if DB_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {DB_BACKEND}")
+    key = (DB_BACKEND, DB_NAME)
+    backend = _backends.get(key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.setdefault(key, BACKENDS[DB_BACKEND](DB_NAME))
+    return backend
+
+def _thread_connections():
+    """Returns the current thread's reused connections, keyed by database path."""
+    # Connections must not cross a fork (e.g. gunicorn workers)
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+        _local.snapshot_path = None
+    return _local.connections
+
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_NAME)
+    """
+    Returns a connection to the database of the selected storage backend.
+    With DB_REUSE_CONNECTIONS (the default) each thread reuses one tuned connection per
+    database instead of opening a new one on every call.
+    """
+    backend = get_backend()
+    if not DB_REUSE_CONNECTIONS:
+        return backend.connect()
+
+    connections = _thread_connections()
+    conn = connections.get(backend.path)
+    if conn is None:
+        conn = backend.connect(reusable=True)
+        connections[backend.path] = conn
+    conn.users += 1
+    return conn
+
+def _snapshot_pointer_path():
+    base = os.path.splitext(os.path.basename(DB_NAME))[0]
+    return os.path.join(DB_SNAPSHOT_DIR, f"{base}.current")
+
+def get_current_snapshot():
+    """Returns the latest published snapshot as {'generation', 'path', 'published_at'}, or None."""
+    if not get_backend().keeps_files:
+        return None
+    try:
+        with open(_snapshot_pointer_path()) as f:
+            pointer = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    pointer['path'] = os.path.join(DB_SNAPSHOT_DIR, pointer['file'])
+    return pointer
+
+def _open_snapshot(path):
+    # immutable: the file never changes once published, so SQLite takes no locks on it
+    conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, factory=_connection_factory())
     conn.row_factory = sqlite3.Row
+    conn.reusable = DB_REUSE_CONNECTIONS
+    conn.execute(f'PRAGMA cache_size = {-DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
     return conn
 
-def initialize_db():
-    """Initializes the database with the required tables."""
+def get_read_connection():
+    """
+    Returns a read-only connection for API reads of synced data.
+    With DB_READ_SNAPSHOTS it opens the latest published snapshot, so readers never wait on
+    the sync's write locks or see a half-synced state, and move to a newly published
+    generation on their next call. Falls back to get_db_connection() otherwise, or until
+    a first snapshot is published.
+    """
+    snapshot = get_current_snapshot() if DB_READ_SNAPSHOTS else None
+    if snapshot is None:
+        return get_db_connection()
+
+    path = snapshot['path']
+    if not DB_REUSE_CONNECTIONS:
+        return _open_snapshot(path)
+
+    connections = _thread_connections()
+    conn = connections.get(path)
+    if conn is None:
+        previous = connections.pop(_local.snapshot_path, None)
+        if previous is not None:
+            previous.really_close()
+        conn = _open_snapshot(path)
+        connections[path] = conn
+        _local.snapshot_path = path
+    conn.users += 1
+    return conn
+
+def publish_snapshot():
+    """
+    Publishes a read-only copy of the database as a new snapshot generation.
+    The copy is taken with SQLite's online backup API (a consistent view of committed data),
+    written under a temporary name and renamed into place; the pointer file is then replaced
+    atomically, so readers see either the previous generation or the complete new one.
+    Returns the new generation number (None for backends that keep no files, whose readers
+    already see the live data: only the data generation is bumped).
+    """
+    if not get_backend().keeps_files:
+        bump_data_generation()
+        return None
+    os.makedirs(DB_SNAPSHOT_DIR, exist_ok=True)
+    current = get_current_snapshot()
+    generation = current['generation'] + 1 if current else 1
+    base = os.path.splitext(os.path.basename(DB_NAME))[0]
+    file_name = f"{base}.{generation}.db"
+    path = os.path.join(DB_SNAPSHOT_DIR, file_name)
+
+    source = get_db_connection()
+    target = sqlite3.connect(path + '.tmp')
+    try:
+        source.backup(target)
+        # Readers open the file as immutable, so it must not depend on a -wal file
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+        source.close()
+    os.replace(path + '.tmp', path)
+
+    pointer_path = _snapshot_pointer_path()
+    with open(pointer_path + '.tmp', 'w') as f:
+        json.dump({'generation': generation, 'file': file_name,
+                   'published_at': datetime.now().isoformat()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_path + '.tmp', pointer_path)
+    # Readers only see the new data now, so cached responses go stale now
+    bump_data_generation()
+
+    # Older generations can go; open readers keep their file until they switch
+    for old in range(generation - DB_SNAPSHOT_KEEP, 0, -1):
+        old_path = os.path.join(DB_SNAPSHOT_DIR, f"{base}.{old}.db")
+        if not os.path.exists(old_path):
+            break
+        os.remove(old_path)
+
+    return generation
+
+def _load_data_state(conn):
+    row = conn.execute('SELECT db_id, generation, updated_at FROM data_state WHERE id = 1').fetchone()
+    return {'db_id': row['db_id'], 'generation': row['generation'],
+            'updated_at': datetime.fromisoformat(row['updated_at']) if row['updated_at'] else None}
+
+def get_data_state():
+    """
+    Returns the data generation of the database as {'db_id', 'generation', 'updated_at'}.
+    The data_state table holds it; the storage backend keeps a copy (for SQLite a small file
+    next to the database, checked against the database file) so HTTP caching can read it
+    without querying the database. Generation 0 (and updated_at None) until the first bump.
+    """
+    backend = get_backend()
+    state = backend.read_data_state()
+    if state is None:
+        conn = get_db_connection()
+        try:
+            state = _load_data_state(conn)
+        except sqlite3.OperationalError:
+            # Not initialized yet: nothing synced, and nothing to keep a copy of
+            return {'db_id': '', 'generation': 0, 'updated_at': None}
+        finally:
+            conn.close()
+        backend.write_data_state(state)
+    return state
+
+def get_data_generation():
+    """Returns (generation, updated_at) of the synced data (see get_data_state)."""
+    state = get_data_state()
+    return state['generation'], state['updated_at']
+
+def bump_data_generation():
+    """Marks the synced data as changed (the sync, scoring and snapshot publishing call this)."""
     conn = get_db_connection()
-    cursor = conn.cursor()
+    with conn:
+        conn.execute('UPDATE data_state SET generation = generation + 1, updated_at = ? WHERE id = 1',
+                     (datetime.now().isoformat(),))
+        state = _load_data_state(conn)
+    conn.close()
+    get_backend().write_data_state(state)
+    return state['generation']
 
-    # Create projects table
-    cursor.execute('''
+def release_connections():
+    """
+    Resets the current thread's reused connections at the end of a unit of work
+    (a request, a worker iteration), rolling back anything a caller left uncommitted,
+    e.g. a connection not closed on an error path.
+    """
+    for conn in _thread_connections().values():
+        conn.users = 0
+        if conn.in_transaction:
+            conn.rollback()
+
+def close_connections():
+    """Closes the connections reused by the current thread."""
+    for conn in _thread_connections().values():
+        conn.really_close()
+    _local.connections = {}
+    _local.snapshot_path = None
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """Adds a column to an existing table when databases created by older versions lack it."""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row['name'] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# Schema migrations, applied in order by initialize_db. Each entry is
+# (version, description, list of SQL statements or a function taking a cursor).
+# Never edit a released migration; append a new one instead. Statements stay
+# idempotent because databases created before schema_version existed start at 0.
+MIGRATIONS = [
+    (1, 'Initial schema', [
+        '''
         CREATE TABLE IF NOT EXISTS projects (
             project_id TEXT PRIMARY KEY,
             project_name TEXT,
@@ -27,10 +388,8 @@ def initialize_db():
             alert_color TEXT,
             simple_message TEXT
         )
-    ''')
-
-    # Create project_documents table
-    cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS project_documents (
             doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
             project_id TEXT,
@@ -39,20 +398,16 @@ def initialize_db():
             critical_weight REAL DEFAULT 0.0,
             FOREIGN KEY (project_id) REFERENCES projects (project_id)
         )
-    ''')
-
-    # Create locations table
-    cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS locations (
             id TEXT PRIMARY KEY,
             name TEXT,
             region TEXT,
             country TEXT
         )
-    ''')
-
-    # Create users table
-    cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -61,10 +416,8 @@ def initialize_db():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (region_id) REFERENCES locations (id)
         )
-    ''')
-
-    # Create subscriptions table
-    cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS subscriptions (
             subscription_id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -76,10 +429,8 @@ def initialize_db():
             FOREIGN KEY (project_id) REFERENCES projects (project_id),
             UNIQUE (user_id, project_id)
         )
-    ''')
-
-    # Create project audit table
-    cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS project_audit (
             audit_id INTEGER PRIMARY KEY AUTOINCREMENT,
             project_id TEXT NOT NULL,
@@ -90,12 +441,266 @@ def initialize_db():
             notified INTEGER DEFAULT 0,
             FOREIGN KEY (project_id) REFERENCES projects (project_id)
         )
+        '''
+    ]),
+    (2, 'Content hash for change detection',
+        lambda cursor: _add_column_if_missing(cursor, 'projects', 'content_hash', 'TEXT')),
+    (3, 'Covering index for per-project document lookups and SQL scoring', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_documents_project_type
+        ON project_documents (project_id, doc_type)
+        '''
+    ]),
+    (4, 'Sync run tables (for resuming interrupted syncs)', [
+        '''
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME,
+            status TEXT DEFAULT 'running' CHECK(status IN ('running', 'completed', 'failed', 'abandoned')),
+            resume_count INTEGER DEFAULT 0,
+            projects_done INTEGER DEFAULT 0,
+            last_project_id TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_checkpoints (
+            run_id INTEGER NOT NULL,
+            project_id TEXT NOT NULL,
+            PRIMARY KEY (run_id, project_id),
+            FOREIGN KEY (run_id) REFERENCES sync_runs (run_id)
+        )
+        '''
+    ]),
+    # project_documents WHERE project_id = ? is already served by the prefix of
+    # idx_project_documents_project_type, so it gets no index of its own.
+    (5, 'Indexes for subscriber, pending notification and expired deadline lookups', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_project_enabled
+        ON subscriptions (project_id, notification_enabled)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_audit_notified_detected
+        ON project_audit (notified, detected_at)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_audit_project_event_date
+        ON project_audit (project_id, event_type, new_date)
+        '''
+    ]),
+    (6, 'Project summary table for list reads', lambda cursor: _create_project_summary(cursor)),
+    # Sort expressions must match data_persistence.PROJECT_SORTS for these to be used
+    (7, 'Indexes for filtered, sorted and paginated project lists', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_summary_score
+        ON project_summary (COALESCE(transparency_score, -1), project_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_summary_last_sync
+        ON project_summary (COALESCE(last_sync, ''), project_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_summary_status
+        ON project_summary (status, project_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_summary_alert_color
+        ON project_summary (alert_color, project_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_project_summary_region
+        ON project_summary (region, project_id)
+        '''
+    ]),
+    (8, 'Pre-encoded project detail bodies', lambda cursor: _create_project_bodies(cursor)),
+    (9, 'Full-text project search index', lambda cursor: _create_project_search(cursor)),
+    (10, 'Materialized project aggregates', lambda cursor: _create_project_aggregates(cursor)),
+    # db_id is random per database, so generations of different databases never match
+    (11, 'Data generation stored in the database', [
+        '''
+        CREATE TABLE IF NOT EXISTS data_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            db_id TEXT NOT NULL,
+            generation INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        ''',
+        "INSERT OR IGNORE INTO data_state (id, db_id) VALUES (1, lower(hex(randomblob(8))))"
+    ])
+]
+
+def _create_project_summary(cursor):
+    """Creates the narrow project_summary table and fills it from the existing projects."""
+    import data_persistence
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_summary (
+            project_id TEXT PRIMARY KEY,
+            project_name TEXT,
+            status TEXT,
+            last_sync DATETIME,
+            transparency_score INTEGER,
+            alert_color TEXT,
+            region TEXT,
+            deadline TEXT,
+            document_count INTEGER DEFAULT 0,
+            critical_document_count INTEGER DEFAULT 0
+        )
     ''')
+    data_persistence.rebuild_project_summaries(cursor)
 
-    conn.commit()
+def _create_project_bodies(cursor):
+    """Creates the project_bodies table and fills it from the existing projects."""
+    import response_bodies
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_bodies (
+            project_id TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            body_gzip BLOB,
+            updated_at DATETIME
+        )
+    ''')
+    response_bodies.rebuild_project_bodies(cursor)
+
+def _create_project_search(cursor):
+    """Creates the FTS5 project search index and fills it from the existing projects."""
+    import data_persistence
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_search_keys (
+            search_id INTEGER PRIMARY KEY,
+            project_id TEXT UNIQUE NOT NULL
+        )
+    ''')
+    # Accents are folded so 'reabilitacao' finds 'Reabilitação'; prefix indexes serve partial words
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS project_search USING fts5(
+            title, description, location, procuring_entity,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    # Default ranking: bm25 with title matches weighted highest
+    cursor.execute("INSERT INTO project_search (project_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 3.0, 3.0)')")
+    data_persistence.rebuild_project_search(cursor)
+
+def _create_project_aggregates(cursor):
+    """Adds the critical document mask to project_summary and fills project_aggregates from it."""
+    import data_persistence
+
+    _add_column_if_missing(cursor, 'project_summary', 'critical_doc_mask', 'INTEGER DEFAULT 0')
+    # One row per distinct aggregate key with the number of projects that have it.
+    # Keys are NOT NULL so they can be compared: '' stands for no region/status/color, -1 for unscored.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_aggregates (
+            region TEXT NOT NULL,
+            status TEXT NOT NULL,
+            alert_color TEXT NOT NULL,
+            transparency_score INTEGER NOT NULL,
+            critical_doc_mask INTEGER NOT NULL,
+            project_count INTEGER NOT NULL,
+            PRIMARY KEY (region, status, alert_color, transparency_score, critical_doc_mask)
+        ) WITHOUT ROWID
+    ''')
+    data_persistence.rebuild_project_aggregates(cursor)
+
+def get_schema_version(conn):
+    """Returns the highest migration applied to the database (0 for a new or unversioned one)."""
+    row = conn.execute('SELECT MAX(version) AS version FROM schema_version').fetchone()
+    return row['version'] or 0
+
+def apply_migrations(conn):
+    """
+    Applies pending migrations, each in its own transaction together with its
+    schema_version row, so a failed migration leaves the previous version intact.
+    Returns the list of versions applied.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    current = get_schema_version(conn)
+    applied = []
+
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            if callable(migration):
+                migration(cursor)
+            else:
+                for statement in migration:
+                    cursor.execute(statement)
+            cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                           (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+def initialize_db():
+    """Initializes the database, applying any pending schema migrations."""
+    conn = get_db_connection()
+    applied = apply_migrations(conn)
+    version = get_schema_version(conn)
+    # Replaces any copy of the data generation left by another database at this path
+    get_backend().write_data_state(_load_data_state(conn))
     conn.close()
+    if applied:
+        print(f"Database {DB_NAME} migrated to schema version {version}.")
     print(f"Database {DB_NAME} initialized successfully.")
 
+# project_summary columns that make up a project's project_aggregates key
+AGGREGATE_KEY_SQL = ("COALESCE(region, ''), COALESCE(status, ''), COALESCE(alert_color, ''), "
+                     "COALESCE(transparency_score, -1), COALESCE(critical_doc_mask, 0)")
+AGGREGATE_CHUNK_SIZE = 500
+
+def get_aggregate_keys(conn, project_ids):
+    """Returns a dict of project_id -> current project_aggregates key for those that exist."""
+    project_ids = list(project_ids)
+    keys = {}
+    for i in range(0, len(project_ids), AGGREGATE_CHUNK_SIZE):
+        chunk = project_ids[i:i + AGGREGATE_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(f'''
+            SELECT project_id, {AGGREGATE_KEY_SQL} FROM project_summary WHERE project_id IN ({placeholders})
+        ''', chunk):
+            keys[row[0]] = tuple(row[1:])
+    return keys
+
+def apply_aggregate_changes(conn, before, after):
+    """
+    Moves projects between project_aggregates rows, given their keys before and after a write
+    (dicts from get_aggregate_keys). Only keys whose count changes are touched.
+    Does not commit; the caller owns the transaction.
+    Returns the number of aggregate rows changed.
+    """
+    deltas = {}
+    for key in before.values():
+        deltas[key] = deltas.get(key, 0) - 1
+    for key in after.values():
+        deltas[key] = deltas.get(key, 0) + 1
+    rows = [(*key, delta) for key, delta in deltas.items() if delta]
+    if not rows:
+        return 0
+    conn.executemany('''
+        INSERT INTO project_aggregates (region, status, alert_color, transparency_score, critical_doc_mask, project_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (region, status, alert_color, transparency_score, critical_doc_mask)
+        DO UPDATE SET project_count = project_count + excluded.project_count
+    ''', rows)
+    conn.execute('DELETE FROM project_aggregates WHERE project_count <= 0')
+    return len(rows)
+
 def update_project_score(project_id, score_data):
     """Updates the project with the calculated score and alert message."""
     conn = get_db_connection()
@@ -109,7 +714,12 @@ def update_project_score(project_id, score_data):
             is_processed = 1
         WHERE project_id = ?
     ''', (score_data['transparency_score'], score_data['alert_color'], score_data['simple_message'], project_id))
-    
+    before = get_aggregate_keys(conn, [project_id])
+    cursor.execute('''
+        UPDATE project_summary SET transparency_score = ?, alert_color = ? WHERE project_id = ?
+    ''', (score_data['transparency_score'], score_data['alert_color'], project_id))
+    apply_aggregate_changes(conn, before, get_aggregate_keys(conn, [project_id]))
+
     conn.commit()
     conn.close()
 
@@ -124,5 +734,58 @@ def get_unprocessed_projects():
     
     return [row['project_id'] for row in rows]
 
+def update_project_scores(conn, score_rows):
+    """
+    Updates many project scores on an open connection with a single executemany,
+    moving the projects whose score changed between project_aggregates rows.
+    Does not commit; the caller owns the transaction.
+    """
+    project_ids = [s['project_id'] for s in score_rows]
+    before = get_aggregate_keys(conn, project_ids)
+    conn.executemany('''
+        UPDATE projects
+        SET transparency_score = ?,
+            alert_color = ?,
+            simple_message = ?,
+            is_processed = 1
+        WHERE project_id = ?
+    ''', [(s['transparency_score'], s['alert_color'], s['simple_message'], s['project_id']) for s in score_rows])
+    conn.executemany('''
+        UPDATE project_summary SET transparency_score = ?, alert_color = ? WHERE project_id = ?
+    ''', [(s['transparency_score'], s['alert_color'], s['project_id']) for s in score_rows])
+    apply_aggregate_changes(conn, before, get_aggregate_keys(conn, project_ids))
+    return len(score_rows)
+
+def iter_unprocessed_chunks(conn, chunk_size):
+    """
+    Yields lists of (project_id, data_raw) tuples for unprocessed projects, chunk_size at a time.
+    Uses keyset pagination on project_id, so it is safe to update rows between chunks.
+    """
+    last_id = ''
+    while True:
+        cursor = conn.execute('''
+            SELECT project_id, data_raw FROM projects
+            WHERE is_processed = 0 AND project_id > ?
+            ORDER BY project_id
+            LIMIT ?
+        ''', (last_id, chunk_size))
+        rows = [(row['project_id'], row['data_raw']) for row in cursor.fetchall()]
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def reset_processed_flags():
+    """Marks every project as unprocessed so the next scoring run rescores all of them."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('UPDATE projects SET is_processed = 0')
+    count = cursor.rowcount
+
+    conn.commit()
+    conn.close()
+    return count
+
 if __name__ == "__main__":
     initialize_db()
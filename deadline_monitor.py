@@ -3,9 +3,10 @@ import logging
 from datetime import datetime
 from db_manager import get_db_connection
 
-def detect_deadline_changes(project_id, new_data, old_data):
+def detect_deadline_changes(project_id, new_data, old_data, conn=None):
     """
     Detects deadline changes between old and new project data.
+    If conn is given, the expiration lookup reuses it instead of opening a new connection.
     Returns list of audit events to log.
     """
     events = []
@@ -45,28 +46,47 @@ def detect_deadline_changes(project_id, new_data, old_data):
             logging.error(f"Error parsing dates for project {project_id}: {e}")
     
     # Check if deadline expired
-    if new_impl_end:
+    events.extend(detect_expired_deadline(project_id, new_data, conn=conn))
+    
+    return events
+
+def detect_expired_deadline(project_id, data, conn=None):
+    """
+    Detects a passed implementation deadline that has not been logged yet.
+    If conn is given, the lookup reuses it instead of opening a new connection.
+    Returns list of audit events to log.
+    """
+    events = []
+    impl_end = None
+    
+    if isinstance(data, dict):
+        impl_period = data.get('implementationPeriod', {})
+        if isinstance(impl_period, dict):
+            impl_end = impl_period.get('endDate')
+    
+    if impl_end:
         try:
-            end_date = datetime.fromisoformat(new_impl_end.replace('Z', '+00:00'))
+            end_date = datetime.fromisoformat(impl_end.replace('Z', '+00:00'))
             now = datetime.now(end_date.tzinfo)
             
             if end_date < now:
                 # Check if we already logged this expiration
-                conn = get_db_connection()
-                cursor = conn.cursor()
+                lookup_conn = conn or get_db_connection()
+                cursor = lookup_conn.cursor()
                 cursor.execute('''
                     SELECT audit_id FROM project_audit 
                     WHERE project_id = ? AND event_type = 'deadline_expired' AND new_date = ?
-                ''', (project_id, new_impl_end))
+                ''', (project_id, impl_end))
                 
                 if not cursor.fetchone():
                     events.append({
                         'project_id': project_id,
                         'event_type': 'deadline_expired',
                         'old_date': None,
-                        'new_date': new_impl_end
+                        'new_date': impl_end
                     })
-                conn.close()
+                if conn is None:
+                    lookup_conn.close()
         except Exception as e:
             logging.error(f"Error checking expiration for project {project_id}: {e}")
     
@@ -93,6 +113,23 @@ def log_audit_event(event):
         logging.error(f"Error logging audit event: {e}")
         return None
 
+def log_audit_events(conn, events):
+    """
+    Logs many audit events on an open connection with a single executemany.
+    Does not commit; the caller owns the transaction.
+    Returns the number of events written.
+    """
+    rows = [(event['project_id'], event['event_type'], event.get('old_date'), event['new_date'])
+            for event in events]
+    conn.executemany('''
+        INSERT INTO project_audit (project_id, event_type, old_date, new_date)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+
+    for event in events:
+        logging.info(f"Logged audit event: {event['event_type']} for project {event['project_id']}")
+    return len(rows)
+
 def get_pending_notifications():
     """Retrieves audit events that haven't been notified yet."""
     conn = get_db_connection()
@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", ".http_cache")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "1.0"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+
+class FetcherClient:
+    """
+    Shared HTTP client for the CoST API.
+
+    - One requests.Session, so TCP/TLS connections are pooled and reused between calls.
+    - Transient failures (connection errors, timeouts, 429/5xx) are retried with bounded
+      exponential backoff.
+    - Responses carrying an ETag or Last-Modified header are kept in a small on-disk cache
+      and revalidated with If-None-Match/If-Modified-Since; a 304 is served from the cache.
+      With cache_dir None nothing is cached.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES,
+                 backoff_factor=HTTP_BACKOFF_FACTOR, backoff_max=HTTP_BACKOFF_MAX):
+        self.cache_dir = cache_dir
+        self.last_from_cache = False
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_max=backoff_max,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, url, timeout=30):
+        """Fetches a URL and decodes its JSON body."""
+        return json.loads(b''.join(self.iter_content(url, timeout=timeout)))
+
+    def iter_content(self, url, timeout=30, chunk_size=CHUNK_SIZE):
+        """
+        Yields the body of a URL in chunks, revalidating against the cache when possible.
+        Raises requests.exceptions.RequestException on failure after retries.
+        """
+        meta = self._load_meta(url)
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with self.session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and meta:
+                logging.info(f"{url} not modified, using cached response")
+                self.last_from_cache = True
+                yield from self._iter_cached_body(url, chunk_size)
+                return
+
+            response.raise_for_status()
+            self.last_from_cache = False
+            yield from self._tee_to_cache(url, response, chunk_size)
+
+    def _cache_path(self, url, suffix):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.{suffix}")
+
+    def _load_meta(self, url):
+        """Returns the cached validators for a URL, or None if there is no usable cache entry."""
+        if self.cache_dir is None:
+            return None
+        meta_path = self._cache_path(url, 'meta.json')
+        if not os.path.exists(meta_path) or not os.path.exists(self._cache_path(url, 'body')):
+            return None
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable HTTP cache entry for {url}: {e}")
+            return None
+
+    def _iter_cached_body(self, url, chunk_size):
+        with open(self._cache_path(url, 'body'), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def _tee_to_cache(self, url, response, chunk_size):
+        """Yields the response body while writing it to the cache if it carries validators."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.cache_dir is None or (not etag and not last_modified):
+            yield from response.iter_content(chunk_size=chunk_size)
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        body_path = self._cache_path(url, 'body')
+        tmp_path = f"{body_path}.{os.getpid()}.tmp"
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if not completed:
+                # Partial download (error or consumer stopped early): never cache it
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        os.replace(tmp_path, body_path)
+        meta_path = self._cache_path(url, 'meta.json')
+        with open(f"{meta_path}.tmp", 'w') as f:
+            json.dump({'url': url, 'etag': etag, 'last_modified': last_modified}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+# Global client instance
+client = FetcherClient()
@@ -0,0 +1,179 @@
+import re
+import json
+import codecs
+
+# Characters that matter to the scanner outside of strings
+_STRUCTURAL = re.compile(r'[\"\[\]{}:,]')
+# Characters that end or escape inside a string
+_STRING_SPECIAL = re.compile(r'[\"\\]')
+_WHITESPACE = re.compile(r'\s*')
+# Characters that may follow an array element
+_DELIMITERS = ' \t\r\n,]'
+
+class ArrayItemStreamer:
+    """
+    Incremental parser that extracts the elements of one array stored under a key of
+    the top-level JSON object (e.g. {"projects": [...]}).
+
+    Text is fed in arbitrary chunks. The scanner only walks the document until it finds
+    the key; from there each element is decoded on its own with the C decoder and the
+    buffer is trimmed, so memory is bounded by the largest single element rather than
+    by the whole document.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.string_start = None
+        self.last_string = None
+        self.current_key = None
+        self.in_array = False
+        self.done = False
+
+    def feed(self, text, final=False):
+        """Adds text to the buffer and returns the list of elements completed by it."""
+        if self.done:
+            return []
+
+        self.buf += text
+        if not self.in_array:
+            self._find_array()
+
+        items = []
+        if self.in_array:
+            items = self._read_items(final)
+        self._trim()
+        return items
+
+    def close(self):
+        """Signals the end of input; raises ValueError if the target array was left open."""
+        if self.in_array and not self.done:
+            raise ValueError(f"Truncated JSON: array '{self.key}' was not closed")
+
+    def _find_array(self):
+        """Scans the top-level object until the opening bracket of the target array."""
+        while not self.in_array:
+            if self.in_string:
+                if not self._scan_string():
+                    return
+                continue
+
+            match = _STRUCTURAL.search(self.buf, self.pos)
+            if not match:
+                self.pos = len(self.buf)
+                return
+
+            char = match.group()
+            self.pos = match.end()
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = match.start()
+            elif char == ':':
+                if self.depth == 1:
+                    self.current_key = self.last_string
+            elif char == ',':
+                if self.depth == 1:
+                    self.current_key = None
+            elif char in '[{':
+                if self.depth == 1 and self.current_key == self.key:
+                    if char != '[':
+                        raise ValueError(f"Expected an array under '{self.key}'")
+                    self.in_array = True
+                self.depth += 1
+            else:
+                self.depth -= 1
+
+    def _scan_string(self):
+        """Advances past the end of the current string. Returns False if more input is needed."""
+        while True:
+            match = _STRING_SPECIAL.search(self.buf, self.pos)
+            if not match:
+                self.pos = len(self.buf)
+                return False
+            if match.group() == '\\':
+                if match.end() >= len(self.buf):
+                    # Escape sequence split across chunks
+                    self.pos = match.start()
+                    return False
+                self.pos = match.end() + 1
+                continue
+
+            self.pos = match.end()
+            self.in_string = False
+            if self.depth == 1:
+                self.last_string = json.loads(self.buf[self.string_start:self.pos])
+            return True
+
+    def _read_items(self, final):
+        """Decodes every complete element available after the current position."""
+        items = []
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos >= len(self.buf):
+                return items
+
+            char = self.buf[self.pos]
+            if char == ']':
+                self.done = True
+                return items
+            if char == ',':
+                self.pos += 1
+                continue
+
+            try:
+                item, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                # Element not fully received yet
+                return items
+
+            if end >= len(self.buf) or self.buf[end] not in _DELIMITERS:
+                # A number such as "15" may continue in the next chunk ("15.0")
+                if not final:
+                    return items
+                if end < len(self.buf):
+                    raise ValueError(f"Unexpected character after element at position {end}")
+
+            items.append(item)
+            self.pos = end
+
+    def _trim(self):
+        """Drops the part of the buffer that is no longer needed."""
+        if self.done:
+            self.buf = ''
+            self.pos = 0
+            return
+
+        keep = self.string_start if self.in_string else self.pos
+        if keep:
+            self.buf = self.buf[keep:]
+            self.pos -= keep
+            if self.in_string:
+                self.string_start = 0
+
+def iter_array_items(chunks, key, encoding='utf-8'):
+    """
+    Yields the elements of the array stored under `key` in a top-level JSON object,
+    reading from an iterable of bytes or str chunks (e.g. response.iter_content()).
+    Yields nothing if the key is absent.
+    """
+    streamer = ArrayItemStreamer(key)
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        for item in streamer.feed(chunk):
+            yield item
+        if streamer.done:
+            return
+
+    for item in streamer.feed(decoder.decode(b'', final=True), final=True):
+        yield item
+    streamer.close()
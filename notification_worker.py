@@ -4,6 +4,7 @@ import threading
 from datetime import datetime
 import deadline_monitor
 import data_persistence
+import db_manager
 import messaging
 
 class NotificationWorker:
@@ -39,6 +40,8 @@ class NotificationWorker:
                 self.process_notifications()
             except Exception as e:
                 logging.error(f"Error in notification worker: {e}")
+            finally:
+                db_manager.release_connections()
             
             time.sleep(self.check_interval)
     
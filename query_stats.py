@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Statement timing for the data layer (connections opened while enabled are instrumented)
+DB_QUERY_STATS = os.getenv("DB_QUERY_STATS", "False").lower() == "true"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+# Optional file for the slow-query log (otherwise it goes to the normal log)
+DB_SLOW_QUERY_LOG = os.getenv("DB_SLOW_QUERY_LOG")
+# Where a sync run writes its stats dump
+DB_QUERY_STATS_DUMP = os.getenv("DB_QUERY_STATS_DUMP", "query_stats_sync.json")
+SLOW_QUERIES_KEPT = 100
+# Histogram bucket upper bounds in milliseconds; the last bucket is open ended
+BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000]
+
+slow_query_logger = logging.getLogger('slow_queries')
+if DB_SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(DB_SLOW_QUERY_LOG)
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_query_logger.addHandler(_handler)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_sql(sql):
+    """
+    Reduces a statement to its shape, so calls differing only in literals or in the
+    length of an IN (?, ?, ...) list share one entry.
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _IN_LIST.sub('IN (...)', sql)
+
+class _StatementStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for index, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile_ms(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        target = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target and count:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+    def as_dict(self, sql):
+        labels = [f"<={bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            'sql': sql,
+            'calls': self.calls,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': self.percentile_ms(0.5),
+            'p95_ms': self.percentile_ms(0.95),
+            'max_ms': round(self.max_ms, 3),
+            'histogram': dict(zip(labels, self.buckets))
+        }
+
+class QueryStats:
+    """Per-statement latency histograms and row counts, shared by all threads of a process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+            self.slow_queries = deque(maxlen=SLOW_QUERIES_KEPT)
+            self.since = datetime.now().isoformat()
+
+    def record(self, sql, elapsed_ms):
+        key = normalize_sql(sql)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = _StatementStats()
+            stats.add(elapsed_ms)
+        return key
+
+    def add_rows(self, key, rows):
+        with self.lock:
+            self.statements[key].rows += rows
+
+    def record_slow(self, key, elapsed_ms, plan):
+        entry = {'sql': key, 'elapsed_ms': round(elapsed_ms, 3), 'plan': plan,
+                 'at': datetime.now().isoformat()}
+        with self.lock:
+            self.slow_queries.append(entry)
+        slow_query_logger.warning(f"Slow query ({elapsed_ms:.1f} ms): {key} | plan: {' / '.join(plan)}")
+
+    def dump(self):
+        """Returns the collected stats, slowest statements (by total time) first."""
+        with self.lock:
+            statements = [stats.as_dict(sql) for sql, stats in self.statements.items()]
+            slow_queries = list(self.slow_queries)
+        statements.sort(key=lambda s: s['total_ms'], reverse=True)
+        return {
+            'enabled': DB_QUERY_STATS,
+            'since': self.since,
+            'slow_query_ms': DB_SLOW_QUERY_MS,
+            'statements': statements,
+            'slow_queries': slow_queries
+        }
+
+    def write_dump(self, path=None):
+        path = path or DB_QUERY_STATS_DUMP
+        with open(path, 'w') as f:
+            json.dump(self.dump(), f, indent=2)
+        return path
+
+# Global query stats instance
+query_stats = QueryStats()
+
+def _explain(conn, sql, params):
+    """Captures EXPLAIN QUERY PLAN for a statement, on a plain (uninstrumented) cursor."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')):
+        return []
+    try:
+        cursor = sqlite3.Cursor(conn)
+        return [row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement and counts the rows it returns or changes."""
+
+    stat_key = None
+
+    def _timed(self, method, sql, params, explain_params):
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed_ms = 1000 * (time.perf_counter() - start)
+            self.stat_key = query_stats.record(sql, elapsed_ms)
+            if self.rowcount > 0:
+                query_stats.add_rows(self.stat_key, self.rowcount)
+            if elapsed_ms >= DB_SLOW_QUERY_MS:
+                query_stats.record_slow(self.stat_key, elapsed_ms, _explain(self.connection, sql, explain_params))
+
+    def execute(self, sql, params=()):
+        return self._timed(super().execute, sql, params, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        return self._timed(super().executemany, sql, seq_of_params,
+                           seq_of_params[0] if seq_of_params else ())
+
+    def _count(self, rows):
+        if self.stat_key is not None and rows:
+            query_stats.add_rows(self.stat_key, rows)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._count(1)
+        return row
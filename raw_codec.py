@@ -0,0 +1,143 @@
+import os
+import json
+import zlib
+import struct
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'json' stores data_raw as canonical JSON text, 'zlib' as a compressed sectioned blob
+RAW_STORAGE_FORMAT = os.getenv("RAW_STORAGE_FORMAT", "json")
+MAGIC = b'ADZ1'
+# Top-level values whose JSON is shorter than this share one "core" segment
+SMALL_VALUE_CHARS = 512
+COMPRESSION_LEVEL = 6
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+def encode(data, data_raw=None, fmt=None):
+    """
+    Encodes a project payload for the data_raw column.
+    data_raw is the canonical JSON text when the caller already has it.
+    """
+    fmt = fmt or RAW_STORAGE_FORMAT
+    if fmt not in ('json', 'zlib'):
+        raise ValueError(f"Unknown raw storage format: {fmt}")
+
+    if data_raw is None:
+        data_raw = _dumps(data)
+    if fmt == 'json' or not isinstance(data, dict):
+        return data_raw
+
+    blob = _encode_sectioned(data)
+    # Tiny payloads do not compress below the header overhead; keep them as text
+    return blob if len(blob) < len(data_raw.encode('utf-8')) else data_raw
+
+def _encode_sectioned(data):
+    """
+    Layout: MAGIC | header length (4 bytes, big endian) | header JSON | segments.
+    Each segment is a zlib-compressed JSON object holding one large top-level key, or all
+    small keys together, so a single section can be read without inflating the rest.
+    """
+    core_parts = []
+    large_parts = []
+    for key in sorted(data):
+        part = f"{_dumps(key)}:{_dumps(data[key])}"
+        if len(part) < SMALL_VALUE_CHARS:
+            core_parts.append((key, part))
+        else:
+            large_parts.append((key, part))
+
+    groups = ([core_parts] if core_parts else []) + [[item] for item in large_parts]
+    keys = {}
+    offsets = []
+    body = []
+    position = 0
+    for index, group in enumerate(groups):
+        segment = zlib.compress(('{' + ','.join(part for _, part in group) + '}').encode('utf-8'), COMPRESSION_LEVEL)
+        for key, _ in group:
+            keys[key] = index
+        offsets.append([position, len(segment)])
+        body.append(segment)
+        position += len(segment)
+
+    header = _dumps({'k': keys, 's': offsets}).encode('utf-8')
+    return MAGIC + struct.pack('>I', len(header)) + header + b''.join(body)
+
+def is_sectioned(value):
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:len(MAGIC)]) == MAGIC
+
+def _read_header(value):
+    header_length = struct.unpack('>I', value[len(MAGIC):len(MAGIC) + 4])[0]
+    start = len(MAGIC) + 4
+    header = json.loads(value[start:start + header_length])
+    return header, start + header_length
+
+def _read_segment(value, body_start, offset):
+    position, length = offset
+    start = body_start + position
+    return json.loads(zlib.decompress(value[start:start + length]))
+
+def decode(value):
+    """Decodes a data_raw value in any storage format back to the project dict."""
+    if value is None:
+        return None
+    if not is_sectioned(value):
+        return json.loads(value)
+
+    value = bytes(value)
+    header, body_start = _read_header(value)
+    data = {}
+    for offset in header['s']:
+        data.update(_read_segment(value, body_start, offset))
+    return data
+
+def decode_sections(value, keys):
+    """
+    Decodes only the requested top-level keys of a data_raw value.
+    For sectioned blobs only the segments holding those keys are inflated.
+    Keys missing from the payload are left out of the result.
+    """
+    if value is None:
+        return None
+    if not is_sectioned(value):
+        data = json.loads(value)
+        return {key: data[key] for key in keys if key in data}
+
+    value = bytes(value)
+    header, body_start = _read_header(value)
+    segments = sorted({header['k'][key] for key in keys if key in header['k']})
+    data = {}
+    for index in segments:
+        data.update(_read_segment(value, body_start, header['s'][index]))
+    return {key: data[key] for key in keys if key in data}
+
+def section_names(value):
+    """Lists the top-level keys of a data_raw value (without inflating sectioned blobs)."""
+    if value is None:
+        return []
+    if not is_sectioned(value):
+        return list(json.loads(value))
+    header, _ = _read_header(bytes(value))
+    return list(header['k'])
+
+if __name__ == "__main__":
+    import data_persistence
+
+    parser = argparse.ArgumentParser(description="Convert projects.data_raw between storage formats in place.")
+    parser.add_argument('--migrate', choices=['json', 'zlib'], required=True, help="Target storage format")
+    parser.add_argument('--chunk-size', type=int, default=200, help="Rows converted per transaction")
+    args = parser.parse_args()
+
+    try:
+        report = data_persistence.migrate_raw_storage(args.migrate, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Converted {report['rows']} rows to '{args.migrate}'.")
+    print(f"Size: {report['bytes_before']} -> {report['bytes_after']} bytes "
+          f"({report['saving_pct']:.1f}% saved).")
+    print(f"Full decode: {report['decode_ms_before']:.3f} ms -> {report['decode_ms_after']:.3f} ms per project.")
+    print(f"Single section decode ('implementationPeriod'): {report['section_ms_after']:.3f} ms per project.")
+    print("Run VACUUM to return the freed pages to the filesystem.")
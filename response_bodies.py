@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+import raw_codec
+import db_manager
+import data_persistence
+import response_compression
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+load_dotenv()
+
+# Ready-to-serve response bodies, written by the scoring step instead of per request
+RESPONSE_BODIES = os.getenv("RESPONSE_BODIES", "True").lower() == "true"
+# Also keep a gzipped copy of each body
+RESPONSE_BODIES_GZIP = os.getenv("RESPONSE_BODIES_GZIP", "True").lower() == "true"
+# Full list bodies live in files per data generation
+RESPONSE_BODY_DIR = os.getenv("RESPONSE_BODY_DIR", "bodies")
+RESPONSE_BODY_KEEP = int(os.getenv("RESPONSE_BODY_KEEP", "2"))
+WRITE_CHUNK_ROWS = 500
+
+def dumps(value):
+    """Encodes a value as compact UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+def _project_body_row(row, updated_at):
+    data = raw_codec.decode(row['data_raw'])
+    data['transparency_score'] = row['transparency_score']
+    data['alert_color'] = row['alert_color']
+    body = dumps(data)
+    return row['project_id'], body, response_compression.compress(body, 'gzip') if RESPONSE_BODIES_GZIP else None, updated_at
+
+def _write_project_bodies(cursor, rows):
+    updated_at = datetime.now()
+    body_rows = [_project_body_row(row, updated_at) for row in rows]
+    cursor.executemany('''
+        INSERT INTO project_bodies (project_id, body, body_gzip, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(project_id) DO UPDATE SET
+            body = excluded.body,
+            body_gzip = excluded.body_gzip,
+            updated_at = excluded.updated_at
+    ''', body_rows)
+    return len(body_rows)
+
+def refresh_project_bodies(conn, project_ids):
+    """
+    Rewrites the detail bodies of the given projects from their stored payload and score.
+    Does not commit; the caller owns the transaction.
+    Returns the number of bodies written.
+    """
+    project_ids = list(project_ids)
+    if not RESPONSE_BODIES or not project_ids:
+        return 0
+
+    written = 0
+    for i in range(0, len(project_ids), WRITE_CHUNK_ROWS):
+        chunk = project_ids[i:i + WRITE_CHUNK_ROWS]
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(f'''
+            SELECT project_id, data_raw, transparency_score, alert_color FROM projects
+            WHERE project_id IN ({placeholders})
+        ''', chunk).fetchall()
+        written += _write_project_bodies(conn, rows)
+    return written
+
+def rebuild_project_bodies(cursor):
+    """Writes the bodies of every project (used by the migration that adds the table)."""
+    if not RESPONSE_BODIES:
+        return 0
+    cursor.execute('SELECT project_id, data_raw, transparency_score, alert_color FROM projects')
+    rows = cursor.fetchall()
+    written = 0
+    for i in range(0, len(rows), WRITE_CHUNK_ROWS):
+        written += _write_project_bodies(cursor, rows[i:i + WRITE_CHUNK_ROWS])
+    return written
+
+def get_project_body(project_id):
+    """
+    Returns (body, body_gzip) pre-encoded for a project's details (body_gzip may be None),
+    or None when there is none and the caller has to build the response itself.
+    """
+    if not RESPONSE_BODIES:
+        return None
+    conn = db_manager.get_read_connection()
+    row = conn.execute('SELECT body, body_gzip FROM project_bodies WHERE project_id = ?',
+                       (project_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return row['body'], row['body_gzip']
+
+def get_project_bodies(project_ids):
+    """Returns a dict of project_id -> pre-encoded detail body for those of project_ids that have one."""
+    project_ids = list(dict.fromkeys(project_ids))
+    if not RESPONSE_BODIES or not project_ids:
+        return {}
+    placeholders = ','.join('?' * len(project_ids))
+    conn = db_manager.get_read_connection()
+    rows = conn.execute(f'SELECT project_id, body FROM project_bodies WHERE project_id IN ({placeholders})',
+                        project_ids).fetchall()
+    conn.close()
+    return {row['project_id']: row['body'] for row in rows}
+
+# File suffix of the pre-compressed copies, by content coding
+ENCODING_SUFFIXES = {'gzip': 'gz', 'br': 'br'}
+# Full list responses kept as files: name -> function yielding the rows
+LIST_BODIES = {
+    'projects': data_persistence.iter_projects,
+    'locations': data_persistence.iter_locations
+}
+
+def _list_body_path(name, state):
+    # Keyed to the database id too, so a replaced or recreated database never serves these
+    base = os.path.splitext(os.path.basename(db_manager.DB_NAME))[0]
+    return os.path.join(RESPONSE_BODY_DIR, f"{base}.{state['db_id']}.g{state['generation']}.{name}.json")
+
+def _write_list_body(path, rows):
+    """Writes a JSON array of rows to path, plus a compressed copy per supported coding."""
+    encodings = response_compression.supported_encodings() if RESPONSE_BODIES_GZIP else ()
+    variants = [(f"{path}.{ENCODING_SUFFIXES[e]}", response_compression.Compressor(e)) for e in encodings]
+    files = [open(variant_path + '.tmp', 'wb') for variant_path, _ in variants]
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            def write(data):
+                f.write(data)
+                for out, (_, compressor) in zip(files, variants):
+                    out.write(compressor.compress(data))
+
+            write(b'[')
+            batch = []
+            first = True
+            for row in rows:
+                batch.append(dumps(row))
+                if len(batch) >= WRITE_CHUNK_ROWS:
+                    write((b'' if first else b',') + b','.join(batch))
+                    batch = []
+                    first = False
+            if batch:
+                write((b'' if first else b',') + b','.join(batch))
+            write(b']')
+        for out, (_, compressor) in zip(files, variants):
+            out.write(compressor.finish())
+    finally:
+        for out in files:
+            out.close()
+    for variant_path, _ in variants:
+        os.replace(variant_path + '.tmp', variant_path)
+    os.replace(path + '.tmp', path)
+
+def publish_list_bodies():
+    """
+    Writes the full list bodies for the current data generation (as API readers see it)
+    and prunes the files of older generations and of other databases.
+    Call it after every data generation bump. Returns the generation written (None when
+    disabled or when the storage backend keeps no files).
+    """
+    if not RESPONSE_BODIES or not db_manager.get_backend().keeps_files:
+        return None
+    state = db_manager.get_data_state()
+    generation = state['generation']
+    os.makedirs(RESPONSE_BODY_DIR, exist_ok=True)
+    for name, rows in LIST_BODIES.items():
+        _write_list_body(_list_body_path(name, state), rows())
+
+    base = os.path.splitext(os.path.basename(db_manager.DB_NAME))[0]
+    pattern = re.compile(rf"^{re.escape(base)}\.(\w*)\.g(\d+)\.")
+    for file_name in os.listdir(RESPONSE_BODY_DIR):
+        match = pattern.match(file_name)
+        if match and (match.group(1) != state['db_id'] or int(match.group(2)) <= generation - RESPONSE_BODY_KEEP):
+            try:
+                os.remove(os.path.join(RESPONSE_BODY_DIR, file_name))
+            except OSError as e:
+                logging.warning(f"Could not remove old response body {file_name}: {e}")
+    return generation
+
+def get_list_body_path(name, encoding=None, state=None):
+    """
+    Returns the file holding a full list body for the data state (the current one by
+    default), or its copy compressed with encoding if one is given. Returns None when
+    there is no such file and the caller has to read the database.
+    """
+    if not RESPONSE_BODIES or not db_manager.get_backend().keeps_files:
+        return None
+    path = _list_body_path(name, state or db_manager.get_data_state())
+    if encoding:
+        path += '.' + ENCODING_SUFFIXES[encoding]
+    return path if os.path.exists(path) else None
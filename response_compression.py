@@ -0,0 +1,118 @@
+import os
+import zlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+# Responses smaller than this go out uncompressed (the headers would eat the gain)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+# Memory for compressed bodies kept per data generation (per process)
+COMPRESSION_CACHE_MB = int(os.getenv("COMPRESSION_CACHE_MB", "64"))
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson')
+
+def supported_encodings():
+    """Content codings this process can produce, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate(accept_encodings):
+    """
+    Picks the coding for a request from its Accept-Encoding (a werkzeug MIMEAccept-like object),
+    preferring brotli at equal quality. Returns None for identity.
+    """
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class Compressor:
+    """Incremental gzip or brotli compressor."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            # wbits 31 writes a gzip header (with a zero mtime, so equal bodies compress equally)
+            self.compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        """Compresses a chunk; flush=True emits everything so far so the client can decode it."""
+        if self.encoding == 'br':
+            out = self.compressor.process(data)
+            return out + self.compressor.flush() if flush else out
+        out = self.compressor.compress(data)
+        return out + self.compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+def compress(body, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(body) + compressor.finish()
+
+def compress_chunks(chunks, encoding):
+    """Compresses a streamed body chunk by chunk, flushing each one so the client can start decoding."""
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk, flush=True)
+        if data:
+            yield data
+    yield compressor.finish()
+
+class CompressionCache:
+    """
+    Least recently used compressed bodies of the current data generation, bounded in bytes.
+    Entries of older generations are dropped as soon as a newer one is stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.generation = None
+            self.entries = OrderedDict()
+            self.size = 0
+
+    def get(self, generation, key):
+        with self.lock:
+            if generation != self.generation or key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, generation, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if self.generation is None or generation > self.generation:
+                self.generation = generation
+                self.entries.clear()
+                self.size = 0
+            elif generation < self.generation:
+                return
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[0])
+            self.entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+# Global compression cache instance
+compression_cache = CompressionCache(COMPRESSION_CACHE_MB * 1024 * 1024)
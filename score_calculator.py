@@ -1,68 +1,131 @@
+import raw_codec
 import data_persistence
-from constants import CRITICAL_DOCS_MAP
+from constants import CRITICAL_DOCS_MAP, CRITICAL_DOC_BITS
+
+PHASES = ['identification', 'preparation', 'procurement', 'implementation', 'completion']
+DOCUMENT_SECTIONS = ['documents'] + PHASES
+
+def _build_score_table():
+    """
+    Precomputes the score, alert and missing documents for every combination of published
+    critical documents. Scoring a project is then a single lookup by its bitmask.
+    """
+    table = []
+    for mask in range(1 << len(CRITICAL_DOCS_MAP)):
+        published_weight = 0.0
+        missing_documents = []
+        # Same summation order as the per-document loop, so rounding is identical
+        for doc_key, doc_meta in CRITICAL_DOCS_MAP.items():
+            if mask & CRITICAL_DOC_BITS[doc_key]:
+                published_weight += doc_meta['weight']
+            else:
+                missing_documents.append(doc_meta['name'])
+
+        score_it = round(published_weight * 10)
+        alert_data = generate_simple_alert(score_it, missing_documents)
+        table.append((score_it, alert_data['color'], alert_data['message'], tuple(missing_documents)))
+    return table
 
 def calculate_transparency_score(project_id):
     """
     Calculates the Transparency Score (IT) for a given project.
     Returns a dictionary with the score, alert color, message, and missing documents.
     """
-    # 1. Fetch raw data
     data = data_persistence.get_raw_project_data(project_id)
     if not data:
         return None
 
-    # 2. Check for presence of critical documents
-    published_weight = 0.0
-    missing_documents = []
-    
-    # Extract all available documents from the project data
-    # We look into the aggregated 'documents' list if available, or search in phases
-    # Ideally, we should check where the document *should* be based on oc4ids_type,
-    # but for simplicity and robustness, we'll check if it exists anywhere in the project.
-    
-    available_docs = []
-    
-    # Helper to collect docs from a list
-    def collect_docs(doc_list):
-        if isinstance(doc_list, list):
-            for d in doc_list:
-                if isinstance(d, dict):
-                    # Normalize type to match keys in CRITICAL_DOCS_MAP if possible
-                    # The API might return 'type': 'signedContract' or similar.
-                    available_docs.append(d.get('type'))
-
-    # Collect from top-level
-    collect_docs(data.get('documents'))
-    
-    # Collect from phases
-    phases = ['identification', 'preparation', 'procurement', 'implementation', 'completion']
-    for phase in phases:
-        phase_data = data.get(phase)
-        if isinstance(phase_data, dict):
-            collect_docs(phase_data.get('documents'))
+    return score_projects([(project_id, data)])[0]
+
+def score_project_data(project_id, data):
+    """Calculates the Transparency Score (IT) from already-loaded project data."""
+    return score_projects([(project_id, data)])[0]
+
+def score_raw_rows(rows):
+    """
+    Scores a chunk of (project_id, data_raw) rows, decoding the JSON payloads here.
+    Runs inside process pool workers, so it only takes and returns picklable values.
+    """
+    return score_projects(rows)
+
+def score_projects(projects):
+    """
+    Calculates the Transparency Score (IT) for many projects in one pass.
+
+    Each item can be:
+      - a (project_id, data) tuple, where data is a project dict or its stored data_raw value
+      - a database row or mapping with 'project_id' and 'data_raw'
+      - an OC4IDS project dict carrying its own 'id'
 
-    # 3. Calculate Score
-    for doc_key, doc_meta in CRITICAL_DOCS_MAP.items():
-        # Check if doc_key is in available_docs
-        # We assume the API 'type' matches the keys in CRITICAL_DOCS_MAP
-        if doc_key in available_docs:
-            published_weight += doc_meta['weight']
-        else:
-            missing_documents.append(doc_meta['name'])
+    Returns a list of score dictionaries in input order.
+    """
+    masks = []
+    project_ids = []
+    for item in projects:
+        project_id, data = _unpack(item)
+        project_ids.append(project_id)
+        masks.append(document_mask(data))
 
-    score_it = round(published_weight * 10)
+    return [_score_result(project_id, mask) for project_id, mask in zip(project_ids, masks)]
 
-    # 4. Generate Alert
-    alert_data = generate_simple_alert(score_it, missing_documents)
+def score_from_documents(conn, unprocessed_only=False):
+    """
+    Scores projects from the normalized project_documents table with one grouped query,
+    without decoding any data_raw payload. Gives the same result as score_projects
+    because project_documents holds the same phase and top-level documents.
+    Returns a list of score dictionaries.
+    """
+    masks = data_persistence.get_document_type_masks(conn, CRITICAL_DOC_BITS, unprocessed_only)
+    return [_score_result(project_id, mask) for project_id, mask in masks]
 
+def _score_result(project_id, mask):
+    """Builds the score dictionary of a project from its critical document bitmask."""
+    score_it, color, message, missing_documents = SCORE_TABLE[mask]
     return {
         "project_id": project_id,
         "transparency_score": score_it,
-        "alert_color": alert_data['color'],
-        "simple_message": alert_data['message'],
-        "missing_documents_list": missing_documents
+        "alert_color": color,
+        "simple_message": message,
+        "missing_documents_list": list(missing_documents)
     }
 
+def _unpack(item):
+    """Normalizes one score_projects input item to (project_id, data)."""
+    if isinstance(item, tuple):
+        project_id, data = item
+    elif isinstance(item, dict) and 'data_raw' not in item:
+        project_id, data = item.get('id'), item
+    else:
+        project_id, data = item['project_id'], item['data_raw']
+
+    if isinstance(data, (str, bytes)):
+        # Only the document lists matter for scoring
+        data = raw_codec.decode_sections(data, DOCUMENT_SECTIONS)
+    return project_id, data
+
+def document_mask(data):
+    """
+    Returns the bitmask of critical documents published anywhere in the project
+    (top-level 'documents' or any phase's 'documents').
+    """
+    mask = 0
+
+    # We check if the document exists anywhere in the project rather than in the phase
+    # where it *should* be based on oc4ids_type, for simplicity and robustness.
+    doc_lists = [data.get('documents')]
+    for phase in PHASES:
+        phase_data = data.get(phase)
+        if isinstance(phase_data, dict):
+            doc_lists.append(phase_data.get('documents'))
+
+    for doc_list in doc_lists:
+        if isinstance(doc_list, list):
+            for d in doc_list:
+                if isinstance(d, dict):
+                    # We assume the API 'type' matches the keys in CRITICAL_DOCS_MAP
+                    mask |= CRITICAL_DOC_BITS.get(d.get('type'), 0)
+    return mask
+
 def generate_simple_alert(score, missing_documents):
     """Generates the alert color and message based on the score."""
     if score < 4:
@@ -83,3 +146,5 @@ def generate_simple_alert(score, missing_documents):
         msg = "Transparência adequada. Documentos principais publicados."
 
     return {"color": color, "message": msg}
+
+SCORE_TABLE = _build_score_table()
@@ -0,0 +1,86 @@
+import logging
+from datetime import datetime
+from db_manager import get_db_connection
+
+# Runs left in these states were interrupted and can be resumed
+RESUMABLE_STATUSES = ('running', 'failed')
+
+def start_run(fresh=False):
+    """
+    Starts a sync run, resuming the most recent interrupted one unless fresh is True.
+    Returns (run_id, set of project IDs already committed by that run).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    placeholders = ','.join('?' * len(RESUMABLE_STATUSES))
+    cursor.execute(f'''
+        SELECT run_id, projects_done FROM sync_runs
+        WHERE status IN ({placeholders})
+        ORDER BY run_id DESC LIMIT 1
+    ''', RESUMABLE_STATUSES)
+    interrupted = cursor.fetchone()
+
+    if interrupted and not fresh:
+        run_id = interrupted['run_id']
+        cursor.execute('SELECT project_id FROM sync_checkpoints WHERE run_id = ?', (run_id,))
+        done_ids = {row['project_id'] for row in cursor.fetchall()}
+        cursor.execute('''
+            UPDATE sync_runs SET status = 'running', resume_count = resume_count + 1
+            WHERE run_id = ?
+        ''', (run_id,))
+        logging.info(f"Resuming sync run {run_id}: {len(done_ids)} projects already committed.")
+    else:
+        # A forced clean run abandons any interrupted run
+        cursor.execute(f'''
+            UPDATE sync_runs SET status = 'abandoned', finished_at = ?
+            WHERE status IN ({placeholders})
+        ''', (datetime.now(), *RESUMABLE_STATUSES))
+        cursor.execute('''
+            DELETE FROM sync_checkpoints
+            WHERE run_id IN (SELECT run_id FROM sync_runs WHERE status = 'abandoned')
+        ''')
+        cursor.execute('INSERT INTO sync_runs (started_at) VALUES (?)', (datetime.now(),))
+        run_id = cursor.lastrowid
+        done_ids = set()
+        logging.info(f"Starting sync run {run_id}.")
+
+    conn.commit()
+    conn.close()
+    return run_id, done_ids
+
+def record_projects(conn, run_id, project_ids):
+    """
+    Checkpoints committed projects on an open connection.
+    Does not commit; call it inside the transaction that wrote the projects so the
+    checkpoint and the data are committed together.
+    """
+    project_ids = list(project_ids)
+    if not project_ids:
+        return
+    conn.executemany('INSERT OR IGNORE INTO sync_checkpoints (run_id, project_id) VALUES (?, ?)',
+                     [(run_id, project_id) for project_id in project_ids])
+    conn.execute('''
+        UPDATE sync_runs SET projects_done = projects_done + ?, last_project_id = ?
+        WHERE run_id = ?
+    ''', (len(project_ids), project_ids[-1], run_id))
+
+def record_project(run_id, project_id):
+    """Checkpoints a single committed project."""
+    conn = get_db_connection()
+    record_projects(conn, run_id, [project_id])
+    conn.commit()
+    conn.close()
+
+def finish_run(run_id, status='completed'):
+    """Marks a run as finished; a completed run no longer needs its checkpoints."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('UPDATE sync_runs SET status = ?, finished_at = ? WHERE run_id = ?',
+                   (status, datetime.now(), run_id))
+    if status == 'completed':
+        cursor.execute('DELETE FROM sync_checkpoints WHERE run_id = ?', (run_id,))
+
+    conn.commit()
+    conn.close()
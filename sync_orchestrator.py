@@ -3,34 +3,380 @@ import data_persistence
 import db_manager
 import score_calculator
 import deadline_monitor
+import sync_checkpoint
+import query_stats
+import response_bodies
+import argparse
 import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def process_all_projects():
-    """Processes all unprocessed projects to calculate their transparency score."""
+# Batched sync settings (can be overridden from the command line)
+SYNC_BATCHED = os.getenv("SYNC_BATCHED", "False").lower() == "true"
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "500"))
+SYNC_STREAMING = os.getenv("SYNC_STREAMING", "False").lower() == "true"
+SYNC_ASYNC_FETCH = os.getenv("SYNC_ASYNC_FETCH", "False").lower() == "true"
+
+# Parallel scoring settings
+SCORING_PARALLEL = os.getenv("SCORING_PARALLEL", "False").lower() == "true"
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", str(os.cpu_count() or 1)))
+SCORING_CHUNK_SIZE = int(os.getenv("SCORING_CHUNK_SIZE", "500"))
+# 'raw' scores from the data_raw payloads, 'documents' from the project_documents table
+SCORING_SOURCE = os.getenv("SCORING_SOURCE", "raw")
+
+PHASES = ['identification', 'preparation', 'procurement', 'implementation', 'completion']
+
+def extract_documents(project):
+    """Collects the documents of every phase plus any top-level documents of a project."""
+    documents = []
+
+    for phase in PHASES:
+        phase_data = project.get(phase, {})
+        # Check if phase_data is a dictionary (it should be based on the JSON structure)
+        if isinstance(phase_data, dict):
+            phase_docs = phase_data.get('documents', [])
+            if isinstance(phase_docs, list):
+                documents.extend(phase_docs)
+
+    # Also check for top-level documents just in case
+    top_level_docs = project.get('documents', [])
+    if isinstance(top_level_docs, list):
+        documents.extend(top_level_docs)
+
+    return documents
+
+class PhaseTimer:
+    """Accumulates rows and elapsed time per sync phase to report throughput."""
+
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, phase, rows, elapsed):
+        entry = self.stats.setdefault(phase, {'rows': 0, 'seconds': 0.0})
+        entry['rows'] += rows
+        entry['seconds'] += elapsed
+
+    def report(self):
+        for phase, entry in self.stats.items():
+            rate = entry['rows'] / entry['seconds'] if entry['seconds'] > 0 else 0.0
+            logging.info(f"Phase '{phase}': {entry['rows']} rows in {entry['seconds']:.2f}s ({rate:.0f} rows/sec)")
+
+def process_all_projects(parallel=None, workers=None, chunk_size=None, source=None):
+    """
+    Processes all unprocessed projects to calculate their transparency score.
+    With source='documents' scores come from one grouped query over project_documents.
+    In parallel mode projects are scored in chunks on a process pool.
+    Scoring rewrites the pre-encoded detail bodies of the scored projects. Bumps the data
+    generation afterwards, so cached API responses are revalidated, and writes its list bodies.
+    """
+    parallel = SCORING_PARALLEL if parallel is None else parallel
+    source = source or SCORING_SOURCE
+    if source == 'documents':
+        process_all_projects_from_documents(chunk_size or SCORING_CHUNK_SIZE)
+    elif parallel:
+        process_all_projects_parallel(workers or SCORING_WORKERS, chunk_size or SCORING_CHUNK_SIZE)
+    else:
+        process_all_projects_sequential()
+    publish_data_generation()
+
+def publish_data_generation():
+    """
+    Starts a new data generation for the writes committed so far: cached API responses are
+    revalidated and the list bodies are rewritten, so no list file outlives the data it shows.
+    Does nothing while API readers are on a published read snapshot: they only see these
+    writes once publish_read_snapshot moves them, which starts the generation itself.
+    """
+    if db_manager.DB_READ_SNAPSHOTS and db_manager.get_current_snapshot() is not None:
+        return None
+    generation = db_manager.bump_data_generation()
+    response_bodies.publish_list_bodies()
+    return generation
+
+def publish_read_snapshot():
+    """Publishes a read snapshot and the list bodies of the generation it starts."""
+    generation = db_manager.publish_snapshot()
+    response_bodies.publish_list_bodies()
+    logging.info(f"Published read snapshot generation {generation}.")
+    return generation
+
+def process_all_projects_sequential():
+    """Scores unprocessed projects one by one, storing each score and its bodies in one transaction."""
     logging.info("Starting Score IT calculation for unprocessed projects...")
-    
+
     unprocessed_ids = db_manager.get_unprocessed_projects()
     logging.info(f"Found {len(unprocessed_ids)} projects to process.")
-    
+
     for project_id in unprocessed_ids:
         try:
             score_data = score_calculator.calculate_transparency_score(project_id)
             if score_data:
-                db_manager.update_project_score(project_id, score_data)
+                conn = db_manager.get_db_connection()
+                with conn:
+                    db_manager.update_project_scores(conn, [{**score_data, 'project_id': project_id}])
+                    response_bodies.refresh_project_bodies(conn, [project_id])
+                conn.close()
                 logging.info(f"Calculated Score IT for {project_id}: {score_data['transparency_score']} ({score_data['alert_color']})")
             else:
                 logging.warning(f"Could not calculate score for {project_id}")
         except Exception as e:
             logging.error(f"Error processing project {project_id}: {e}")
-            
+
     logging.info("Score IT calculation completed.")
 
-def run_full_sync():
-    """Orchestrates the full synchronization process."""
-    logging.info("Starting full synchronization...")
+def process_all_projects_parallel(workers=SCORING_WORKERS, chunk_size=SCORING_CHUNK_SIZE):
+    """
+    Scores unprocessed projects on a process pool.
+    The main process reads chunks of raw payloads and is the only writer: each chunk of
+    results is stored with one executemany in its own transaction. At most two chunks
+    per worker are in flight, so memory stays bounded.
+    """
+    logging.info(f"Starting parallel Score IT calculation ({workers} workers, chunk size {chunk_size})...")
+    start = time.perf_counter()
+    scored = 0
+
+    conn = db_manager.get_db_connection()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for rows in db_manager.iter_unprocessed_chunks(conn, chunk_size):
+                pending.append((rows, executor.submit(score_calculator.score_raw_rows, rows)))
+                if len(pending) >= workers * 2:
+                    scored += _store_scored_chunk(conn, *pending.popleft())
+            while pending:
+                scored += _store_scored_chunk(conn, *pending.popleft())
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    rate = scored / elapsed if elapsed > 0 else 0.0
+    logging.info(f"Score IT calculation completed: {scored} projects in {elapsed:.2f}s ({rate:.0f} projects/sec).")
+
+def process_all_projects_from_documents(chunk_size=SCORING_CHUNK_SIZE):
+    """
+    Scores unprocessed projects from the normalized project_documents table.
+    No data_raw payload is decoded; results are written in chunked transactions.
+    """
+    logging.info("Starting Score IT calculation from project documents...")
+    start = time.perf_counter()
+
+    conn = db_manager.get_db_connection()
+    try:
+        score_rows = score_calculator.score_from_documents(conn, unprocessed_only=True)
+        for i in range(0, len(score_rows), chunk_size):
+            with conn:
+                db_manager.update_project_scores(conn, score_rows[i:i + chunk_size])
+                response_bodies.refresh_project_bodies(conn, [row['project_id'] for row in score_rows[i:i + chunk_size]])
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    rate = len(score_rows) / elapsed if elapsed > 0 else 0.0
+    logging.info(f"Score IT calculation completed: {len(score_rows)} projects in {elapsed:.2f}s ({rate:.0f} projects/sec).")
+
+def _store_scored_chunk(conn, rows, future):
+    """Waits for a scored chunk and writes it in one transaction. Returns the number stored."""
+    try:
+        score_rows = future.result()
+    except Exception as e:
+        logging.error(f"Error scoring chunk starting at project {rows[0][0]}: {e}")
+        return 0
+
+    with conn:
+        stored = db_manager.update_project_scores(conn, score_rows)
+        response_bodies.refresh_project_bodies(conn, [row['project_id'] for row in score_rows])
+        return stored
+
+def classify_project(project_id, content_hash, known_hashes):
+    """Returns 'new', 'changed' or 'unchanged' by comparing against the stored content hashes."""
+    if project_id not in known_hashes:
+        return 'new'
+    if known_hashes[project_id] == content_hash:
+        return 'unchanged'
+    return 'changed'
+
+def sync_project(project_id, project):
+    """
+    Syncs a single project, opening a connection per write.
+    Returns 'new', 'changed' or 'unchanged'.
+    """
+    prepared = data_persistence.prepare_project(project_id, project)
+
+    conn = db_manager.get_db_connection()
+    known_hashes = data_persistence.get_project_hashes(conn, [project_id])
+    conn.close()
+
+    change = classify_project(project_id, prepared[3], known_hashes)
+    if change == 'unchanged':
+        # Nothing to rewrite, but a deadline can still pass without the payload changing
+        for event in deadline_monitor.detect_expired_deadline(project_id, project):
+            deadline_monitor.log_audit_event(event)
+        conn = db_manager.get_db_connection()
+        with conn:
+            data_persistence.touch_projects(conn, [project_id])
+        conn.close()
+        return change
+
+    logging.info(f"Syncing Project {project_id} ({change})...")
+
+    # Get old data for comparison
+    old_data = data_persistence.get_raw_project_data(project_id)
+
+    # Update project data
+    data_persistence.insert_or_update_project(project_id, project)
+
+    # Detect deadline changes
+    if old_data:
+        events = deadline_monitor.detect_deadline_changes(project_id, project, old_data)
+        for event in events:
+            deadline_monitor.log_audit_event(event)
+
+    # Save document status
+    documents = extract_documents(project)
+    data_persistence.insert_document_status(project_id, documents)
+    data_persistence.upsert_project_summary(project_id, project, documents)
+    data_persistence.upsert_project_search(project_id, project)
+
+    logging.info(f"Successfully synced Project {project_id}.")
+    return change
+
+def sync_chunk(conn, chunk, timer, counts, run_id=None):
+    """
+    Syncs a chunk of (project_id, project) tuples on one connection inside a single transaction.
+    Unchanged projects (same content hash) only get their last_sync updated; projects, documents
+    and audit events of the rest are each written with one executemany. The chunk is
+    checkpointed for run_id in the same transaction.
+    """
+    with conn:
+        start = time.perf_counter()
+        prepared = [data_persistence.prepare_project(project_id, project) for project_id, project in chunk]
+        known_hashes = data_persistence.get_project_hashes(conn, [pid for pid, _ in chunk])
+        changed = []
+        unchanged = []
+        for record in prepared:
+            change = classify_project(record[0], record[3], known_hashes)
+            counts[change] += 1
+            (unchanged if change == 'unchanged' else changed).append(record)
+        timer.record('hash', len(chunk), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        # Deadline diffing only needs the implementation period of the stored payload
+        old_data_by_id = data_persistence.get_raw_projects_data(
+            conn, [record[0] for record in changed if record[0] in known_hashes],
+            sections=['implementationPeriod']
+        )
+        timer.record('load', len(old_data_by_id), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        events = []
+        for project_id, project, _, _ in changed:
+            if project_id in old_data_by_id:
+                events.extend(deadline_monitor.detect_deadline_changes(
+                    project_id, project, old_data_by_id[project_id], conn=conn
+                ))
+        for project_id, project, _, _ in unchanged:
+            # A deadline can pass without the payload changing
+            events.extend(deadline_monitor.detect_expired_deadline(project_id, project, conn=conn))
+        timer.record('deadlines', len(chunk), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows = data_persistence.bulk_upsert_projects(conn, changed)
+        rows += data_persistence.touch_projects(conn, [record[0] for record in unchanged])
+        timer.record('projects', rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        documents_by_project = [(project_id, extract_documents(project)) for project_id, project, _, _ in changed]
+        rows = data_persistence.bulk_replace_documents(conn, documents_by_project)
+        timer.record('documents', rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows = data_persistence.bulk_upsert_project_summaries(
+            conn, [(project_id, project, documents)
+                   for (project_id, project, _, _), (_, documents) in zip(changed, documents_by_project)]
+        )
+        timer.record('summary', rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows = data_persistence.bulk_upsert_project_search(
+            conn, [(project_id, project) for project_id, project, _, _ in changed])
+        timer.record('search', rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows = deadline_monitor.log_audit_events(conn, events)
+        timer.record('audit', rows, time.perf_counter() - start)
+
+        if run_id is not None:
+            sync_checkpoint.record_projects(conn, run_id, [project_id for project_id, _ in chunk])
+
+def sync_projects_batched(projects, chunk_size=SYNC_CHUNK_SIZE, counts=None, run_id=None):
+    """
+    Syncs all projects on a single connection, committing once per chunk.
+    Returns the new/changed/unchanged counts.
+    """
+    timer = PhaseTimer()
+    counts = counts if counts is not None else {'new': 0, 'changed': 0, 'unchanged': 0}
+    conn = db_manager.get_db_connection()
+    chunk = []
+    try:
+        for project_id, project in projects:
+            chunk.append((project_id, project))
+            if len(chunk) >= chunk_size:
+                sync_chunk(conn, chunk, timer, counts, run_id)
+                logging.info(f"Committed batch of {len(chunk)} projects.")
+                chunk = []
+        if chunk:
+            sync_chunk(conn, chunk, timer, counts, run_id)
+            logging.info(f"Committed batch of {len(chunk)} projects.")
+    finally:
+        conn.close()
+        timer.report()
+
+    return counts
+
+def iter_valid_projects(projects):
+    """Yields (project_id, project) for every project that has an id."""
+    for project in projects:
+        project_id = project.get('id')
+        if not project_id:
+            logging.warning("Project missing 'id' field, skipping.")
+            continue
+        yield project_id, project
+
+def iter_pending_projects(projects, done_ids, counts):
+    """Skips projects already committed by the run being resumed."""
+    for project_id, project in projects:
+        if project_id in done_ids:
+            counts['resumed'] += 1
+            continue
+        yield project_id, project
+
+def run_full_sync(batched=None, chunk_size=None, streaming=None, parallel_scoring=None,
+                  scoring_workers=None, scoring_chunk_size=None, scoring_source=None, fresh=False,
+                  async_fetch=None):
+    """
+    Orchestrates the full synchronization process.
+    In batched mode all project writes share one connection and are committed in chunks.
+    In streaming mode projects are consumed one by one as the API response is downloaded.
+    In async fetch mode paged/per-project endpoints are fetched concurrently and projects
+    are synced as they arrive.
+    An interrupted run is resumed from its last checkpoint unless fresh is True.
+    The data generation is bumped (and the list bodies rewritten) once the projects are synced,
+    again after scoring, and on failure. Without read snapshots, chunks committed during the
+    sync are visible to readers before that first bump, under the previous ETag.
+    Returns the number of new, changed, unchanged and resumed (already committed) projects.
+    """
+    batched = SYNC_BATCHED if batched is None else batched
+    chunk_size = chunk_size or SYNC_CHUNK_SIZE
+    streaming = SYNC_STREAMING if streaming is None else streaming
+    async_fetch = SYNC_ASYNC_FETCH if async_fetch is None else async_fetch
+    if batched:
+        logging.info(f"Starting full synchronization (batched, chunk size {chunk_size})...")
+    else:
+        logging.info("Starting full synchronization...")
 
     # 0. Sync locations first
     logging.info("Syncing locations...")
@@ -39,56 +385,99 @@ def run_full_sync():
         data_persistence.insert_or_update_location(location)
     logging.info(f"Synced {len(locations)} locations.")
 
-    # 1. Fetch all projects (bulk)
-    projects = api_fetcher.fetch_public_projects()
-    logging.info(f"Found {len(projects)} projects.")
+    run_id, done_ids = sync_checkpoint.start_run(fresh=fresh)
+    counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'resumed': 0}
 
-    # 2. Sync each project
-    for project in projects:
-        project_id = project.get('id')
-        if not project_id:
-            logging.warning("Project missing 'id' field, skipping.")
-            continue
+    try:
+        # 1. Fetch all projects (bulk, or as a generator when streaming or fetching concurrently)
+        if async_fetch:
+            projects = api_fetcher.fetch_projects_concurrently(raise_errors=True)
+        elif streaming:
+            projects = api_fetcher.stream_public_projects(raise_errors=True)
+        else:
+            projects = api_fetcher.fetch_public_projects(raise_errors=True)
+            logging.info(f"Found {len(projects)} projects.")
+
+        # 2. Sync each project, skipping the ones whose content hash is unchanged
+        # and the ones an interrupted run already committed
+        pending = iter_pending_projects(iter_valid_projects(projects), done_ids, counts)
+        if batched:
+            sync_projects_batched(pending, chunk_size, counts, run_id)
+        else:
+            for project_id, project in pending:
+                counts[sync_project(project_id, project)] += 1
+                sync_checkpoint.record_project(run_id, project_id)
+    except BaseException:
+        # Leave the checkpoints in place so the next run resumes from here
+        sync_checkpoint.finish_run(run_id, status='failed')
+        # Chunks committed before the failure are already visible to readers
+        publish_data_generation()
+        raise
+
+    sync_checkpoint.finish_run(run_id)
+    # Synced projects are listed, still unscored, until scoring publishes again; even a sync
+    # without changes moves last_sync, which the list shows
+    publish_data_generation()
+    logging.info(f"Full synchronization completed: {counts['new']} new, {counts['changed']} changed, "
+                 f"{counts['unchanged']} unchanged, {counts['resumed']} already synced by the interrupted run.")
+
+    # Run Score IT calculation (only new and changed projects are flagged as unprocessed)
+    process_all_projects(parallel=parallel_scoring, workers=scoring_workers, chunk_size=scoring_chunk_size,
+                         source=scoring_source)
+
+    # API readers switch to the fully synced and scored data in one step
+    if db_manager.DB_READ_SNAPSHOTS:
+        publish_read_snapshot()
+
+    if query_stats.DB_QUERY_STATS:
+        logging.info(f"Query stats for this run written to {query_stats.query_stats.write_dump()}.")
+    return counts
 
-        logging.info(f"Syncing Project {project_id}...")
-        
-        # Get old data for comparison
-        old_data = data_persistence.get_raw_project_data(project_id)
-        
-        # Update project data
-        data_persistence.insert_or_update_project(project_id, project)
-        
-        # Detect deadline changes
-        if old_data:
-            events = deadline_monitor.detect_deadline_changes(project_id, project, old_data)
-            for event in events:
-                deadline_monitor.log_audit_event(event)
-        
-        # 3. Save document status
-        documents = []
-        phases = ['identification', 'preparation', 'procurement', 'implementation', 'completion']
-        
-        for phase in phases:
-            phase_data = project.get(phase, {})
-            # Check if phase_data is a dictionary (it should be based on the JSON structure)
-            if isinstance(phase_data, dict):
-                phase_docs = phase_data.get('documents', [])
-                if isinstance(phase_docs, list):
-                    documents.extend(phase_docs)
-        
-        # Also check for top-level documents just in case
-        top_level_docs = project.get('documents', [])
-        if isinstance(top_level_docs, list):
-            documents.extend(top_level_docs)
-
-        data_persistence.insert_document_status(project_id, documents)
-        
-        logging.info(f"Successfully synced Project {project_id}.")
-
-    logging.info("Full synchronization completed.")
-    
-    # Run Score IT calculation
-    process_all_projects()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synchronize projects from the CoST API.")
+    parser.add_argument('--batched', action='store_true', default=SYNC_BATCHED,
+                        help="Write projects in chunked transactions on a single connection")
+    parser.add_argument('--chunk-size', type=int, default=SYNC_CHUNK_SIZE,
+                        help="Projects per transaction in batched mode")
+    parser.add_argument('--stream', action='store_true', default=SYNC_STREAMING,
+                        help="Parse the project list incrementally while it is downloaded")
+    parser.add_argument('--async-fetch', action='store_true', default=SYNC_ASYNC_FETCH,
+                        help="Fetch paged/per-project endpoints concurrently and sync projects as they arrive")
+    parser.add_argument('--parallel-scoring', action='store_true', default=SCORING_PARALLEL,
+                        help="Score projects in chunks on a process pool")
+    parser.add_argument('--scoring-workers', type=int, default=SCORING_WORKERS,
+                        help="Worker processes for parallel scoring")
+    parser.add_argument('--scoring-chunk-size', type=int, default=SCORING_CHUNK_SIZE,
+                        help="Projects per scoring chunk and write transaction")
+    parser.add_argument('--scoring-source', choices=['raw', 'documents'], default=SCORING_SOURCE,
+                        help="Score from data_raw payloads or from the project_documents table")
+    parser.add_argument('--fresh', action='store_true',
+                        help="Ignore any interrupted sync run and start a clean one")
+    parser.add_argument('--rescore-all', action='store_true',
+                        help="Skip the sync and rescore every project (e.g. after a weight change)")
+    parser.add_argument('--backend', choices=sorted(db_manager.BACKENDS), default=db_manager.DB_BACKEND,
+                        help="Storage backend; 'memory' keeps everything in process (for benchmarks)")
+    parser.add_argument('--publish-snapshot', action='store_true',
+                        help="Skip the sync and publish a read snapshot of the current database")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    run_full_sync()
+    args = parse_args()
+    db_manager.DB_BACKEND = args.backend
+    if not db_manager.get_backend().keeps_files:
+        # Nothing of a run on a file-less backend goes to disk, HTTP cache included
+        api_fetcher.client.cache_dir = None
+    db_manager.initialize_db()
+    if args.publish_snapshot:
+        publish_read_snapshot()
+    elif args.rescore_all:
+        logging.info(f"Marked {db_manager.reset_processed_flags()} projects for rescoring.")
+        process_all_projects(parallel=args.parallel_scoring, workers=args.scoring_workers,
+                             chunk_size=args.scoring_chunk_size, source=args.scoring_source)
+        if db_manager.DB_READ_SNAPSHOTS:
+            publish_read_snapshot()
+    else:
+        run_full_sync(batched=args.batched, chunk_size=args.chunk_size, streaming=args.stream,
+                      parallel_scoring=args.parallel_scoring, scoring_workers=args.scoring_workers,
+                      scoring_chunk_size=args.scoring_chunk_size, scoring_source=args.scoring_source,
+                      fresh=args.fresh, async_fetch=args.async_fetch)
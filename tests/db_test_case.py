@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import db_manager
+
+class TempDatabaseTestCase(unittest.TestCase):
+    """
+    Runs each test against a freshly migrated database in its own temporary directory,
+    which also holds the data generation file and the response body files.
+    Subclasses seed their data in setUp after calling super().setUp().
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'adaptt.db')
+        self.patches = [patch('db_manager.DB_NAME', self.db_path),
+                        patch('response_bodies.RESPONSE_BODY_DIR', os.path.join(self.tmp_dir, 'bodies'))]
+        self.patches += self.extra_patches()
+        for p in self.patches:
+            p.start()
+        db_manager.initialize_db()
+
+    def extra_patches(self):
+        """Further patches to apply before the database is created."""
+        return []
+
+    def tearDown(self):
+        db_manager.close_connections()
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.tmp_dir)
@@ -0,0 +1,174 @@
+import gzip
+import os
+import unittest
+from unittest.mock import patch
+import db_manager
+import data_persistence
+import response_bodies
+import response_compression
+import sync_orchestrator
+from app import app
+from db_test_case import TempDatabaseTestCase
+
+class TestConditionalGet(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        response_compression.compression_cache.clear()
+        self.projects = [{'id': f'p{i:02d}', 'title': f'Reabilitação da estrada regional número {i}',
+                          'locations': [{'region': 'Nampula' if i % 2 else 'Sofala'}],
+                          'documents': [{'type': 'signedContract'}] if i % 3 else []}
+                         for i in range(40)]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects))
+        sync_orchestrator.process_all_projects(parallel=False, source='documents')
+        self.client = app.test_client()
+
+    def get(self, url, **kwargs):
+        """GETs a URL, reading and closing the (possibly streamed) response."""
+        response = self.client.get(url, **kwargs)
+        response.get_data()
+        response.close()
+        return response
+
+    def test_not_modified_until_generation_changes(self):
+        """Test that a current ETag gets a 304 and a generation bump a fresh 200."""
+        for url in ('/api/projects?limit=10', '/api/projects/p01', '/api/projects/search?q=estrada'):
+            first = self.get(url)
+            self.assertEqual(first.status_code, 200, url)
+            etag = first.headers['ETag']
+            self.assertEqual(self.get(url, headers={'If-None-Match': etag}).status_code, 304, url)
+
+        db_manager.bump_data_generation()
+        again = self.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again.headers['ETag'], etag)
+
+    def test_invalid_requests_are_not_answered_304(self):
+        """Test that bad arguments and unknown projects fail even with a current ETag."""
+        etag = self.get('/api/projects?limit=10').headers['ETag']
+        for url, status in (('/api/projects?limit=abc', 400), ('/api/projects?sort=bogus', 400),
+                            ('/api/projects?limit=5&cursor=nope', 400),
+                            ('/api/projects?limit=5&cursor=' + data_persistence._encode_cursor(['project_id', 'asc', [1]]), 400),
+                            ('/api/projects/search?q=', 400),
+                            ('/api/projects/batch?ids=', 400)):
+            self.assertEqual(self.get(url, headers={'If-None-Match': etag}).status_code, status, url)
+        self.assertEqual(self.get('/api/projects/nope').status_code, 404)
+
+    def test_not_modified_does_not_query_database(self):
+        """Test that a 304 is answered from the generation copy alone, without a database query."""
+        urls = ('/api/projects?limit=10', '/api/projects/p01', '/api/projects/p01/documents',
+                '/api/projects/search?q=estrada', '/api/projects/batch?ids=p01,p02', '/api/locations')
+        etags = {url: self.get(url).headers['ETag'] for url in urls}
+        with patch('db_manager.get_db_connection', side_effect=AssertionError('database queried')), \
+                patch('db_manager.get_read_connection', side_effect=AssertionError('database queried')):
+            for url in urls:
+                self.assertEqual(self.get(url, headers={'If-None-Match': etags[url]}).status_code, 304, url)
+
+    def test_new_database_changes_etag(self):
+        """Test that a database recreated at the same path never validates the old database's ETags."""
+        first = self.get('/api/projects/p01')
+        db_manager.close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        db_manager.initialize_db()
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects))
+        # Same generation number as the first database had
+        db_manager.bump_data_generation()
+        self.assertEqual(db_manager.get_data_generation()[0], 1)
+
+        again = self.get('/api/projects/p01', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again.headers['ETag'], first.headers['ETag'])
+
+    def test_new_database_ignores_old_list_bodies(self):
+        """Test that list body files written for a replaced database are never served for the new one."""
+        self.assertIsNotNone(response_bodies.get_list_body_path('projects'))
+        db_manager.close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        db_manager.initialize_db()
+        db_manager.bump_data_generation()
+
+        self.assertIsNone(response_bodies.get_list_body_path('projects'))
+        self.assertEqual(self.get('/api/projects').get_json(), [])
+        self.assertEqual(self.get('/api/locations').get_json(), [])
+
+    def test_ndjson_has_its_own_etag(self):
+        """Test that NDJSON negotiated from Accept varies on Accept and never validates the JSON tag."""
+        ndjson_headers = {'Accept': 'application/x-ndjson'}
+        for url in ('/api/projects', '/api/projects?sort=score', '/api/locations'):
+            as_json = self.get(url)
+            as_ndjson = self.get(url, headers=ndjson_headers)
+            self.assertEqual(as_ndjson.mimetype, 'application/x-ndjson', url)
+            self.assertEqual(as_ndjson.headers['ETag'], as_json.headers['ETag'][:-1] + '-ndjson"')
+            self.assertIn('Accept', as_json.vary)
+            self.assertIn('Accept', as_ndjson.vary)
+
+            stale = self.get(url, headers={**ndjson_headers, 'If-None-Match': as_json.headers['ETag']})
+            self.assertEqual(stale.status_code, 200, url)
+            not_modified = self.get(url, headers={**ndjson_headers, 'If-None-Match': as_ndjson.headers['ETag']})
+            self.assertEqual(not_modified.status_code, 304, url)
+            self.assertIn('Accept', not_modified.vary)
+
+        explicit = self.get('/api/projects?format=ndjson')
+        self.assertTrue(explicit.headers['ETag'].endswith('-ndjson"'))
+        self.assertNotIn('Accept', explicit.vary)
+
+    def test_gzip_matches_identity(self):
+        """Test that whole, streamed and pre-compressed list bodies decode to the identity response."""
+        gzip_headers = {'Accept-Encoding': 'gzip'}
+        # Page (compressed at once), streamed list, pre-encoded list file
+        for url in ('/api/projects?limit=40', '/api/projects?sort=score', '/api/projects'):
+            identity = self.get(url)
+            compressed = self.get(url, headers=gzip_headers)
+            self.assertNotIn('Content-Encoding', identity.headers)
+            self.assertEqual(compressed.headers['Content-Encoding'], 'gzip', url)
+            self.assertEqual(gzip.decompress(compressed.data), identity.data, url)
+            self.assertIn('Accept-Encoding', compressed.vary)
+
+            etag = compressed.headers['ETag']
+            self.assertEqual(etag, identity.headers['ETag'][:-1] + '-gzip"')
+            not_modified = self.get(url, headers={**gzip_headers, 'If-None-Match': etag})
+            self.assertEqual(not_modified.status_code, 304, url)
+
+        with open(response_bodies.get_list_body_path('projects', 'gzip'), 'rb') as f:
+            self.assertEqual(compressed.data, f.read())
+
+    def test_compressed_bodies_are_cached_per_generation(self):
+        """Test that a repeated compressed request skips the view until the generation changes."""
+        url = '/api/projects?limit=40'
+        gzip_headers = {'Accept-Encoding': 'gzip'}
+        first = self.get(url, headers=gzip_headers)
+        with patch('data_persistence.get_projects_page', wraps=data_persistence.get_projects_page) as view_query:
+            again = self.get(url, headers=gzip_headers)
+            self.assertEqual(view_query.call_count, 0)
+            self.assertEqual(again.data, first.data)
+            self.assertEqual(again.headers['Content-Encoding'], 'gzip')
+
+            db_manager.bump_data_generation()
+            self.get(url, headers=gzip_headers)
+            self.assertEqual(view_query.call_count, 1)
+
+class TestQueryStatsAccess(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_requires_token(self):
+        """Test that query stats are only served to requests carrying the configured token."""
+        url = '/api/debug/query-stats'
+        with patch('query_stats.DB_QUERY_STATS', True):
+            with patch('app.QUERY_STATS_TOKEN', None):
+                self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer '}).status_code, 404)
+
+            with patch('app.QUERY_STATS_TOKEN', 's3gredo'):
+                self.assertEqual(self.client.get(url).status_code, 403)
+                self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer errado'}).status_code, 403)
+                response = self.client.get(url, headers={'Authorization': 'Bearer s3gredo'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.headers['Cache-Control'], 'no-store')
+
+if __name__ == '__main__':
+    unittest.main()
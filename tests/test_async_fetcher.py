@@ -0,0 +1,80 @@
+import unittest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from async_fetcher import AsyncProjectFetcher, ASYNC_LIST_PATH, ASYNC_PAGE_PARAM
+
+PROJECTS = [{'id': f'p{i}'} for i in range(23)]
+
+class TestAsyncProjectFetcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.failures = 0
+        self.listing = self.paged
+
+        async def handler(request):
+            page = int(request.query.get(ASYNC_PAGE_PARAM, 1))
+            self.requests.append(page)
+            if self.failures:
+                self.failures -= 1
+                return web.Response(status=503)
+            return web.json_response(self.listing(page))
+
+        app = web.Application()
+        app.router.add_get(ASYNC_LIST_PATH, handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    def paged(self, page, **extra):
+        return {'projects': PROJECTS[(page - 1) * 5:page * 5], **extra}
+
+    async def fetch(self, **kwargs):
+        fetcher = AsyncProjectFetcher(base_url=str(self.server.make_url('')).rstrip('/'), page_size=5,
+                                      rate_per_host=0, max_concurrency=2, **kwargs)
+        projects = []
+        await fetcher._produce(projects.append)
+        return sorted(p['id'] for p in projects)
+
+    async def test_total_pages_and_total(self):
+        """Test that reported page counts or totals drive the page requests."""
+        self.listing = lambda page: self.paged(page, totalPages=5)
+        self.assertEqual(await self.fetch(), sorted(p['id'] for p in PROJECTS))
+        self.assertEqual(sorted(self.requests), [1, 2, 3, 4, 5])
+
+        self.requests.clear()
+        self.listing = lambda page: self.paged(page, total=len(PROJECTS))
+        self.assertEqual(len(await self.fetch()), len(PROJECTS))
+        self.assertEqual(sorted(self.requests), [1, 2, 3, 4, 5])
+
+    async def test_probes_until_short_page(self):
+        """Test that without totals pages are probed until one comes back short."""
+        self.assertEqual(len(await self.fetch()), len(PROJECTS))
+        self.assertEqual(max(self.requests), 5)
+
+    async def test_api_ignoring_paging(self):
+        """Test that an API returning everything, or the same full page, is fetched once per project."""
+        self.listing = lambda page: {'projects': PROJECTS}
+        self.assertEqual(len(await self.fetch()), len(PROJECTS))
+        self.assertEqual(self.requests, [1])
+
+        self.requests.clear()
+        self.listing = lambda page: {'projects': PROJECTS[:5]}
+        self.assertEqual(len(await self.fetch()), 5)
+        self.assertEqual(sorted(self.requests), [1, 2, 3])
+
+        self.requests.clear()
+        self.listing = lambda page: {'projects': PROJECTS[:5], 'totalPages': 10 ** 6}
+        self.assertEqual(len(await self.fetch(max_pages=4)), 5)
+        self.assertEqual(sorted(self.requests), [1, 2, 3, 4])
+
+    async def test_retries_server_errors(self):
+        """Test that 5xx responses are retried."""
+        self.failures = 2
+        self.assertEqual(len(await self.fetch()), len(PROJECTS))
+        self.assertEqual(self.requests[:3], [1, 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
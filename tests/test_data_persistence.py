@@ -0,0 +1,266 @@
+import unittest
+from unittest.mock import patch
+import db_manager
+import data_persistence
+import raw_codec
+import sync_orchestrator
+from constants import CRITICAL_DOCS_MAP
+from db_test_case import TempDatabaseTestCase
+
+class TestProjectPages(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        conn = db_manager.get_db_connection()
+        conn.executemany(f'INSERT INTO project_summary ({data_persistence.SUMMARY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+            (f'p{i:02d}', f'Projeto {i}', 'Implementação', f'2025-11-{i % 28 + 1:02d}',
+             None if i % 7 == 0 else i % 11, 'RED' if i % 3 else 'GREEN', 'Nampula' if i % 2 else 'Sofala', None, 0, 0)
+            for i in range(40)
+        ])
+        conn.commit()
+        conn.close()
+
+    def _walk(self, page_size, **kwargs):
+        projects, cursor = data_persistence.get_projects_page(limit=page_size, **kwargs)
+        while cursor:
+            page, cursor = data_persistence.get_projects_page(limit=page_size, cursor=cursor, **kwargs)
+            projects.extend(page)
+        return projects
+
+    def test_pages_match_unpaginated_list(self):
+        """Test that walking the cursors returns every matching project once, in order, with ties on score."""
+        for kwargs in ({}, {'sort': 'score', 'order': 'desc'}, {'sort': 'last_sync'},
+                       {'filters': {'alert_color': 'RED'}, 'min_score': 2, 'sort': 'score'}):
+            everything, cursor = data_persistence.get_projects_page(**kwargs)
+            self.assertIsNone(cursor)
+            self.assertEqual(self._walk(3, **kwargs), everything)
+
+        scores = [p['transparency_score'] for p in self._walk(4, sort='score', order='desc')]
+        self.assertEqual(scores[-1], None)
+        self.assertEqual(len(self._walk(5, filters={'region': 'Sofala'})), 20)
+
+    def test_score_range_excludes_unscored(self):
+        """Test that min_score/max_score never return projects without a score."""
+        for kwargs in ({'max_score': 5}, {'min_score': -3, 'max_score': 5}, {'min_score': 0}):
+            projects = self._walk(4, **kwargs)
+            self.assertTrue(projects)
+            self.assertNotIn(None, [p['transparency_score'] for p in projects], kwargs)
+            self.assertEqual(list(data_persistence.iter_projects(**kwargs)), projects)
+        self.assertEqual(len(self._walk(4, max_score=5)), len([i for i in range(40) if i % 7 and i % 11 <= 5]))
+
+    def test_cursor_must_match_sort(self):
+        """Test that a cursor from one sort is rejected by another."""
+        _, cursor = data_persistence.get_projects_page(limit=2, sort='score')
+        with self.assertRaises(ValueError):
+            data_persistence.get_projects_page(limit=2, sort='last_sync', cursor=cursor)
+        with self.assertRaises(ValueError):
+            data_persistence.get_projects_page(limit=2, cursor='not-a-cursor')
+
+    def test_cursor_values_must_be_scalars(self):
+        """Test that well-formed cursors carrying values of the wrong kind are rejected, not bound."""
+        for sort, values in (('project_id', [['p01']]), ('project_id', [{'a': 1}]), ('project_id', [None]),
+                             ('score', [[1], 'p01']), ('score', ['5', 'p01']), ('score', [True, 'p01']),
+                             ('score', [5, 7]), ('last_sync', [{'x': 1}, 'p01'])):
+            cursor = data_persistence._encode_cursor([sort, 'asc', *values])
+            with self.assertRaises(ValueError, msg=values):
+                data_persistence.get_projects_page(limit=2, sort=sort, cursor=cursor)
+        cursor = data_persistence._encode_cursor(['score', 'asc', 4.5, 'p01'])
+        self.assertTrue(data_persistence.get_projects_page(limit=2, sort='score', cursor=cursor)[0])
+
+    def test_iter_projects_streams_in_batches(self):
+        """Test that iter_projects yields the same rows as a page query, fetched in batches."""
+        kwargs = {'filters': {'alert_color': 'RED'}, 'sort': 'score', 'order': 'desc'}
+        everything, _ = data_persistence.get_projects_page(**kwargs)
+        with patch('data_persistence.STREAM_FETCH_SIZE', 4):
+            self.assertEqual(list(data_persistence.iter_projects(**kwargs)), everything)
+        with self.assertRaises(ValueError):
+            data_persistence.iter_projects(sort='bogus')
+
+class TestProjectProjection(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project = {
+            'id': 'p1',
+            'title': 'Reabilitação da Estrada N1',
+            'implementationPeriod': {'startDate': '2023-01-01', 'endDate': '2025-06-30'},
+            'implementation': {'documents': [{'type': 'progressReport', 'url': 'https://example.org/r.pdf'}] * 40},
+            'documents': [{'type': 'signedContract', 'title': 'Contrato nº %d' % i} for i in range(40)]
+        }
+
+    def test_fields_and_sections(self):
+        """Test that only the requested keys, paths and sections come back, in both storage formats."""
+        for fmt in ('json', 'zlib'):
+            with patch('raw_codec.RAW_STORAGE_FORMAT', fmt):
+                data_persistence.insert_or_update_project('p1', self.project)
+
+            projection = data_persistence.get_project_projection(
+                'p1', fields=['title', 'transparency_score', 'implementationPeriod.endDate', 'missing.path'],
+                sections=['implementation'])
+            self.assertEqual(projection, {
+                'transparency_score': None,
+                'title': self.project['title'],
+                'implementationPeriod': {'endDate': '2025-06-30'},
+                'implementation': self.project['implementation']
+            })
+
+        self.assertEqual(data_persistence.get_project_projection('p1', fields=['alert_color']), {'alert_color': None})
+        self.assertIsNone(data_persistence.get_project_projection('nope', sections=['documents']))
+
+    def test_migrate_requires_matching_format(self):
+        """Test that migrating to a format the sync would not keep is refused."""
+        data_persistence.insert_or_update_project('p1', self.project)
+        with self.assertRaises(ValueError):
+            data_persistence.migrate_raw_storage('zlib')
+        self.assertFalse(raw_codec.is_sectioned(self._data_raw()))
+
+        with patch('raw_codec.RAW_STORAGE_FORMAT', 'zlib'):
+            self.assertEqual(data_persistence.migrate_raw_storage('zlib')['rows'], 1)
+            self.assertTrue(raw_codec.is_sectioned(self._data_raw()))
+            self.project['title'] = 'Reabilitação da Estrada N2'
+            data_persistence.insert_or_update_project('p1', self.project)
+        self.assertTrue(raw_codec.is_sectioned(self._data_raw()))
+
+    def _data_raw(self):
+        conn = db_manager.get_db_connection()
+        value = conn.execute("SELECT data_raw FROM projects WHERE project_id = 'p1'").fetchone()[0]
+        conn.close()
+        return value
+
+class TestBatchOperations(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            data_persistence.insert_or_update_project(f'p{i}', {'id': f'p{i}', 'title': f'Projeto {i}'})
+            data_persistence.upsert_project_summary(f'p{i}', {'id': f'p{i}', 'title': f'Projeto {i}'}, [])
+
+    def test_batch_reads_keep_requested_order(self):
+        """Test that batch reads return the existing projects in the order asked."""
+        summaries = data_persistence.get_project_summaries(['p2', 'nope', 'p0', 'p2'])
+        self.assertEqual([s['project_id'] for s in summaries], ['p2', 'p0'])
+        details = data_persistence.get_projects_details(['p1', 'nope'])
+        self.assertEqual(list(details), ['p1'])
+        self.assertIn('transparency_score', details['p1'])
+
+    def test_update_subscriptions_reports_each_item(self):
+        """Test that one call applies the valid changes and reports the failed ones."""
+        success, _, results = data_persistence.update_subscriptions(1, subscribe=['p0', 'p1', 'nope'])
+        self.assertTrue(success)
+        self.assertEqual([r['success'] for r in results], [True, True, False])
+        self.assertIsNotNone(results[0]['subscription_id'])
+
+        success, _, results = data_persistence.update_subscriptions(1, subscribe=['p1', 'p2'], unsubscribe=['p0', 'p2'])
+        self.assertEqual([(r['project_id'], r['action'], r['success']) for r in results],
+                         [('p1', 'subscribe', False), ('p2', 'subscribe', True),
+                          ('p0', 'unsubscribe', True), ('p2', 'unsubscribe', False)])
+        self.assertEqual({s['project_id'] for s in data_persistence.get_user_subscriptions(1)}, {'p1', 'p2'})
+
+        success, message, results = data_persistence.update_subscriptions(1, subscribe=['p0'], notification_channel='fax')
+        self.assertFalse(success)
+
+class TestProjectSearch(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.projects = [
+            {'id': 'p0', 'title': 'Reabilitação da estrada N1', 'description': 'Troço Nampula'},
+            {'id': 'p1', 'title': 'Escola primária', 'description': 'Acesso por estrada de terra',
+             'parties': [{'name': 'Município de Nampula', 'role': 'Entidade Contratante'}]},
+            {'id': 'p2', 'title': 'Sistema de abastecimento de água', 'locations': [{'region': 'Gaza'}]},
+        ]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects))
+
+    def test_ranking_accents_and_prefixes(self):
+        """Test that title matches rank first and accents and word endings are ignored."""
+        projects, next_cursor = data_persistence.search_projects('estrada')
+        self.assertEqual([p['project_id'] for p in projects], ['p0', 'p1'])
+        self.assertIsNone(next_cursor)
+        self.assertEqual([p['project_id'] for p in data_persistence.search_projects('reabilitacao')[0]], ['p0'])
+        self.assertEqual([p['project_id'] for p in data_persistence.search_projects('municipio nampu')[0]], ['p1'])
+        self.assertEqual(data_persistence.search_projects('hospital')[0], [])
+        with self.assertRaises(ValueError):
+            data_persistence.search_projects(' "* ')
+
+    def test_cursor_paging_and_sync_updates(self):
+        """Test that pages follow the cursor and a re-synced project is found by its new text."""
+        first, cursor = data_persistence.search_projects('estrada', limit=1)
+        second, cursor_after = data_persistence.search_projects('estrada', limit=1, cursor=cursor)
+        self.assertEqual([first[0]['project_id'], second[0]['project_id']], ['p0', 'p1'])
+        self.assertIsNone(cursor_after)
+        with self.assertRaises(ValueError):
+            data_persistence.search_projects('escola', cursor=cursor)
+
+        self.projects[2]['title'] = 'Estrada para a represa'
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects[2:]))
+        self.assertEqual([p['project_id'] for p in data_persistence.search_projects('represa')[0]], ['p2'])
+        self.assertEqual(data_persistence.search_projects('abastecimento')[0], [])
+
+    def test_short_words_are_ignored(self):
+        """Test that one-letter words neither narrow nor broaden a search."""
+        self.assertEqual(data_persistence.build_search_query('a estrada N 1'), '"estrada"*')
+        self.assertEqual(data_persistence.search_projects('a estrada')[0], data_persistence.search_projects('estrada')[0])
+        with self.assertRaises(ValueError):
+            data_persistence.search_projects('a e o')
+
+    def test_pages_cover_every_match_in_rank_order(self):
+        """Test that paging a broad search returns every match once, all title matches first."""
+        extra = [{'id': f'x{i:02d}', 'title': f'Ponte {i}' if i % 2 else f'Escola {i}',
+                  'description': 'Obra de ponte' if i % 2 == 0 else ''} for i in range(30)]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(extra))
+        found = []
+        page, cursor = data_persistence.search_projects('ponte', limit=4)
+        found.extend(page)
+        while cursor:
+            page, cursor = data_persistence.search_projects('ponte', limit=4, cursor=cursor)
+            found.extend(page)
+        ids = [p['project_id'] for p in found]
+        self.assertEqual(sorted(ids), sorted(p['id'] for p in extra))
+        self.assertEqual({int(i[1:]) % 2 for i in ids[:15]}, {1})
+
+class TestProjectAggregates(TempDatabaseTestCase):
+
+    def extra_patches(self):
+        return [patch('response_bodies.RESPONSE_BODIES', False)]
+
+    def setUp(self):
+        super().setUp()
+        self.projects = [
+            {'id': 'p0', 'locations': [{'region': 'Gaza'}], 'documents': [{'type': 'signedContract'}]},
+            {'id': 'p1', 'locations': [{'region': 'Gaza'}],
+             'documents': [{'type': key} for key in ('signedContract', 'feasibilityStudy', 'progressReport')]},
+            {'id': 'p2', 'locations': [{'region': 'Tete'}]},
+        ]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects))
+        sync_orchestrator.process_all_projects(parallel=False, source='documents')
+
+    def test_breakdowns(self):
+        """Test counts, averages, colors and missing documents in total and per region."""
+        aggregates = data_persistence.get_project_aggregates()
+        total = aggregates['total']
+        self.assertEqual((total['project_count'], total['scored_count'], total['average_score']), (3, 3, 4.0))
+        self.assertEqual(total['alert_colors'], {'RED': 1, 'YELLOW': 1, 'GREEN': 1})
+        self.assertEqual(total['score_distribution'], {'0': 1, '4': 1, '8': 1})
+        self.assertEqual([(d['doc_type'], d['missing_count']) for d in total['missing_documents']],
+                         [('completionReport', 3), ('feasibilityStudy', 2), ('progressReport', 2),
+                          ('signedContract', 1)])
+        self.assertEqual([(r['region'], r['project_count'], r['average_score']) for r in aggregates['by_region']],
+                         [('Gaza', 2, 6.0), ('Tete', 1, 0.0)])
+
+    def test_sync_and_scoring_move_projects_between_groups(self):
+        """Test that a re-synced and rescored project leaves its old groups."""
+        self.projects[2]['locations'] = [{'region': 'Gaza'}]
+        self.projects[2]['documents'] = [{'type': key} for key in CRITICAL_DOCS_MAP]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects[2:]))
+        sync_orchestrator.process_all_projects(parallel=False, source='raw')
+
+        aggregates = data_persistence.get_project_aggregates()
+        self.assertEqual(aggregates['total']['alert_colors'], {'RED': 0, 'YELLOW': 1, 'GREEN': 2})
+        self.assertEqual([(r['region'], r['project_count']) for r in aggregates['by_region']], [('Gaza', 3)])
+        conn = db_manager.get_db_connection()
+        rows = conn.execute('SELECT SUM(project_count), MIN(project_count) FROM project_aggregates').fetchone()
+        conn.close()
+        self.assertEqual(tuple(rows), (3, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import unittest
+from unittest.mock import patch
+import db_manager
+import data_persistence
+from db_test_case import TempDatabaseTestCase
+
+class TestMigrations(TempDatabaseTestCase):
+
+    def _plan(self, sql, params=()):
+        conn = db_manager.get_db_connection()
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        conn.close()
+        return ' '.join(row['detail'] for row in plan)
+
+    def test_migrations_are_recorded_once(self):
+        """Test that every migration is applied and a second startup applies nothing."""
+        conn = db_manager.get_db_connection()
+        self.assertEqual(db_manager.get_schema_version(conn), db_manager.MIGRATIONS[-1][0])
+        self.assertEqual(db_manager.apply_migrations(conn), [])
+        conn.close()
+
+    def test_unversioned_database_is_upgraded(self):
+        """Test that a database created before schema_version existed is brought up to date."""
+        conn = db_manager.get_db_connection()
+        conn.execute('DROP TABLE schema_version')
+        conn.execute('DROP INDEX idx_subscriptions_project_enabled')
+        self.assertEqual(db_manager.apply_migrations(conn), [version for version, _, _ in db_manager.MIGRATIONS])
+        conn.close()
+        self.assertIn('idx_subscriptions_project_enabled',
+                      self._plan('SELECT user_id FROM subscriptions WHERE project_id = ? AND notification_enabled = 1', ('p1',)))
+
+    def test_hot_queries_use_indexes(self):
+        """Test that EXPLAIN QUERY PLAN uses an index for each hot lookup."""
+        plans = {
+            'idx_project_documents_project_type':
+                self._plan('SELECT * FROM project_documents WHERE project_id = ?', ('p1',)),
+            'idx_subscriptions_project_enabled':
+                self._plan('''
+                    SELECT s.user_id, u.phone_number FROM subscriptions s
+                    JOIN users u ON s.user_id = u.user_id
+                    WHERE s.project_id = ? AND s.notification_enabled = 1
+                ''', ('p1',)),
+            'idx_project_audit_notified_detected':
+                self._plan('SELECT audit_id FROM project_audit WHERE notified = 0 ORDER BY detected_at ASC'),
+            'idx_project_audit_project_event_date':
+                self._plan('''
+                    SELECT audit_id FROM project_audit
+                    WHERE project_id = ? AND event_type = 'deadline_expired' AND new_date = ?
+                ''', ('p1', '2024-01-01'))
+        }
+        for index, plan in plans.items():
+            self.assertIn(f'USING INDEX {index}', plan.replace('COVERING INDEX', 'INDEX'))
+            self.assertNotIn('TEMP B-TREE', plan)
+
+class TestReadSnapshots(TempDatabaseTestCase):
+
+    def extra_patches(self):
+        return [patch('db_manager.DB_SNAPSHOT_DIR', os.path.join(self.tmp_dir, 'snapshots')),
+                patch('db_manager.DB_READ_SNAPSHOTS', True)]
+
+    def _add_location(self, location_id):
+        data_persistence.insert_or_update_location(
+            {'id': location_id, 'name': location_id, 'region': 'Sul', 'country': 'MZ'})
+
+    def test_readers_switch_generations(self):
+        """Test that readers see only published data and move to each new generation."""
+        self._add_location('maputo')
+        self.assertEqual(len(data_persistence.get_all_locations()), 1)
+
+        self.assertEqual(db_manager.publish_snapshot(), 1)
+        self._add_location('beira')
+        self.assertEqual([l['id'] for l in data_persistence.get_all_locations()], ['maputo'])
+
+        self.assertEqual(db_manager.publish_snapshot(), 2)
+        self.assertEqual(len(data_persistence.get_all_locations()), 2)
+
+        db_manager.publish_snapshot()
+        snapshot_files = sorted(f for f in os.listdir(db_manager.DB_SNAPSHOT_DIR) if f.endswith('.db'))
+        self.assertEqual(snapshot_files, ['adaptt.2.db', 'adaptt.3.db'])
+
+    def test_publishing_bumps_data_generation(self):
+        """Test that the data generation moves forward when a snapshot is published."""
+        self.assertEqual(db_manager.get_data_generation(), (0, None))
+        self.assertEqual(db_manager.bump_data_generation(), 1)
+        db_manager.publish_snapshot()
+        generation, updated_at = db_manager.get_data_generation()
+        self.assertEqual(generation, 2)
+        self.assertIsNotNone(updated_at)
+
+    def test_full_sync_bumps_only_after_the_snapshot(self):
+        """Test that a sync under published snapshots starts generations only once readers see the new data."""
+        import response_bodies
+        import sync_orchestrator
+        db_manager.publish_snapshot()
+        projects = [{'id': f'p{i}', 'title': f'Projeto {i}', 'documents': [{'type': 'signedContract'}]}
+                    for i in range(3)]
+        seen_at_bump = []
+        bump = db_manager.bump_data_generation
+
+        def record_bump():
+            seen_at_bump.append(sorted(p['project_id'] for p in data_persistence.get_all_projects()))
+            return bump()
+
+        with patch('db_manager.bump_data_generation', side_effect=record_bump), \
+                patch('api_fetcher.fetch_locations', return_value=[]), \
+                patch('api_fetcher.fetch_public_projects', return_value=projects):
+            sync_orchestrator.run_full_sync(batched=True, streaming=False, async_fetch=False,
+                                            parallel_scoring=False, scoring_source='documents')
+
+        self.assertEqual(seen_at_bump, [['p0', 'p1', 'p2']])
+        with open(response_bodies.get_list_body_path('projects')) as f:
+            listed = json.load(f)
+        self.assertEqual(len(listed), 3)
+        self.assertTrue(all(p['transparency_score'] is not None for p in listed))
+
+    def test_generation_copy_belongs_to_its_database(self):
+        """Test that the generation lives in the database and a copy from another database file is ignored."""
+        db_manager.bump_data_generation()
+        state = db_manager.get_data_state()
+        self.assertEqual(state['generation'], 1)
+        self.assertEqual(len(state['db_id']), 16)
+
+        path = os.path.splitext(self.db_path)[0] + '.generation.json'
+        with open(path) as f:
+            copy = json.load(f)
+        with open(path, 'w') as f:
+            json.dump({**copy, 'generation': 7, 'db_id': 'other', 'db_file': [0, 0]}, f)
+        self.assertEqual(db_manager.get_data_state(), state)
+
+        os.remove(path)
+        self.assertEqual(db_manager.get_data_generation(), (1, state['updated_at']))
+        self.assertTrue(os.path.exists(path))
+
+    def test_snapshot_is_read_only(self):
+        """Test that snapshot connections cannot write."""
+        db_manager.publish_snapshot()
+        conn = db_manager.get_read_connection()
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO locations (id) VALUES ('x')")
+        conn.close()
+
+class TestMemoryBackend(TempDatabaseTestCase):
+
+    def extra_patches(self):
+        return [patch('db_manager.DB_BACKEND', 'memory')]
+
+    def test_sync_pipeline_runs_in_memory(self):
+        """Test that a batched sync and scoring run against the memory backend without a file."""
+        import sync_orchestrator
+        projects = [{'id': f'p{i}', 'title': f'Projeto {i}', 'documents': [{'type': 'signedContract'}],
+                     'locations': [{'region': ''}, {'region': 'Nampula '}],
+                     'endDate': {'_seconds': 1767139200, '_nanoseconds': 0}}
+                    for i in range(5)]
+
+        counts = sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(projects), chunk_size=2)
+        self.assertEqual(counts, {'new': 5, 'changed': 0, 'unchanged': 0})
+        sync_orchestrator.process_all_projects(parallel=False, source='documents')
+
+        projects_by_id = {p['project_id']: p for p in data_persistence.get_all_projects()}
+        self.assertEqual(len(projects_by_id), 5)
+        summary = projects_by_id['p0']
+        self.assertIsNotNone(summary['transparency_score'])
+        self.assertEqual((summary['region'], summary['deadline']), ('Nampula', '2025-12-31T00:00:00Z'))
+        self.assertEqual((summary['document_count'], summary['critical_document_count']), (1, 1))
+        self.assertFalse(os.path.exists(self.db_path))
+
+    def test_full_sync_writes_no_files(self):
+        """Test that a full sync, scoring and snapshot publishing leave the working directory empty."""
+        import sync_orchestrator
+        projects = [{'id': f'p{i}', 'title': f'Projeto {i}', 'documents': [{'type': 'signedContract'}]}
+                    for i in range(5)]
+        locations = [{'id': 'l1', 'name': 'Nampula', 'region': 'Norte', 'country': 'MZ'}]
+        work_dir = os.path.join(self.tmp_dir, 'work')
+        os.makedirs(work_dir)
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            # A name of its own, so this in-memory database is not shared with other tests
+            with patch('db_manager.DB_NAME', 'bench.db'), patch('response_bodies.RESPONSE_BODY_DIR', 'bodies'), \
+                    patch('db_manager.DB_SNAPSHOT_DIR', 'snapshots'), patch('db_manager.DB_READ_SNAPSHOTS', True), \
+                    patch('api_fetcher.fetch_locations', return_value=locations), \
+                    patch('api_fetcher.fetch_public_projects', return_value=projects):
+                db_manager.initialize_db()
+                counts = sync_orchestrator.run_full_sync(batched=True, chunk_size=2, streaming=False,
+                                                         async_fetch=False, parallel_scoring=False,
+                                                         scoring_source='documents')
+                self.assertEqual(counts['new'], 5)
+                self.assertEqual(len(data_persistence.get_all_projects()), 5)
+                self.assertEqual(len(data_persistence.get_all_locations()), 1)
+                self.assertGreater(db_manager.get_data_generation()[0], 0)
+                self.assertIsNone(db_manager.get_current_snapshot())
+                db_manager.close_connections()
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(os.listdir(work_dir), [])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['work'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import api_fetcher
+from http_client import FetcherClient
+
+PAYLOAD = json.dumps({'projects': [{'id': 'p1'}, {'id': 'p2'}], 'total': 2}).encode('utf-8')
+
+class _Handler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    statuses = []
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.statuses.append(200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+class TestFetcherClient(unittest.TestCase):
+
+    def setUp(self):
+        _Handler.statuses = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.cache_dir = tempfile.mkdtemp()
+        self.client = FetcherClient(cache_dir=self.cache_dir, max_retries=0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.session.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_etag_revalidation(self):
+        """Test that a 200 with an ETag is cached and the following 304 is served from the cache."""
+        url = f"{self.base_url}/getPublicProjects"
+        self.assertEqual(self.client.get_json(url), json.loads(PAYLOAD))
+        self.assertFalse(self.client.last_from_cache)
+        self.assertEqual(self.client.get_json(url), json.loads(PAYLOAD))
+        self.assertTrue(self.client.last_from_cache)
+        self.assertEqual(_Handler.statuses, [200, 304])
+
+    def test_no_cache_dir_caches_nothing(self):
+        """Test that a client without a cache directory never revalidates or writes cache files."""
+        client = FetcherClient(cache_dir=None, max_retries=0)
+        url = f"{self.base_url}/getPublicProjects"
+        self.assertEqual(client.get_json(url), json.loads(PAYLOAD))
+        self.assertEqual(client.get_json(url), json.loads(PAYLOAD))
+        client.session.close()
+        self.assertEqual(_Handler.statuses, [200, 200])
+        self.assertFalse(client.last_from_cache)
+
+    def test_streamed_body_is_cached(self):
+        """Test that streaming the projects caches the body even though parsing stops at the array end."""
+        with patch('api_fetcher.client', self.client), patch('api_fetcher.BASE_URL', self.base_url), \
+                patch('api_fetcher.USE_MOCK_DATA', False):
+            first = list(api_fetcher.stream_public_projects(raise_errors=True))
+            second = list(api_fetcher.stream_public_projects(raise_errors=True))
+        self.assertEqual(first, [{'id': 'p1'}, {'id': 'p2'}])
+        self.assertEqual(second, first)
+        self.assertTrue(self.client.last_from_cache)
+        self.assertEqual(_Handler.statuses, [200, 304])
+
+if __name__ == '__main__':
+    unittest.main()
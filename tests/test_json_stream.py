@@ -0,0 +1,49 @@
+import json
+import unittest
+import json_stream
+
+class TestJsonStream(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = {
+            'meta': {'projects': ['nested, not the target']},
+            'note': 'contains "projects": [1] inside a string',
+            'projects': [
+                {'id': 'p1', 'title': 'Estrada N1 ] } [ { , :', 'implementation': {'documents': [{'type': 'progressReport'}]}},
+                {'id': 'p2', 'title': 'Ponte \\ "Maputo"'},
+                1500.25,
+                None
+            ],
+            'after': [1, 2]
+        }
+        self.data = json.dumps(self.payload, ensure_ascii=False).encode('utf-8')
+
+    def test_whole_payload(self):
+        """Test that a payload delivered in one chunk yields every project."""
+        items = list(json_stream.iter_array_items([self.data], 'projects'))
+        self.assertEqual(items, self.payload['projects'])
+
+    def test_every_split_point(self):
+        """Test that chunk boundaries anywhere (even inside strings and numbers) do not matter."""
+        for cut in range(1, len(self.data)):
+            chunks = [self.data[:cut], self.data[cut:]]
+            items = list(json_stream.iter_array_items(chunks, 'projects'))
+            self.assertEqual(items, self.payload['projects'], f"split at byte {cut}")
+
+    def test_single_byte_chunks(self):
+        """Test that the parser works when bytes arrive one at a time."""
+        chunks = [self.data[i:i + 1] for i in range(len(self.data))]
+        items = list(json_stream.iter_array_items(chunks, 'projects'))
+        self.assertEqual(items, self.payload['projects'])
+
+    def test_missing_key(self):
+        """Test that a payload without the key yields nothing."""
+        self.assertEqual(list(json_stream.iter_array_items([b'{"total": 0}'], 'projects')), [])
+
+    def test_truncated_payload(self):
+        """Test that a response cut off mid-array raises instead of silently ending."""
+        with self.assertRaises(ValueError):
+            list(json_stream.iter_array_items([b'{"projects": [{"id": "p1"}, {"id": '], 'projects'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from unittest.mock import patch
+import db_manager
+import query_stats
+from db_test_case import TempDatabaseTestCase
+
+class TestQueryStats(TempDatabaseTestCase):
+
+    def extra_patches(self):
+        return [patch('query_stats.DB_QUERY_STATS', True), patch('query_stats.DB_SLOW_QUERY_MS', 0.0)]
+
+    def setUp(self):
+        super().setUp()
+        query_stats.query_stats.reset()
+
+    def test_normalize_sql(self):
+        """Test that literals and IN lists of any length normalize to the same shape."""
+        self.assertEqual(
+            query_stats.normalize_sql("SELECT *\n  FROM projects WHERE id IN (?, ?, ?) AND score > 5 AND status = 'x'"),
+            query_stats.normalize_sql("SELECT * FROM projects WHERE id IN (?,?) AND score > 7 AND status = 'y'"))
+
+    def test_records_latency_rows_and_slow_plans(self):
+        """Test that statements are counted with their rows and slow ones keep a query plan."""
+        conn = db_manager.get_db_connection()
+        conn.executemany("INSERT INTO locations (id, name) VALUES (?, ?)", [('a', 'A'), ('b', 'B'), ('c', 'C')])
+        conn.commit()
+        for location_id in ('a', 'b'):
+            conn.execute('SELECT * FROM locations WHERE id = ?', (location_id,)).fetchall()
+        conn.close()
+
+        dump = query_stats.query_stats.dump()
+        by_sql = {s['sql']: s for s in dump['statements']}
+        self.assertEqual(by_sql['INSERT INTO locations (id, name) VALUES (?, ?)']['rows'], 3)
+        select = by_sql['SELECT * FROM locations WHERE id = ?']
+        self.assertEqual((select['calls'], select['rows']), (2, 2))
+        self.assertEqual(sum(select['histogram'].values()), 2)
+
+        plans = [q['plan'] for q in dump['slow_queries'] if q['sql'] == 'SELECT * FROM locations WHERE id = ?']
+        self.assertTrue(any('sqlite_autoindex_locations_1' in ' '.join(plan) for plan in plans))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import json
+import unittest
+import raw_codec
+
+class TestRawCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.project = {
+            'id': 'p1',
+            'title': 'Reabilitação da Estrada N1',
+            'status': 'implementation',
+            'implementationPeriod': {'startDate': '2023-01-01', 'endDate': '2025-06-30'},
+            'implementation': {'documents': [{'type': 'progressReport', 'url': 'https://example.org/r.pdf'}] * 40},
+            'documents': [{'type': 'signedContract', 'title': 'Contrato nº %d' % i} for i in range(40)]
+        }
+
+    def test_round_trip(self):
+        """Test that the compressed format decodes back to the same project and is smaller."""
+        blob = raw_codec.encode(self.project, fmt='zlib')
+        self.assertTrue(raw_codec.is_sectioned(blob))
+        self.assertLess(len(blob), len(json.dumps(self.project).encode('utf-8')))
+        self.assertEqual(raw_codec.decode(blob), self.project)
+
+    def test_decode_sections(self):
+        """Test that individual sections can be read from both formats."""
+        for fmt in ('zlib', 'json'):
+            value = raw_codec.encode(self.project, fmt=fmt)
+            sections = raw_codec.decode_sections(value, ['implementationPeriod', 'title', 'notThere'])
+            self.assertEqual(sections, {
+                'implementationPeriod': self.project['implementationPeriod'],
+                'title': self.project['title']
+            })
+
+    def test_legacy_text_rows(self):
+        """Test that rows written before compression (plain JSON text) still decode."""
+        legacy = json.dumps(self.project, indent=2)
+        self.assertEqual(raw_codec.decode(legacy), self.project)
+        self.assertEqual(raw_codec.section_names(legacy), list(self.project))
+
+    def test_tiny_payload_stays_text(self):
+        """Test that payloads too small to benefit from compression are kept as JSON text."""
+        value = raw_codec.encode({'id': 'p2'}, fmt='zlib')
+        self.assertIsInstance(value, str)
+        self.assertEqual(raw_codec.decode(value), {'id': 'p2'})
+
+if __name__ == '__main__':
+    unittest.main()
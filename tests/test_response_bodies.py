@@ -0,0 +1,49 @@
+import os
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+import db_manager
+import data_persistence
+import response_bodies
+import sync_orchestrator
+from db_test_case import TempDatabaseTestCase
+
+class TestResponseBodies(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.projects = [{'id': f'p{i}', 'title': f'Projeto nº {i}', 'documents': [{'type': 'signedContract'}]}
+                         for i in range(3)]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects))
+
+    def test_project_bodies_follow_sync_and_scoring(self):
+        """Test that scoring writes bodies matching the decoded details and a payload change drops them."""
+        self.assertIsNone(response_bodies.get_project_body('p0'))
+        sync_orchestrator.process_all_projects(parallel=False, source='documents')
+
+        body, body_gzip = response_bodies.get_project_body('p0')
+        self.assertEqual(json.loads(body), data_persistence.get_raw_project_data('p0'))
+        self.assertEqual(gzip.decompress(body_gzip), body)
+
+        self.projects[0]['title'] = 'Projeto alterado'
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects[:1]))
+        self.assertIsNone(response_bodies.get_project_body('p0'))
+        self.assertIsNotNone(response_bodies.get_project_body('p1'))
+
+    def test_list_bodies_per_generation(self):
+        """Test that list bodies match the streamed rows and only older generations are pruned."""
+        with patch('response_bodies.RESPONSE_BODY_KEEP', 1):
+            sync_orchestrator.process_all_projects(parallel=False, source='documents')
+            first = response_bodies.get_list_body_path('projects')
+            with open(first, 'rb') as f:
+                self.assertEqual(json.loads(f.read()), data_persistence.get_all_projects())
+
+            db_manager.bump_data_generation()
+            self.assertIsNone(response_bodies.get_list_body_path('projects'))
+            response_bodies.publish_list_bodies()
+            self.assertIsNotNone(response_bodies.get_list_body_path('locations', encoding='gzip'))
+            self.assertFalse(os.path.exists(first))
+
+if __name__ == '__main__':
+    unittest.main()
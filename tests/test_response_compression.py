@@ -0,0 +1,41 @@
+import gzip
+import unittest
+from unittest.mock import patch
+from werkzeug.http import parse_accept_header
+import response_compression
+
+class TestResponseCompression(unittest.TestCase):
+
+    def test_negotiate(self):
+        """Test that the best supported coding is picked, brotli only when it is installed."""
+        with patch('response_compression.brotli', None):
+            self.assertEqual(response_compression.negotiate(parse_accept_header('gzip, deflate, br')), 'gzip')
+            self.assertIsNone(response_compression.negotiate(parse_accept_header('br, identity')))
+        self.assertIsNone(response_compression.negotiate(parse_accept_header('gzip;q=0')))
+        self.assertIsNone(response_compression.negotiate(parse_accept_header('')))
+
+    def test_streamed_gzip_matches_body(self):
+        """Test that chunk by chunk compression decodes to the concatenated chunks."""
+        chunks = [b'[', b'{"a":1}', b',{"b":2}' * 500, b']']
+        compressed = b''.join(response_compression.compress_chunks(iter(chunks), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), b''.join(chunks))
+        self.assertEqual(gzip.decompress(response_compression.compress(b''.join(chunks), 'gzip')), b''.join(chunks))
+
+    def test_cache_is_per_generation_and_bounded(self):
+        """Test that a newer generation drops older entries and the byte limit evicts the oldest."""
+        cache = response_compression.CompressionCache(max_bytes=10)
+        cache.put(1, 'a', b'1234', 'application/json')
+        cache.put(1, 'b', b'5678', 'application/json')
+        self.assertEqual(cache.get(1, 'a'), (b'1234', 'application/json'))
+        cache.put(1, 'c', b'90ab', 'application/json')
+        self.assertIsNone(cache.get(1, 'b'))
+        self.assertIsNotNone(cache.get(1, 'a'))
+
+        cache.put(2, 'a', b'cd', 'application/json')
+        self.assertIsNone(cache.get(1, 'a'))
+        self.assertIsNone(cache.get(2, 'c'))
+        cache.put(1, 'd', b'ef', 'application/json')
+        self.assertIsNone(cache.get(1, 'd'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 import unittest
 from unittest.mock import patch
+import db_manager
+import data_persistence
 import score_calculator
+from constants import CRITICAL_DOCS_MAP, CRITICAL_DOC_BITS
+from db_test_case import TempDatabaseTestCase
 
 class TestScoreCalculator(unittest.TestCase):
 
@@ -54,5 +58,87 @@ class TestScoreCalculator(unittest.TestCase):
         self.assertEqual(result['alert_color'], 'YELLOW')
         self.assertIn('Contrato Assinado', result['missing_documents_list'])
 
+    def test_score_projects_batch(self):
+        """Test that the batch API accepts tuples, raw JSON rows and project dicts, in order."""
+        results = score_calculator.score_projects([
+            ('p_tuple', {'documents': [{'type': 'signedContract'}, {'type': 'progressReport'}]}),
+            {'project_id': 'p_row', 'data_raw': '{"implementation": {"documents": [{"type": "feasibilityStudy"}]}}'},
+            {'id': 'p_dict', 'documents': [{'type': 'signedContract'}, {'type': 'feasibilityStudy'},
+                                           {'type': 'progressReport'}, {'type': 'completionReport'}]}
+        ])
+
+        self.assertEqual([r['project_id'] for r in results], ['p_tuple', 'p_row', 'p_dict'])
+        # 0.35 + 0.25 = 0.6 -> 6
+        self.assertEqual(results[0]['transparency_score'], 6)
+        self.assertEqual(results[0]['missing_documents_list'], ['Estudo de Viabilidade', 'Relatório de Conclusão'])
+        # 0.2 -> 2
+        self.assertEqual(results[1]['transparency_score'], 2)
+        self.assertEqual(results[1]['alert_color'], 'RED')
+        self.assertEqual(results[2]['transparency_score'], 10)
+
+    def test_every_document_combination(self):
+        """Test the precomputed score table against the weights for every combination of documents."""
+        doc_keys = list(CRITICAL_DOCS_MAP)
+        projects = []
+        for mask in range(1 << len(doc_keys)):
+            docs = [{'type': key} for i, key in enumerate(doc_keys) if mask & (1 << i)]
+            projects.append((f'p{mask}', {'completion': {'documents': docs}}))
+
+        for mask, result in enumerate(score_calculator.score_projects(projects)):
+            present = [key for i, key in enumerate(doc_keys) if mask & (1 << i)]
+            weight = 0.0
+            for key in doc_keys:
+                if key in present:
+                    weight += CRITICAL_DOCS_MAP[key]['weight']
+            missing = [CRITICAL_DOCS_MAP[key]['name'] for key in doc_keys if key not in present]
+
+            self.assertEqual(result['transparency_score'], round(weight * 10))
+            self.assertEqual(result['missing_documents_list'], missing)
+
+class TestScoreFromDocuments(TempDatabaseTestCase):
+
+    def _store(self, project_id, data):
+        """Stores a project and its documents the way the sync does."""
+        documents = list(data.get('documents', []))
+        for phase in score_calculator.PHASES:
+            documents.extend(data.get(phase, {}).get('documents', []))
+        data_persistence.insert_or_update_project(project_id, data)
+        data_persistence.insert_document_status(project_id, documents)
+
+    def test_matches_raw_scoring(self):
+        """Test that the grouped SQL path gives the same scores and missing names as data_raw."""
+        projects = {
+            'p_none': {'title': 'Sem documentos'},
+            'p_dupes': {'documents': [{'type': 'signedContract'}, {'type': 'signedContract', 'url': 'x'}]},
+            'p_phases': {
+                'preparation': {'documents': [{'type': 'feasibilityStudy'}, {'type': 'budget'}]},
+                'implementation': {'documents': [{'type': 'progressReport'}]},
+                'completion': {'documents': [{'type': 'completionReport'}]}
+            },
+            'p_all': {'documents': [{'type': key} for key in CRITICAL_DOCS_MAP]}
+        }
+        for project_id, data in projects.items():
+            self._store(project_id, data)
+
+        conn = db_manager.get_db_connection()
+        from_documents = {r['project_id']: r for r in score_calculator.score_from_documents(conn)}
+        conn.close()
+
+        self.assertEqual(set(from_documents), set(projects))
+        for project_id in projects:
+            self.assertEqual(from_documents[project_id], score_calculator.calculate_transparency_score(project_id))
+
+    def test_uses_covering_index(self):
+        """Test that the grouped document query scoring runs is answered from the covering index."""
+        conn = db_manager.get_db_connection()
+        for unprocessed_only in (False, True):
+            sql, params = data_persistence.document_type_masks_query(CRITICAL_DOC_BITS, unprocessed_only)
+            plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+            steps = [row['detail'] for row in plan if 'project_documents' in row['detail']]
+            self.assertTrue(steps)
+            for step in steps:
+                self.assertIn('COVERING INDEX idx_project_documents_project_type', step)
+        conn.close()
+
 if __name__ == '__main__':
     unittest.main()
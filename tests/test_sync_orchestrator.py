@@ -0,0 +1,164 @@
+import json
+import unittest
+from unittest.mock import patch
+import db_manager
+import response_bodies
+import sync_orchestrator
+from db_test_case import TempDatabaseTestCase
+
+DOC_TYPES = ['signedContract', 'feasibilityStudy', 'progressReport', 'completionReport', 'other']
+
+class TestParallelScoring(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        projects = []
+        for i in range(30):
+            project = {'id': f'p{i:02d}', 'title': f'Projeto {i}',
+                       'documents': [{'type': t} for j, t in enumerate(DOC_TYPES) if i >> j & 1]}
+            if i % 4 == 0:
+                project['completion'] = {'documents': [{'type': 'completionReport'}]}
+            projects.append(project)
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(projects))
+
+    def _scores(self):
+        conn = db_manager.get_db_connection()
+        rows = conn.execute('''
+            SELECT project_id, transparency_score, alert_color, simple_message, is_processed
+            FROM projects ORDER BY project_id
+        ''').fetchall()
+        conn.close()
+        return [tuple(row) for row in rows]
+
+    def test_parallel_matches_sequential(self):
+        """Test that scoring on a process pool stores exactly what sequential scoring stores."""
+        sync_orchestrator.process_all_projects(parallel=False, source='raw')
+        sequential = self._scores()
+        self.assertTrue(all(row[1] is not None and row[4] for row in sequential))
+
+        db_manager.reset_processed_flags()
+        conn = db_manager.get_db_connection()
+        conn.execute('UPDATE projects SET transparency_score = NULL, alert_color = NULL, simple_message = NULL')
+        conn.commit()
+        conn.close()
+        sync_orchestrator.process_all_projects(parallel=True, workers=2, chunk_size=7, source='raw')
+        self.assertEqual(self._scores(), sequential)
+
+class TestUnchangedProjects(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.projects = [{'id': f'p{i}', 'title': f'Projeto {i}'} for i in range(4)]
+        sync_orchestrator.sync_projects_batched(sync_orchestrator.iter_valid_projects(self.projects))
+        sync_orchestrator.process_all_projects(parallel=False, source='documents')
+
+    def _backdate(self):
+        conn = db_manager.get_db_connection()
+        with conn:
+            conn.execute("UPDATE projects SET last_sync = '2020-01-01 00:00:00'")
+            conn.execute("UPDATE project_summary SET last_sync = '2020-01-01 00:00:00'")
+        conn.close()
+
+    def _state(self):
+        conn = db_manager.get_db_connection()
+        rows = conn.execute('''
+            SELECT p.project_id, p.last_sync, s.last_sync AS summary_last_sync, p.is_processed, p.data_raw
+            FROM projects p JOIN project_summary s ON s.project_id = p.project_id ORDER BY p.project_id
+        ''').fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def test_unchanged_projects_get_last_sync(self):
+        """Test that resyncing unchanged projects moves last_sync but rewrites and rescores nothing."""
+        for sync in (lambda: sync_orchestrator.sync_projects_batched(
+                         sync_orchestrator.iter_valid_projects(self.projects), chunk_size=3),
+                     lambda: [sync_orchestrator.sync_project(p['id'], p) for p in self.projects]):
+            self._backdate()
+            before = self._state()
+            sync()
+            after = self._state()
+            for old, new in zip(before, after):
+                self.assertGreater(str(new['last_sync']), '2020-01-01 00:00:00')
+                self.assertEqual(str(new['summary_last_sync']), str(new['last_sync']))
+                self.assertEqual((new['is_processed'], new['data_raw']), (old['is_processed'], old['data_raw']))
+
+class InterruptedFetch(Exception):
+    pass
+
+class TestResumableSync(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.projects = [{'id': f'p{i:02d}', 'title': f'Projeto {i}'} for i in range(20)]
+        self.synced_ids = []
+        self.fail_after = None
+        sync_chunk = sync_orchestrator.sync_chunk
+
+        def recording_sync_chunk(conn, chunk, *args):
+            sync_chunk(conn, chunk, *args)
+            self.synced_ids.extend(project_id for project_id, _ in chunk)
+
+        self.patches += [patch('api_fetcher.fetch_locations', return_value=[]),
+                         patch('api_fetcher.stream_public_projects', side_effect=self.fetch),
+                         patch('sync_orchestrator.sync_chunk', side_effect=recording_sync_chunk)]
+        for p in self.patches[-3:]:
+            p.start()
+
+    def fetch(self, raise_errors=False):
+        """Yields the projects, failing after fail_after of them like a dropped download."""
+        for i, project in enumerate(self.projects):
+            if i == self.fail_after:
+                raise InterruptedFetch()
+            yield project
+
+    def _runs(self):
+        conn = db_manager.get_db_connection()
+        rows = conn.execute('SELECT status, projects_done, resume_count FROM sync_runs ORDER BY run_id').fetchall()
+        conn.close()
+        return [tuple(row) for row in rows]
+
+    def test_resume_skips_checkpointed_projects(self):
+        """Test that a run failing mid-chunk is resumed without resyncing its committed chunks."""
+        self.fail_after = 12
+        with self.assertRaises(InterruptedFetch):
+            sync_orchestrator.run_full_sync(batched=True, chunk_size=5, streaming=True, async_fetch=False)
+        # Two chunks committed; the third was cut off before it was written
+        self.assertEqual(self.synced_ids, [f'p{i:02d}' for i in range(10)])
+        self.assertEqual(self._runs(), [('failed', 10, 0)])
+
+        self.synced_ids.clear()
+        self.fail_after = None
+        counts = sync_orchestrator.run_full_sync(batched=True, chunk_size=5, streaming=True, async_fetch=False)
+        self.assertEqual(counts, {'new': 10, 'changed': 0, 'unchanged': 0, 'resumed': 10})
+        self.assertEqual(self.synced_ids, [f'p{i:02d}' for i in range(10, 20)])
+        self.assertEqual(self._runs(), [('completed', 20, 1)])
+
+    def test_fresh_restarts_interrupted_run(self):
+        """Test that fresh abandons the interrupted run and syncs every project again."""
+        self.fail_after = 12
+        with self.assertRaises(InterruptedFetch):
+            sync_orchestrator.run_full_sync(batched=True, chunk_size=5, streaming=True, async_fetch=False)
+
+        self.synced_ids.clear()
+        self.fail_after = None
+        counts = sync_orchestrator.run_full_sync(batched=True, chunk_size=5, streaming=True, async_fetch=False,
+                                                 fresh=True)
+        self.assertEqual(counts, {'new': 10, 'changed': 0, 'unchanged': 10, 'resumed': 0})
+        self.assertEqual(self.synced_ids, [f'p{i:02d}' for i in range(20)])
+        self.assertEqual(self._runs(), [('abandoned', 10, 0), ('completed', 20, 0)])
+
+        conn = db_manager.get_db_connection()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM sync_checkpoints').fetchone()[0], 0)
+        conn.close()
+
+    def test_sync_publishes_list_bodies(self):
+        """Test that synced projects are listed under a new generation before scoring runs."""
+        with patch('sync_orchestrator.process_all_projects'):
+            sync_orchestrator.run_full_sync(batched=True, chunk_size=5, streaming=True, async_fetch=False)
+        self.assertEqual(db_manager.get_data_generation()[0], 1)
+        with open(response_bodies.get_list_body_path('projects')) as f:
+            listed = json.load(f)
+        self.assertEqual(sorted(project['project_id'] for project in listed), [p['id'] for p in self.projects])
+
+if __name__ == '__main__':
+    unittest.main()